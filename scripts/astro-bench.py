@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+AstroMediaServer Setup Benchmark
+Times compose generation and the setup pipeline across stack combinations
+against fake docker and whiptail commands and a simulated Engine API, so
+startup regressions show up without touching real containers.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import http.server
+import importlib.util
+import io
+import itertools
+import json
+import os
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+SETUP_SCRIPT = Path(__file__).resolve().parent / "astro-setup.py"
+
+# Simulated registry content per image
+LAYERS_PER_IMAGE = 3
+LAYER_MB = 40
+CHUNKS_PER_LAYER = 8
+
+# Phases faster than this are too noisy to flag as regressions
+NOISE_FLOOR_MS = 50
+
+# Download setups as (enable_torrents, enable_usenet, downloader)
+DOWNLOAD_MODES = [
+    (True, False, "qbittorrent"),
+    (False, True, "sabnzbd"),
+    (False, True, "nzbget"),
+    (True, True, "sabnzbd"),
+]
+
+# Accepts every command and creates nothing
+FAKE_DOCKER = """#!/bin/sh
+case "$1" in
+    inspect) echo "[]" ;;
+    load) cat > /dev/null ;;
+    compose) sleep {compose_delay} ;;
+esac
+exit 0
+"""
+
+# Unit files land in the sandbox, so there is nothing to reload
+FAKE_SYSTEMCTL = """#!/bin/sh
+exit 0
+"""
+
+# Answers every dialog with its default, like pressing Enter throughout
+FAKE_WHIPTAIL = """#!{python}
+import sys
+args = sys.argv[1:]
+for i, arg in enumerate(args):
+    if arg == "--menu":
+        sys.stderr.write(args[i + 5])
+    elif arg == "--checklist":
+        items = args[i + 5:]
+        chosen = [items[j] for j in range(0, len(items) - 2, 3) if items[j + 2] == "ON"]
+        sys.stderr.write(" ".join('"%s"' % tag for tag in chosen))
+    elif arg == "--inputbox" and len(args) > i + 4:
+        sys.stderr.write(args[i + 4])
+    elif arg == "--gauge":
+        sys.stdin.read()
+"""
+
+
+class FakeEngine(http.server.BaseHTTPRequestHandler):
+    """Streams Engine API pull progress at a fixed simulated bandwidth."""
+
+    protocol_version = "HTTP/1.1"
+    mb_per_second = 200.0
+
+    def address_string(self):
+        return "docker.sock"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _chunk(self, event: dict) -> None:
+        data = json.dumps(event).encode() + b"\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._chunk({"id": "latest", "status": "Pulling from simulated"})
+        total = LAYER_MB << 20
+        step = total // CHUNKS_PER_LAYER
+        delay = LAYER_MB / CHUNKS_PER_LAYER / self.mb_per_second
+        for n in range(LAYERS_PER_IMAGE):
+            layer = hashlib.sha256(f"{self.path}:{n}".encode()).hexdigest()[:12]
+            for current in range(step, total + 1, step):
+                time.sleep(delay)
+                self._chunk({"id": layer, "status": "Downloading",
+                             "progressDetail": {"current": current, "total": total}})
+            self._chunk({"id": layer, "status": "Pull complete"})
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class _UnixEngineServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def prepare_sandbox(root: Path, compose_delay: float) -> None:
+    """Create fake commands and point astro-setup.py at the sandbox.
+
+    Must run before the setup module is imported, since its path
+    constants are read from the environment at import time.
+    """
+    bin_dir = root / "bin"
+    bin_dir.mkdir()
+    for name, script in [
+        ("docker", FAKE_DOCKER.format(compose_delay=compose_delay)),
+        ("whiptail", FAKE_WHIPTAIL.format(python=sys.executable)),
+        ("systemctl", FAKE_SYSTEMCTL),
+    ]:
+        path = bin_dir / name
+        path.write_text(script)
+        path.chmod(0o755)
+
+    (root / "astro").mkdir()
+    (root / "systemd").mkdir()
+    os.environ.update({
+        "PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+        "ASTRO_ROOT": str(root / "astro"),
+        "DOCKER_HOST": f"unix://{root / 'docker.sock'}",
+        "ASTRO_TTY": os.devnull,
+        "ASTRO_SYSTEMD_DIR": str(root / "systemd"),
+    })
+
+
+def load_setup_module():
+    """Import astro-setup.py, which is not importable by name."""
+    spec = importlib.util.spec_from_file_location("astro_setup", SETUP_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def stack_combinations(astro) -> list[dict]:
+    """Return answers for every media/request/download/gateway/dashboard/layout mix."""
+    choices = astro.UserConfig.CHOICES
+    combos = []
+    for media, requests, (torrents, usenet, downloader), gateway, dashboard, layout in itertools.product(
+        choices["media_server"], choices["request_manager"], DOWNLOAD_MODES,
+        choices["gateway"], choices["dashboard"], choices["data_layout"],
+    ):
+        combos.append({
+            "media_server": media,
+            "request_manager": requests,
+            "enable_torrents": torrents,
+            "enable_usenet": usenet,
+            "downloader": downloader,
+            "gateway": gateway,
+            "dashboard": dashboard,
+            "data_layout": layout,
+            "puid": str(os.getuid()),
+            "pgid": str(os.getgid()),
+            "hw_accel": "none",
+        })
+    return combos
+
+
+def reset_install(astro) -> None:
+    """Empty the sandboxed install directory between runs."""
+    for child in astro.ASTRO_DIR.iterdir():
+        if child.is_dir():
+            shutil.rmtree(child)
+        else:
+            child.unlink()
+
+
+def bench_generation(astro, combos: list[dict], repeat: int) -> list[dict]:
+    """Time ComposeGenerator.generate plus the YAML dump for every combination."""
+    resources = astro.HostResources(cpus=8, memory_mb=16384)
+    probe = astro.HardwareProbe()
+    samples = []
+    for combo in combos:
+        config = astro.UserConfig.from_dict(combo)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            compose = astro.ComposeGenerator(config, resources, probe).generate()
+            generated = time.perf_counter()
+            astro.yaml.dump(compose, default_flow_style=False, sort_keys=False)
+            dumped = time.perf_counter()
+            samples.append({"generate": generated - start, "yaml_dump": dumped - generated})
+    return samples
+
+
+def bench_pipeline(astro, combos: list[dict], scratch: Path) -> list[dict]:
+    """Run the headless setup end to end for each combination, collecting phase totals."""
+    samples = []
+    for n, combo in enumerate(combos, 1):
+        reset_install(astro)
+        answers = scratch / "answers.yaml"
+        answers.write_text(astro.yaml.dump(combo))
+        output = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(io.StringIO()):
+            code = astro.SetupWizard(ui=astro.HeadlessUI()).run_headless(answers)
+        elapsed = time.perf_counter() - start
+        result = json.loads(output.getvalue())
+        if code != 0:
+            raise RuntimeError(f"headless setup failed for {combo}: {result['errors']}")
+        samples.append({**result["phase_seconds"], "total": elapsed})
+        print(f"pipeline {n}/{len(combos)}: {elapsed:.2f}s", file=sys.stderr)
+    return samples
+
+
+def bench_wizard(astro, runs: int) -> list[dict]:
+    """Drive the interactive wizard through the fake whiptail, accepting defaults."""
+    samples = []
+    for _ in range(runs):
+        reset_install(astro)
+        wizard = astro.SetupWizard()
+        wizard.config.puid, wizard.config.pgid = str(os.getuid()), str(os.getgid())
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            code = wizard.run()
+        if code != 0:
+            raise RuntimeError("interactive wizard run failed")
+        samples.append({**wizard.timer.totals(), "total": time.perf_counter() - start})
+    return samples
+
+
+def summarize(samples: list[dict]) -> dict:
+    """Return per-phase run counts and median/p95/max in milliseconds."""
+    phases: dict[str, list[float]] = {}
+    for sample in samples:
+        for phase, seconds in sample.items():
+            phases.setdefault(phase, []).append(seconds * 1000)
+
+    summary = {}
+    for phase, values in sorted(phases.items()):
+        values.sort()
+        summary[phase] = {
+            "runs": len(values),
+            "median_ms": round(values[len(values) // 2], 2),
+            "p95_ms": round(values[int(0.95 * (len(values) - 1))], 2),
+            "max_ms": round(values[-1], 2),
+        }
+    return summary
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Return phases whose median grew beyond the tolerance over a baseline run."""
+    found = []
+    for suite, phases in results.items():
+        for phase, stats in phases.items():
+            old = baseline.get(suite, {}).get(phase)
+            if not old or old["median_ms"] < NOISE_FLOOR_MS:
+                continue
+            if stats["median_ms"] > old["median_ms"] * (1 + tolerance):
+                found.append(f"{suite}.{phase}: {old['median_ms']}ms -> {stats['median_ms']}ms")
+    return found
+
+
+def main():
+    """Entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark compose generation and the setup pipeline")
+    parser.add_argument("--repeat", type=int, default=5, help="generation runs per combination")
+    parser.add_argument("--pipeline-runs", type=int, default=12,
+                        help="combinations to run end to end, spread evenly (0 for all)")
+    parser.add_argument("--wizard-runs", type=int, default=1, help="interactive wizard runs")
+    parser.add_argument("--pull-mbps", type=float, default=200, help="simulated registry bandwidth in MB/s")
+    parser.add_argument("--compose-delay", type=float, default=0.5, help="seconds the fake `docker compose up` takes")
+    parser.add_argument("--output", type=Path, help="write results as JSON to this file")
+    parser.add_argument("--baseline", type=Path, help="earlier --output file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed median slowdown over the baseline, as a fraction")
+    args = parser.parse_args()
+
+    scratch = Path(tempfile.mkdtemp(prefix="astro-bench-"))
+    try:
+        prepare_sandbox(scratch, args.compose_delay)
+        # Nothing listens on the service ports, so skip the readiness wait
+        os.environ["ASTRO_READY_TIMEOUT"] = "0"
+        astro = load_setup_module()
+
+        FakeEngine.mb_per_second = args.pull_mbps
+        engine = _UnixEngineServer(astro.DOCKER_SOCKET, FakeEngine)
+        threading.Thread(target=engine.serve_forever, daemon=True).start()
+
+        combos = stack_combinations(astro)
+        stride = max(1, len(combos) // args.pipeline_runs) if args.pipeline_runs else 1
+        results = {
+            "generation": summarize(bench_generation(astro, combos, args.repeat)),
+            "pipeline": summarize(bench_pipeline(astro, combos[::stride][:args.pipeline_runs or None], scratch)),
+            "wizard": summarize(bench_wizard(astro, args.wizard_runs)) if args.wizard_runs else {},
+        }
+        engine.shutdown()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+    if args.baseline:
+        found = regressions(results, json.loads(args.baseline.read_text()), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
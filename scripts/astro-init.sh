@@ -9,6 +9,9 @@ set -euo pipefail
 ASTRO_DIR="/opt/astro"
 LOG_FILE="${ASTRO_DIR}/astro-init.log"
 SETUP_SCRIPT="${ASTRO_DIR}/astro-setup.py"
+IMAGE_BUNDLE="${ASTRO_DIR}/images/bundle.json"
+ANSWERS_FILE="${ASTRO_DIR}/answers.yaml"
+RESULT_FILE="${ASTRO_DIR}/setup-result.json"
 
 # Colors
 CYAN='\033[0;36m'
@@ -63,6 +66,11 @@ log() {
     esac
 }
 
+# Seconds elapsed since an earlier $EPOCHREALTIME reading
+elapsed_since() {
+    awk -v start="$1" -v end="$EPOCHREALTIME" 'BEGIN { printf "%.3f", end - start }'
+}
+
 # Wait for network connectivity
 wait_for_network() {
     log "INFO" "Waiting for network connectivity..."
@@ -70,6 +78,12 @@ wait_for_network() {
     local max_attempts=30
     local attempt=0
 
+    # Bundled images make the network optional, so don't stall air-gapped installs
+    if [ -f "$IMAGE_BUNDLE" ]; then
+        log "INFO" "Offline image bundle found, network is optional"
+        max_attempts=3
+    fi
+
     while [ $attempt -lt $max_attempts ]; do
         if ping -c 1 -W 2 8.8.8.8 &>/dev/null; then
             log "OK" "Network is available"
@@ -147,9 +161,12 @@ main() {
         exit 1
     fi
 
-    # Wait for services
+    # Wait for services, timing each wait for the setup trace
+    local started=$EPOCHREALTIME
     wait_for_network || true  # Continue even if network fails
+    local timings="wait_for_network=$(elapsed_since "$started")"
 
+    started=$EPOCHREALTIME
     if ! wait_for_docker; then
         log "ERROR" "Docker is not available. Please check the installation."
         echo ""
@@ -157,16 +174,27 @@ main() {
         read -r
         exit 1
     fi
+    export ASTRO_INIT_TIMINGS="${timings} wait_for_docker=$(elapsed_since "$started")"
 
     echo ""
-    log "INFO" "Starting setup wizard..."
-    sleep 2
-
-    # Launch the Python setup wizard
-    if python3 "$SETUP_SCRIPT"; then
-        log "OK" "Setup completed successfully"
+    if [ -f "$ANSWERS_FILE" ]; then
+        # Unattended provisioning: no prompts, JSON result for tooling
+        log "INFO" "Answers file found, running unattended setup..."
+        if python3 "$SETUP_SCRIPT" --config "$ANSWERS_FILE" > "$RESULT_FILE"; then
+            log "OK" "Unattended setup completed successfully (see ${RESULT_FILE})"
+        else
+            log "WARN" "Unattended setup failed (see ${RESULT_FILE})"
+        fi
     else
-        log "WARN" "Setup wizard exited with non-zero status"
+        log "INFO" "Starting setup wizard..."
+        sleep 2
+
+        # Launch the Python setup wizard
+        if python3 "$SETUP_SCRIPT"; then
+            log "OK" "Setup completed successfully"
+        else
+            log "WARN" "Setup wizard exited with non-zero status"
+        fi
     fi
 
     # Create completion marker
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+AstroMediaServer I/O Benchmark
+Measures media read latency under downloader write load, with and
+without the block-I/O policy from docker-compose.yml.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import uuid
+import yaml
+from pathlib import Path
+
+# Configuration paths
+ASTRO_DIR = Path("/opt/astro")
+MEDIA_DIR = ASTRO_DIR / "media"
+COMPOSE_FILE = ASTRO_DIR / "docker-compose.yml"
+
+BENCH_IMAGE = "python:3-alpine"
+BENCH_FILE = ".astro-iobench"
+
+# Random 4 KiB O_DIRECT reads, like a player seeking through a remux
+READER = """
+import json, mmap, os, random, sys, time
+fd = os.open(sys.argv[1], os.O_RDONLY | os.O_DIRECT)
+blocks = os.fstat(fd).st_size // 4096
+buf = mmap.mmap(-1, 4096)
+latencies = []
+end = time.monotonic() + float(sys.argv[2])
+while time.monotonic() < end:
+    offset = random.randrange(blocks) * 4096
+    start = time.perf_counter()
+    os.preadv(fd, [buf], offset)
+    latencies.append((time.perf_counter() - start) * 1000)
+print(json.dumps(latencies))
+"""
+
+# Sustained sequential writes, like a torrent or par2 repair
+WRITER = "while true; do dd if=/dev/zero of=/downloads/{name} bs=1M count=1024 oflag=direct 2>/dev/null; done"
+
+
+def load_policy() -> tuple[list[str], list[str]]:
+    """Return docker run flags for the media server and a downloader."""
+    with open(COMPOSE_FILE) as f:
+        services = yaml.safe_load(f)["services"]
+
+    def flags(names: list[str]) -> list[str]:
+        for name in names:
+            blkio = services.get(name, {}).get("blkio_config")
+            if not blkio:
+                continue
+            args = [f"--blkio-weight={blkio['weight']}"] if "weight" in blkio else []
+            for key in ("device_read_bps", "device_read_iops", "device_write_bps", "device_write_iops"):
+                flag = "--" + key.replace("_", "-")
+                for entry in blkio.get(key, []):
+                    args.append(f"{flag}={entry['path']}:{entry['rate']}")
+            return args
+        return []
+
+    return flags(["plex", "jellyfin", "emby"]), flags(["qbittorrent", "sabnzbd", "nzbget"])
+
+
+def create_test_file(path: Path, size_mb: int) -> None:
+    """Write a test file larger than any drive cache."""
+    if path.exists() and path.stat().st_size >= size_mb << 20:
+        return
+    chunk = os.urandom(8 << 20)
+    with open(path, "wb") as f:
+        for _ in range(size_mb // 8):
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def run_pass(reader_flags: list[str], writer_flags: list[str], download_dir: Path, seconds: int) -> list[float]:
+    """Run one reader pass against a concurrent writer, returning latencies in ms."""
+    writer_name = f"astro-iobench-writer-{uuid.uuid4().hex[:8]}"
+    subprocess.run(
+        ["docker", "run", "-d", "--rm", "--name", writer_name, *writer_flags,
+         "-v", f"{download_dir}:/downloads", BENCH_IMAGE,
+         "sh", "-c", WRITER.format(name=BENCH_FILE)],
+        check=True, stdout=subprocess.DEVNULL,
+    )
+    try:
+        result = subprocess.run(
+            ["docker", "run", "--rm", *reader_flags, "-v", f"{MEDIA_DIR}:/media:ro", BENCH_IMAGE,
+             "python3", "-c", READER, f"/media/{BENCH_FILE}", str(seconds)],
+            check=True, capture_output=True, text=True,
+        )
+        return json.loads(result.stdout)
+    finally:
+        subprocess.run(["docker", "rm", "-f", writer_name], capture_output=True)
+        (download_dir / BENCH_FILE).unlink(missing_ok=True)
+
+
+def summarize(latencies: list[float]) -> dict:
+    """Return read count and latency percentiles in milliseconds."""
+    cuts = statistics.quantiles(latencies, n=100)
+    return {
+        "reads": len(latencies),
+        "p50_ms": round(cuts[49], 2),
+        "p95_ms": round(cuts[94], 2),
+        "p99_ms": round(cuts[98], 2),
+        "max_ms": round(max(latencies), 2),
+    }
+
+
+def main():
+    """Entry point."""
+    parser = argparse.ArgumentParser(description="Compare media read latency with and without the block-I/O policy")
+    parser.add_argument("--seconds", type=int, default=30, help="duration of each pass")
+    parser.add_argument("--size-mb", type=int, default=4096, help="size of the media test file")
+    parser.add_argument("--download-dir", type=Path, default=ASTRO_DIR / "torrents" / "incomplete",
+                        help="directory the simulated downloader writes to")
+    args = parser.parse_args()
+
+    if os.geteuid() != 0:
+        print("This script must be run as root")
+        sys.exit(1)
+
+    media_flags, downloader_flags = load_policy()
+    test_file = MEDIA_DIR / BENCH_FILE
+    create_test_file(test_file, args.size_mb)
+    subprocess.run(["docker", "pull", "-q", BENCH_IMAGE], check=True, stdout=subprocess.DEVNULL)
+
+    try:
+        results = {
+            "baseline": summarize(run_pass([], [], args.download_dir, args.seconds)),
+            "policy": summarize(run_pass(media_flags, downloader_flags, args.download_dir, args.seconds)),
+            "media_flags": media_flags,
+            "downloader_flags": downloader_flags,
+        }
+    finally:
+        test_file.unlink(missing_ok=True)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+AstroMediaServer Log Viewer
+Streams logs from several stack containers at once over the Engine API,
+filtered by time window and regex. Without --follow, lines from all
+containers are merged in timestamp order.
+"""
+
+import argparse
+import asyncio
+import heapq
+import json
+import os
+import re
+import sys
+import time
+import urllib.parse
+import yaml
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+# Configuration paths
+ASTRO_DIR = Path(os.environ.get("ASTRO_ROOT", "/opt/astro"))
+COMPOSE_FILE = ASTRO_DIR / "docker-compose.yml"
+
+DOCKER_SOCKET = "/var/run/docker.sock"
+if os.environ.get("DOCKER_HOST", "").startswith("unix://"):
+    DOCKER_SOCKET = os.environ["DOCKER_HOST"].removeprefix("unix://")
+
+# Matched lines buffered per container before its reader waits for the printer
+QUEUE_LINES = 1024
+
+# --since/--until shorthands
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+COLORS = [36, 33, 32, 35, 34, 91, 96, 93, 92, 95, 94, 31]
+
+
+def parse_time(value: str) -> str:
+    """Turn 90s, 15m, 2h, 1d, a UNIX timestamp or an ISO 8601 time into UNIX seconds."""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", value)
+    if match:
+        return str(int(time.time() - float(match[1]) * DURATION_UNITS[match[2]]))
+    try:
+        return str(int(float(value)))
+    except ValueError:
+        pass
+    try:
+        return str(int(datetime.fromisoformat(value).timestamp()))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a duration, timestamp or ISO time: {value}")
+
+
+def sort_key(line: str) -> str:
+    """Return a line's RFC 3339 timestamp in a form that sorts correctly as text.
+
+    Docker trims trailing zeros from the fraction, so ".1Z" would sort
+    after ".12Z" without padding.
+    """
+    stamp = line.split(" ", 1)[0]
+    seconds, _, fraction = stamp.rstrip("Z").partition(".")
+    return f"{seconds}.{fraction:0<9}"
+
+
+def stack_containers(compose_file: Path = COMPOSE_FILE) -> dict[str, str]:
+    """Return {service: container name} from the generated compose file."""
+    with open(compose_file) as f:
+        services = yaml.safe_load(f)["services"]
+    return {name: svc.get("container_name", name) for name, svc in services.items()}
+
+
+class DockerLogs:
+    """Minimal asyncio client for the Engine API logs endpoint."""
+
+    def __init__(self, socket_path: str = DOCKER_SOCKET):
+        self.socket_path = socket_path
+
+    async def _request(self, path: str) -> tuple[int, dict, asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: docker\r\n\r\n".encode())
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b""):
+            key, _, value = line.decode().partition(":")
+            headers[key.strip().lower()] = value.strip()
+        return status, headers, reader, writer
+
+    @staticmethod
+    async def _body(reader: asyncio.StreamReader, headers: dict) -> AsyncIterator[bytes]:
+        """Yield the response body as it arrives, undoing chunked encoding."""
+        if headers.get("transfer-encoding") != "chunked":
+            remaining = int(headers.get("content-length", -1))
+            while remaining != 0 and (data := await reader.read(65536 if remaining < 0 else min(remaining, 65536))):
+                remaining -= len(data)
+                yield data
+            return
+        while size := int((await reader.readline()).split(b";")[0], 16):
+            yield await reader.readexactly(size)
+            await reader.readline()
+
+    async def inspect(self, container: str) -> Optional[dict]:
+        """Return a container's details, or None if it does not exist."""
+        status, headers, reader, writer = await self._request(f"/containers/{container}/json")
+        try:
+            body = b"".join([piece async for piece in self._body(reader, headers)])
+        finally:
+            writer.close()
+        return json.loads(body) if status == 200 else None
+
+    async def lines(self, container: str, tty: bool, **params) -> AsyncIterator[str]:
+        """Yield a container's log lines, demultiplexing stdout and stderr frames."""
+        query = urllib.parse.urlencode({"stdout": 1, "stderr": 1, "timestamps": 1, **params})
+        status, headers, reader, writer = await self._request(f"/containers/{container}/logs?{query}")
+        try:
+            if status != 200:
+                raise RuntimeError(f"{container}: HTTP {status}")
+            frames = pending = b""
+            async for piece in self._body(reader, headers):
+                if tty:
+                    pending += piece
+                else:
+                    # 8-byte header per frame: stream type, 3 zero bytes, big-endian size
+                    frames += piece
+                    while len(frames) >= 8:
+                        size = int.from_bytes(frames[4:8], "big")
+                        if len(frames) < 8 + size:
+                            break
+                        pending += frames[8:8 + size]
+                        frames = frames[8 + size:]
+                *complete, pending = pending.split(b"\n")
+                for line in complete:
+                    yield line.decode(errors="replace").rstrip("\r")
+            if pending:
+                yield pending.decode(errors="replace")
+        finally:
+            writer.close()
+
+
+class LogTail:
+    """Reads several containers concurrently and prints matching lines."""
+
+    def __init__(self, client: DockerLogs, containers: list[str], pattern: Optional[re.Pattern] = None,
+                 invert: bool = False, timestamps: bool = False, color: bool = False):
+        self.client = client
+        self.containers = containers
+        self.pattern = pattern
+        self.invert = invert
+        self.timestamps = timestamps
+        self.width = max(map(len, containers), default=0)
+        self.prefixes = {
+            name: f"\033[{COLORS[i % len(COLORS)]}m{name:<{self.width}}\033[0m" if color else f"{name:<{self.width}}"
+            for i, name in enumerate(containers)
+        }
+
+    def _matches(self, line: str) -> bool:
+        if self.pattern is None:
+            return True
+        # Match the message only, not the timestamp Docker prepends
+        return bool(self.pattern.search(line, line.find(" ") + 1)) != self.invert
+
+    async def _read(self, name: str, queue: asyncio.Queue, params: dict) -> None:
+        """Feed one container's matching lines into a queue, then None."""
+        try:
+            details = await self.client.inspect(name)
+            if details is None:
+                print(f"{name}: no such container", file=sys.stderr)
+                return
+            async for line in self.client.lines(name, details["Config"].get("Tty", False), **params):
+                if self._matches(line):
+                    await queue.put((name, line))
+        except (OSError, RuntimeError, ValueError) as e:
+            print(f"{name}: {e}", file=sys.stderr)
+        finally:
+            await queue.put(None)
+
+    def _print(self, name: str, line: str) -> None:
+        if not self.timestamps:
+            line = line.split(" ", 1)[-1]
+        sys.stdout.write(f"{self.prefixes[name]} | {line}\n")
+
+    async def follow(self, params: dict) -> None:
+        """Print lines from every container in arrival order until all streams end."""
+        queue: asyncio.Queue = asyncio.Queue(QUEUE_LINES)
+        tasks = [asyncio.create_task(self._read(name, queue, {**params, "follow": 1})) for name in self.containers]
+        open_streams = len(tasks)
+        while open_streams:
+            item = await queue.get()
+            if item is None:
+                open_streams -= 1
+                continue
+            self._print(*item)
+            if queue.empty():
+                sys.stdout.flush()
+
+    async def merge(self, params: dict) -> None:
+        """Print lines from every container in timestamp order.
+
+        Each container is read into its own bounded queue, so memory stays
+        flat however long the window is.
+        """
+        queues = {name: asyncio.Queue(QUEUE_LINES) for name in self.containers}
+        tasks = [asyncio.create_task(self._read(name, queue, params)) for name, queue in queues.items()]
+        heap = []
+        for name, queue in queues.items():
+            if item := await queue.get():
+                heapq.heappush(heap, (sort_key(item[1]), name, item[1]))
+        while heap:
+            _, name, line = heapq.heappop(heap)
+            self._print(name, line)
+            if item := await queues[name].get():
+                heapq.heappush(heap, (sort_key(item[1]), name, item[1]))
+        await asyncio.gather(*tasks)
+
+
+def main():
+    """Entry point."""
+    parser = argparse.ArgumentParser(description="Tail and search logs across the stack's containers")
+    parser.add_argument("services", nargs="*", help="services to read (default: every service in the stack)")
+    parser.add_argument("-f", "--follow", action="store_true", help="keep streaming new lines")
+    parser.add_argument("--since", type=parse_time, help="start of the window: 15m, 2h, 1d or an ISO time")
+    parser.add_argument("--until", type=parse_time, help="end of the window, same formats as --since")
+    parser.add_argument("-n", "--tail", type=int, help="only the last N lines of each container")
+    parser.add_argument("-g", "--grep", metavar="REGEX", help="only lines whose message matches")
+    parser.add_argument("-i", "--ignore-case", action="store_true", help="case-insensitive --grep")
+    parser.add_argument("-v", "--invert-match", action="store_true", help="only lines that do not match --grep")
+    parser.add_argument("-t", "--timestamps", action="store_true", help="show Docker's timestamp on each line")
+    parser.add_argument("--no-color", action="store_true", help="plain container name prefixes")
+    args = parser.parse_args()
+    pattern = None
+    if args.grep:
+        try:
+            pattern = re.compile(args.grep, re.IGNORECASE if args.ignore_case else 0)
+        except re.error as e:
+            parser.error(f"argument -g/--grep: invalid regex {args.grep!r}: {e}")
+
+    try:
+        stack = stack_containers()
+    except OSError as e:
+        print(f"Cannot read {COMPOSE_FILE}: {e}", file=sys.stderr)
+        sys.exit(1)
+    unknown = [name for name in args.services if name not in stack]
+    if unknown:
+        print(f"Not in the stack: {', '.join(unknown)}", file=sys.stderr)
+        sys.exit(1)
+    containers = [stack[name] for name in args.services or stack]
+
+    params = {}
+    if args.since:
+        params["since"] = args.since
+    if args.until:
+        params["until"] = args.until
+    if args.tail is not None:
+        params["tail"] = args.tail
+
+    tail = LogTail(DockerLogs(), containers, pattern, args.invert_match, args.timestamps,
+                   color=sys.stdout.isatty() and not args.no_color)
+    try:
+        asyncio.run(tail.follow(params) if args.follow else tail.merge(params))
+    except KeyboardInterrupt:
+        pass
+    except BrokenPipeError:
+        # Piped into head or less and the reader went away
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+AstroMediaServer Metrics Exporter
+Samples cgroup v2 CPU, memory and I/O counters and network traffic for
+each container of the stack, keeps a short history in memory, and serves
+it as Prometheus text and as JSON for the Homepage dashboard.
+"""
+
+import argparse
+import collections
+import http.client
+import http.server
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+from typing import Optional
+
+DOCKER_SOCKET = "/var/run/docker.sock"
+DEFAULT_PORT = 9101
+DEFAULT_INTERVAL = 5.0
+# Samples kept in memory: 30 minutes at the default interval
+DEFAULT_HISTORY = 360
+# Container lists are refreshed this often, and whenever a cgroup vanishes
+DISCOVERY_INTERVAL = 60
+
+# Where Docker puts a container's cgroup with the systemd and cgroupfs drivers
+CGROUP_LAYOUTS = ["system.slice/docker-{id}.scope", "docker/{id}"]
+
+# name: (Prometheus type, help text); counters are exported with a _total suffix
+METRICS = {
+    "cpu_usage_seconds": ("counter", "CPU time consumed"),
+    "cpu_throttled_seconds": ("counter", "Time spent throttled by the CPU quota"),
+    "memory_bytes": ("gauge", "Memory in use, including page cache"),
+    "memory_anon_bytes": ("gauge", "Anonymous (non-cache) memory"),
+    "memory_file_bytes": ("gauge", "Page cache charged to the container"),
+    "memory_limit_bytes": ("gauge", "Memory limit, 0 if unlimited"),
+    "oom_kills": ("counter", "Processes killed for exceeding the memory limit"),
+    "io_read_bytes": ("counter", "Bytes read from block devices"),
+    "io_write_bytes": ("counter", "Bytes written to block devices"),
+    "io_read_ops": ("counter", "Block device read operations"),
+    "io_write_ops": ("counter", "Block device write operations"),
+    "pids": ("gauge", "Processes and threads"),
+    "network_receive_bytes": ("counter", "Bytes received, absent for host-network containers"),
+    "network_transmit_bytes": ("counter", "Bytes sent, absent for host-network containers"),
+}
+
+# Counters turned into per-second rates for the JSON API
+RATES = {
+    "io_read_bytes": "read_bytes_per_s",
+    "io_write_bytes": "write_bytes_per_s",
+    "network_receive_bytes": "rx_bytes_per_s",
+    "network_transmit_bytes": "tx_bytes_per_s",
+}
+
+
+def read_text(path: Path) -> str:
+    """Read a small kernel file in one call."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.read(fd, 65536).decode()
+    finally:
+        os.close(fd)
+
+
+def read_keyed(path: Path) -> dict[str, int]:
+    """Parse a flat-keyed cgroup file such as cpu.stat or memory.stat."""
+    values = {}
+    try:
+        for line in read_text(path).splitlines():
+            key, _, value = line.partition(" ")
+            if value.isdigit():
+                values[key] = int(value)
+    except OSError:
+        pass
+    return values
+
+
+class CgroupReader:
+    """Reads a container's counters from a cgroup v2 tree and /proc.
+
+    Each sample costs a handful of small reads per container. Both roots
+    are parameters, so a fake tree can stand in for the real one.
+    """
+
+    def __init__(self, cgroup_root: Path = Path("/sys/fs/cgroup"), proc_root: Path = Path("/proc")):
+        self.cgroup_root = Path(cgroup_root)
+        self.proc_root = Path(proc_root)
+        try:
+            self.host_net = os.readlink(self.proc_root / "1" / "ns" / "net")
+        except OSError:
+            self.host_net = None
+
+    def locate(self, container_id: str) -> Optional[Path]:
+        """Return a container's cgroup directory, or None if it is not running."""
+        for layout in CGROUP_LAYOUTS:
+            path = self.cgroup_root / layout.format(id=container_id)
+            if path.is_dir():
+                return path
+        return None
+
+    def _io(self, cgroup: Path) -> dict[str, int]:
+        """Sum io.stat over every device."""
+        totals = {"io_read_bytes": 0, "io_write_bytes": 0, "io_read_ops": 0, "io_write_ops": 0}
+        keys = {"rbytes": "io_read_bytes", "wbytes": "io_write_bytes", "rios": "io_read_ops", "wios": "io_write_ops"}
+        try:
+            text = read_text(cgroup / "io.stat")
+        except OSError:
+            return totals
+        for line in text.splitlines():
+            for field in line.split()[1:]:
+                key, _, value = field.partition("=")
+                if key in keys:
+                    totals[keys[key]] += int(value)
+        return totals
+
+    def _same_namespace_as_host(self, pid: str) -> bool:
+        """Return True if a process shares the host's network namespace.
+
+        Inside a container without CAP_SYS_PTRACE the link is unreadable;
+        discovery then decides which containers use host networking.
+        """
+        try:
+            return os.readlink(self.proc_root / pid / "ns" / "net") == self.host_net
+        except OSError:
+            return False
+
+    def _network(self, cgroup: Path) -> dict[str, int]:
+        """Read interface counters from the network namespace of the container's first process.
+
+        Processes outside our PID namespace read as 0 in cgroup.procs, so
+        this needs the host's PID namespace (`pid: host` in compose).
+        """
+        try:
+            pid = next(pid for pid in read_text(cgroup / "cgroup.procs").split() if pid != "0")
+            if self._same_namespace_as_host(pid):
+                # Host networking: these would be the whole machine's counters
+                return {}
+            lines = read_text(self.proc_root / pid / "net" / "dev").splitlines()[2:]
+        except (OSError, IndexError, StopIteration):
+            return {}
+        received = transmitted = 0
+        for line in lines:
+            interface, _, fields = line.partition(":")
+            if interface.strip() == "lo":
+                continue
+            values = fields.split()
+            received += int(values[0])
+            transmitted += int(values[8])
+        return {"network_receive_bytes": received, "network_transmit_bytes": transmitted}
+
+    def sample(self, cgroup: Path, network: bool = True) -> dict[str, float]:
+        """Return the current counters of one cgroup. Raises OSError if it is gone."""
+        cpu = read_keyed(cgroup / "cpu.stat")
+        memory = read_keyed(cgroup / "memory.stat")
+        limit = read_text(cgroup / "memory.max").strip()
+        values = {
+            "cpu_usage_seconds": cpu.get("usage_usec", 0) / 1e6,
+            "cpu_throttled_seconds": cpu.get("throttled_usec", 0) / 1e6,
+            "memory_bytes": int(read_text(cgroup / "memory.current")),
+            "memory_anon_bytes": memory.get("anon", 0),
+            "memory_file_bytes": memory.get("file", 0),
+            "memory_limit_bytes": 0 if limit == "max" else int(limit),
+            "oom_kills": read_keyed(cgroup / "memory.events").get("oom_kill", 0),
+            **self._io(cgroup),
+        }
+        try:
+            values["pids"] = int(read_text(cgroup / "pids.current"))
+        except (OSError, ValueError):
+            pass
+        if network:
+            values.update(self._network(cgroup))
+        return values
+
+
+class DockerContainers:
+    """Maps container names to (ID, has own network) through the Engine API."""
+
+    def __init__(self, names: list[str], socket_path: str = DOCKER_SOCKET):
+        self.names = set(names)
+        self.socket_path = socket_path
+
+    def __call__(self) -> dict[str, tuple[str, bool]]:
+        conn = http.client.HTTPConnection("localhost", timeout=10)
+        conn.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.sock.settimeout(10)
+        try:
+            conn.sock.connect(self.socket_path)
+            conn.request("GET", "/containers/json")
+            containers = json.loads(conn.getresponse().read())
+        except (OSError, ValueError, http.client.HTTPException) as e:
+            print(f"container discovery failed: {e}", file=sys.stderr)
+            return {}
+        finally:
+            conn.close()
+        found = {}
+        for container in containers:
+            name = container["Names"][0].lstrip("/")
+            if not self.names or name in self.names:
+                found[name] = (container["Id"], container["HostConfig"].get("NetworkMode") != "host")
+        return found
+
+
+class MetricsStore:
+    """Fixed-size ring buffer of samples; rates come from neighbouring samples."""
+
+    def __init__(self, size: int = DEFAULT_HISTORY):
+        self.samples: collections.deque = collections.deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, timestamp: float, containers: dict[str, dict[str, float]]) -> None:
+        with self.lock:
+            self.samples.append((timestamp, containers))
+
+    @staticmethod
+    def _rates(before: tuple, after: tuple, name: str) -> Optional[dict]:
+        """Return gauges and per-second rates for one container between two samples."""
+        (t0, old), (t1, new) = before, after
+        if name not in old or name not in new or t1 <= t0:
+            return None
+        a, b = old[name], new[name]
+        elapsed = t1 - t0
+        point = {
+            "time": round(t1, 3),
+            # Percent of one core, like `docker stats`
+            "cpu_percent": round(max(0.0, b["cpu_usage_seconds"] - a["cpu_usage_seconds"]) / elapsed * 100, 2),
+            "memory_bytes": b["memory_bytes"],
+            "memory_limit_bytes": b["memory_limit_bytes"],
+        }
+        for counter, rate in RATES.items():
+            if counter in a and counter in b:
+                point[rate] = round(max(0, b[counter] - a[counter]) / elapsed)
+        return point
+
+    def summary(self) -> dict[str, dict]:
+        """Return the latest rates of every container."""
+        with self.lock:
+            if len(self.samples) < 2:
+                return {}
+            before, after = self.samples[-2], self.samples[-1]
+        summary = {}
+        for name in after[1]:
+            point = self._rates(before, after, name)
+            if point:
+                summary[name] = point
+        return summary
+
+    def history(self, name: str) -> list[dict]:
+        """Return every rate point held for one container, oldest first."""
+        with self.lock:
+            samples = list(self.samples)
+        points = (self._rates(a, b, name) for a, b in zip(samples, samples[1:]))
+        return [point for point in points if point]
+
+    def prometheus(self) -> str:
+        """Render the latest counters in the Prometheus text format."""
+        with self.lock:
+            if not self.samples:
+                return ""
+            _, latest = self.samples[-1]
+        lines = []
+        for metric, (kind, text) in METRICS.items():
+            name = f"astro_container_{metric}" + ("_total" if kind == "counter" else "")
+            series = [(container, values[metric]) for container, values in sorted(latest.items()) if metric in values]
+            if not series:
+                continue
+            lines += [f"# HELP {name} {text}.", f"# TYPE {name} {kind}"]
+            lines += [f'{name}{{container="{container}"}} {value}' for container, value in series]
+        return "\n".join(lines) + "\n"
+
+
+class Sampler:
+    """Samples every container on a fixed interval into a MetricsStore."""
+
+    def __init__(self, reader: CgroupReader, discover, store: MetricsStore, interval: float = DEFAULT_INTERVAL):
+        self.reader = reader
+        self.discover = discover
+        self.store = store
+        self.interval = interval
+        self.cgroups: dict[str, tuple[Path, bool]] = {}
+        self.discovered = 0.0
+        self.stopped = threading.Event()
+
+    def _refresh(self) -> None:
+        self.cgroups = {}
+        for name, (container_id, network) in self.discover().items():
+            path = self.reader.locate(container_id)
+            if path:
+                self.cgroups[name] = (path, network)
+        self.discovered = time.monotonic()
+
+    def sample_once(self) -> None:
+        if not self.cgroups or time.monotonic() - self.discovered > DISCOVERY_INTERVAL:
+            self._refresh()
+        containers = {}
+        vanished = False
+        for name, (path, network) in self.cgroups.items():
+            try:
+                containers[name] = self.reader.sample(path, network)
+            except (OSError, ValueError):
+                # Recreated under a new ID; found again on the next refresh
+                vanished = True
+        if vanished:
+            self.discovered = 0.0
+        # Wall-clock time so history points can be plotted; backwards steps are skipped in _rates
+        self.store.add(time.time(), containers)
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            started = time.monotonic()
+            self.sample_once()
+            self.stopped.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """Serves /metrics, /api/summary and /api/history?container=NAME from the store."""
+
+    store: MetricsStore = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body: str, content_type: str, status: int = 200) -> None:
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == "/metrics":
+            self._send(self.store.prometheus(), "text/plain; version=0.0.4")
+        elif url.path == "/api/summary":
+            self._send(json.dumps(self.store.summary()), "application/json")
+        elif url.path == "/api/history":
+            name = urllib.parse.parse_qs(url.query).get("container", [""])[0]
+            self._send(json.dumps(self.store.history(name)), "application/json")
+        else:
+            self._send("not found\n", "text/plain", 404)
+
+
+def static_containers(pairs: list[str]):
+    """Return a discovery function for fixed NAME=ID pairs."""
+    containers = {name: (container_id, True) for name, container_id in (pair.split("=", 1) for pair in pairs)}
+    return lambda: containers
+
+
+def main():
+    """Entry point."""
+    parser = argparse.ArgumentParser(description="Export per-container cgroup v2 metrics")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="HTTP port to serve on")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="seconds between samples")
+    parser.add_argument("--history", type=int, default=DEFAULT_HISTORY, help="samples kept in memory")
+    parser.add_argument("--cgroup-root", type=Path, default=Path("/sys/fs/cgroup"), help="cgroup v2 mount")
+    parser.add_argument("--proc-root", type=Path, default=Path("/proc"), help="host /proc mount")
+    parser.add_argument("--container", metavar="NAME=ID", action="append",
+                        help="watch this container instead of asking Docker (repeatable)")
+    parser.add_argument("--once", action="store_true",
+                        help="take two samples an interval apart, print the summary as JSON and exit")
+    args = parser.parse_args()
+
+    if args.container:
+        discover = static_containers(args.container)
+    else:
+        names = [name for name in os.environ.get("ASTRO_CONTAINERS", "").split(",") if name]
+        discover = DockerContainers(names)
+
+    store = MetricsStore(args.history)
+    sampler = Sampler(CgroupReader(args.cgroup_root, args.proc_root), discover, store, args.interval)
+
+    if args.once:
+        sampler.sample_once()
+        time.sleep(args.interval)
+        sampler.sample_once()
+        print(json.dumps(store.summary(), indent=2))
+        return
+
+    threading.Thread(target=sampler.run, daemon=True).start()
+    MetricsHandler.store = store
+    server = http.server.ThreadingHTTPServer(("", args.port), MetricsHandler)
+    print(f"serving metrics on :{args.port}", file=sys.stderr)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -37,6 +37,7 @@ echo "  - All Docker containers"
 echo "  - All configuration files"
 echo "  - All downloaded media"
 echo "  - All Docker volumes"
+echo "  (config backups in ${ASTRO_DIR}/backups are kept)"
 echo ""
 
 read -p "Are you sure you want to continue? (yes/no): " confirm
@@ -65,12 +66,14 @@ for container in $CONTAINERS; do
 done
 log_ok "Orphaned containers cleaned up"
 
-# Remove astro directory contents
+# Remove astro directory contents, keeping config backups for a restore
 if [ -d "$ASTRO_DIR" ]; then
     log_info "Removing ${ASTRO_DIR} contents..."
-    rm -rf "${ASTRO_DIR:?}"/*
-    rm -rf "${ASTRO_DIR:?}"/.*  2>/dev/null || true
+    find "${ASTRO_DIR:?}" -mindepth 1 -maxdepth 1 ! -name backups -exec rm -rf {} +
     log_ok "Astro directory cleared"
+    if [ -d "${ASTRO_DIR}/backups" ]; then
+        log_info "Kept config backups in ${ASTRO_DIR}/backups"
+    fi
 fi
 
 # Ask about Docker images
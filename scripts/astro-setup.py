@@ -4,19 +4,125 @@ AstroMediaServer Setup Wizard
 A whiptail-based TUI for configuring the media server stack.
 """
 
+import argparse
 import subprocess
 import os
 import sys
+import configparser
+import contextlib
+import copy
+import fcntl
+import functools
+import gzip
+import hashlib
+import json
+import math
+import shutil
+import tarfile
+import tempfile
+import time
+import socket
+import sqlite3
+import threading
+import http.client
+import io
+import urllib.error
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ET
+import zlib
 import yaml
+from datetime import datetime, timedelta
+from datetime import time as dtime
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, Future, wait
 from pathlib import Path
-from typing import Optional
-from dataclasses import dataclass, field
+from typing import BinaryIO, Iterable, Optional
+from dataclasses import asdict, dataclass, field, fields
 
-# Configuration paths
-ASTRO_DIR = Path("/opt/astro")
+# Configuration paths (ASTRO_ROOT relocates the install, e.g. for benchmarks)
+ASTRO_DIR = Path(os.environ.get("ASTRO_ROOT", "/opt/astro"))
 CONFIG_DIR = ASTRO_DIR / "config"
 MEDIA_DIR = ASTRO_DIR / "media"
+DATA_DIR = ASTRO_DIR / "data"
 COMPOSE_FILE = ASTRO_DIR / "docker-compose.yml"
+IMAGE_LOCK = ASTRO_DIR / "images.lock"
+SETTINGS_FILE = ASTRO_DIR / "astro-config.yaml"
+STARTUP_LOG = ASTRO_DIR / "startup-times.json"
+TRACE_FILE = ASTRO_DIR / "setup-trace.json"
+LIBRARY_INDEX = ASTRO_DIR / "library-index.json.gz"
+LIBRARY_STATS = ASTRO_DIR / "library-stats.json"
+IMAGE_BUNDLE_DIR = ASTRO_DIR / "images"
+BACKUP_DIR = ASTRO_DIR / "backups"
+HOSTS_DIR = ASTRO_DIR / "hosts"
+DB_MAINTENANCE_LOG = ASTRO_DIR / "db-maintenance.json"
+MAINTENANCE_LOCK = ASTRO_DIR / ".maintenance.lock"
+TRANSCODE_DIR = ASTRO_DIR / "transcode"
+POOL_MOUNT = Path("/mnt/astro-pool")
+# Download client templates sit next to the script on installs, at the repo root in a checkout
+SCRIPT_DIR = Path(__file__).resolve().parent
+TEMPLATE_DIR = next((d / "config-templates" for d in (SCRIPT_DIR, SCRIPT_DIR.parent)
+                     if (d / "config-templates").is_dir()), SCRIPT_DIR / "config-templates")
+SYSTEMD_DIR = Path(os.environ.get("ASTRO_SYSTEMD_DIR", "/etc/systemd/system"))
+DOCKER_SOCKET = "/var/run/docker.sock"
+if os.environ.get("DOCKER_HOST", "").startswith("unix://"):
+    DOCKER_SOCKET = os.environ["DOCKER_HOST"].removeprefix("unix://")
+TTY = os.environ.get("ASTRO_TTY", "/dev/tty")
+
+# Image pull tuning
+PULL_WORKERS = 4
+PULL_RETRIES = 3
+
+# Readiness gate tuning
+READY_TIMEOUT = int(os.environ.get("ASTRO_READY_TIMEOUT", "300"))
+READY_HISTORY = 50
+
+# Rolling update tuning
+UPDATE_HEALTH_TIMEOUT = 300
+SESSION_POLL_INTERVAL = 60
+
+# Days of library totals kept for growth rates
+LIBRARY_HISTORY_DAYS = 90
+
+# Config backups kept before the oldest is pruned
+BACKUP_KEEP = 14
+
+# Database maintenance runs kept in DB_MAINTENANCE_LOG
+DB_MAINTENANCE_HISTORY = 20
+
+# Seconds a scheduled job waits for another to release MAINTENANCE_LOCK
+MAINTENANCE_LOCK_WAIT = 600
+MAINTENANCE_LOCK_POLL = 5
+
+# Port the optional astro-metrics exporter serves on
+METRICS_PORT = 9101
+
+# Transcode scratch sizing
+TRANSCODE_MB_PER_STREAM = 1024
+TRANSCODE_MAX_RAM_FRACTION = 0.25
+TRANSCODE_MIN_TMPFS_MB = 1024
+
+# Floor for generated container memory limits
+MIN_MEM_LIMIT_MB = 256
+
+# Block-I/O weights per service class (10-1000, needs the BFQ scheduler)
+DEFAULT_BLKIO_WEIGHTS = {
+    "media": 1000,
+    "requests": 300,
+    "arr": 200,
+    "downloader": 100,
+    "utility": 100,
+}
+
+# Container log budget per service class in MB, rotated over LOG_FILES files
+DEFAULT_LOG_LIMITS_MB = {
+    "media": 100,
+    "gateway": 50,
+    "requests": 30,
+    "arr": 50,
+    "downloader": 50,
+    "utility": 20,
+}
+LOG_FILES = 5
 
 # Default environment variables
 DEFAULT_PUID = "1000"
@@ -38,6 +144,583 @@ class UserConfig:
     pgid: str = DEFAULT_PGID
     enable_usenet: bool = False
     enable_torrents: bool = True
+    hw_accel: str = "none"  # qsv, vaapi, none
+    hw_devices: list[str] = field(default_factory=list)
+    hw_group_ids: list[str] = field(default_factory=list)
+    transcode_streams: int = 3
+    transcode_tmpfs_mb: int = 0  # 0 = disk-backed TRANSCODE_DIR
+    resource_profile: str = "balanced"  # streaming-first, download-first, balanced, none
+    blkio_weights: dict[str, int] = field(default_factory=lambda: dict(DEFAULT_BLKIO_WEIGHTS))
+    download_write_bps: int = 0  # per-device downloader throttles, 0 = unlimited
+    download_write_iops: int = 0
+    download_read_bps: int = 0
+    download_read_iops: int = 0
+    import_write_bps: int = 0  # per-device *arr throttles on the library disks, 0 = unlimited
+    import_write_iops: int = 0
+    log_limits_mb: dict[str, int] = field(default_factory=lambda: dict(DEFAULT_LOG_LIMITS_MB))  # {} = unbounded
+    data_layout: str = "split"  # unified (single /data root), split
+    storage_tiers: dict[str, str] = field(default_factory=dict)  # role -> host dir, see StoragePaths
+    pool_branches: list[str] = field(default_factory=list)  # data disk mountpoints pooled at POOL_MOUNT
+    pool_policy: str = "most-free"  # most-free, existing-path, round-robin
+    domain: str = ""  # gateway hosts are <service>.<domain>; empty matches any domain
+    update_strategy: str = "rolling"  # rolling (astro-update.timer), watchtower, none
+    update_window: str = "03:00-06:00"  # local time, may cross midnight
+    update_batch: int = 1  # services updated together
+    media_server_api_key: str = ""  # lets updates see Jellyfin/Emby sessions
+    backup_dir: str = ""  # config backup repository, empty = BACKUP_DIR
+    backup_keep: int = BACKUP_KEEP  # nightly snapshots retained
+    restore_services: list[str] = field(default_factory=list)  # config dirs restored before first start
+    db_log_days: int = 14  # *arr log and finished-command rows kept by database maintenance
+    db_history_days: int = 365  # *arr/Ombi history rows kept, 0 = keep all
+    hosts: dict[str, str] = field(default_factory=dict)  # split-stack host name -> address, first is primary
+    topology: dict[str, str] = field(default_factory=dict)  # service class -> host, unassigned on the first host
+    this_host: str = ""  # which of hosts this machine is, empty = the first
+    data_share: str = ""  # nfs://addr/export or smb://addr/share exporting the library root
+    data_share_options: str = ""  # extra mount options, e.g. username=...,password=... for SMB
+    metrics: bool = False  # deploy the astro-metrics cgroup exporter
+
+    @property
+    def usenet_client(self) -> Optional[str]:
+        """Return the deployed usenet client, or None with usenet disabled."""
+        if not self.enable_usenet:
+            return None
+        return self.downloader if self.downloader in ["sabnzbd", "nzbget"] else "sabnzbd"
+
+    # Allowed values for answers files and environment overrides
+    CHOICES = {
+        "media_server": ["plex", "jellyfin", "emby"],
+        "request_manager": ["overseerr", "jellyseerr", "ombi", "none"],
+        "downloader": ["qbittorrent", "sabnzbd", "nzbget"],
+        "gateway": ["traefik", "nginx-proxy-manager"],
+        "dashboard": ["homepage", "heimdall"],
+        "hw_accel": ["qsv", "vaapi", "none"],
+        "resource_profile": ["streaming-first", "balanced", "download-first", "none"],
+        "data_layout": ["unified", "split"],
+        "pool_policy": ["most-free", "existing-path", "round-robin"],
+        "update_strategy": ["rolling", "watchtower", "none"],
+    }
+
+    # Prefix for environment variable overrides, e.g. ASTRO_MEDIA_SERVER=plex
+    ENV_PREFIX = "ASTRO_"
+
+    def validate(self) -> list[str]:
+        """Return a list of problems with the current values (empty if valid)."""
+        errors = []
+        for f in fields(self):
+            value = getattr(self, f.name)
+            expected = f.type.__origin__ if hasattr(f.type, "__origin__") else f.type
+            # bool is an int subclass, so check it explicitly
+            if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+                errors.append(f"{f.name}: expected {expected.__name__}, got {value!r}")
+            elif f.name in self.CHOICES and value not in self.CHOICES[f.name]:
+                errors.append(f"{f.name}: must be one of {', '.join(self.CHOICES[f.name])}")
+
+        for name in ["puid", "pgid"]:
+            if not str(getattr(self, name)).isdigit():
+                errors.append(f"{name}: must be a numeric ID")
+        zoneinfo = Path("/usr/share/zoneinfo")
+        if zoneinfo.is_dir() and not (zoneinfo / str(self.timezone)).is_file():
+            errors.append(f"timezone: unknown zone {self.timezone!r}")
+        unknown_roles = set(self.storage_tiers) - set(StoragePaths.ROLES)
+        if unknown_roles:
+            errors.append(f"storage_tiers: unknown roles {', '.join(sorted(unknown_roles))}")
+        if len(self.pool_branches) == 1:
+            errors.append("pool_branches: a pool needs at least two disks")
+        try:
+            UpdateCoordinator.parse_window(str(self.update_window))
+        except ValueError:
+            errors.append("update_window: must look like 03:00-06:00")
+        if isinstance(self.update_batch, int) and self.update_batch < 1:
+            errors.append("update_batch: must be at least 1")
+        if isinstance(self.backup_keep, int) and self.backup_keep < 1:
+            errors.append("backup_keep: must be at least 1")
+        for name in ["db_log_days", "db_history_days"]:
+            if isinstance(getattr(self, name), int) and getattr(self, name) < 0:
+                errors.append(f"{name}: must not be negative")
+        unknown_logs = set(self.log_limits_mb) - set(ComposeGenerator.SERVICE_CLASSES)
+        if unknown_logs:
+            errors.append(f"log_limits_mb: unknown service classes {', '.join(sorted(unknown_logs))}")
+        unknown_classes = set(self.topology) - set(ComposeGenerator.SERVICE_CLASSES)
+        if unknown_classes:
+            errors.append(f"topology: unknown service classes {', '.join(sorted(unknown_classes))}")
+        unknown_hosts = {host for host in self.topology.values() if host not in self.hosts}
+        if self.this_host:
+            unknown_hosts |= {self.this_host} - set(self.hosts)
+        if unknown_hosts:
+            errors.append(f"topology: hosts not listed in hosts: {', '.join(sorted(unknown_hosts))}")
+        if self.data_share and urllib.parse.urlsplit(self.data_share).scheme not in Topology.SHARE_SCHEMES:
+            errors.append("data_share: must be an nfs:// or smb:// URL")
+        elif len(self.hosts) > 1 and not self.data_share:
+            errors.append("data_share: required when the stack spans hosts")
+        if self.downloader in ["sabnzbd", "nzbget"] and not self.enable_usenet:
+            errors.append("downloader: usenet clients require enable_usenet")
+        return errors
+
+    @classmethod
+    def env_overrides(cls, environ: dict) -> dict:
+        """Parse ASTRO_* environment variables into typed config values."""
+        values = {}
+        for f in fields(cls):
+            raw = environ.get(cls.ENV_PREFIX + f.name.upper())
+            if raw is None:
+                continue
+            if f.type is bool:
+                values[f.name] = raw.strip().lower() in ("1", "true", "yes", "on")
+            elif f.type is int:
+                values[f.name] = int(raw)
+            elif getattr(f.type, "__origin__", None) is list:
+                values[f.name] = [item.strip() for item in raw.split(",") if item.strip()]
+            elif getattr(f.type, "__origin__", None) is dict:
+                values[f.name] = json.loads(raw)
+            else:
+                values[f.name] = raw
+        return values
+
+    def save(self, path: Path = SETTINGS_FILE) -> None:
+        """Persist selections so later runs can reapply them without the wizard."""
+        with open(path, "w") as f:
+            yaml.dump(asdict(self), f, default_flow_style=False, sort_keys=False)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "UserConfig":
+        """Build a config from saved values, ignoring unknown keys."""
+        types = {f.name: f.type for f in fields(cls)}
+        values = {k: v for k, v in data.items() if k in types}
+        for name, value in values.items():
+            # YAML reads unquoted IDs like `puid: 1000` as ints
+            if types[name] is str and isinstance(value, int) and not isinstance(value, bool):
+                values[name] = str(value)
+        config = cls(**values)
+        # A pool is mounted as the library tier; answers files may leave that implicit
+        if config.pool_branches and isinstance(config.storage_tiers, dict):
+            config.storage_tiers.setdefault("library", str(POOL_MOUNT))
+        return config
+
+    @classmethod
+    def from_compose(cls, compose: dict) -> "UserConfig":
+        """Reconstruct selections from a compose file written before settings were saved."""
+        services = compose.get("services", {})
+        config = cls()
+
+        def pick(options: list[str], default: str) -> str:
+            return next((name for name in options if name in services), default)
+
+        config.media_server = pick(["plex", "jellyfin", "emby"], config.media_server)
+        config.request_manager = pick(["overseerr", "jellyseerr", "ombi"], "none")
+        config.gateway = pick(["traefik", "nginx-proxy-manager"], config.gateway)
+        config.dashboard = pick(["homepage", "heimdall"], config.dashboard)
+        config.enable_torrents = "qbittorrent" in services
+        config.enable_usenet = any(name in services for name in ["sabnzbd", "nzbget"])
+        config.downloader = pick(["sabnzbd", "nzbget", "qbittorrent"], config.downloader)
+
+        env = services.get(config.media_server, {}).get("environment", {})
+        config.timezone = env.get("TZ", config.timezone)
+        config.puid = str(env.get("PUID", config.puid))
+        config.pgid = str(env.get("PGID", config.pgid))
+        return config
+
+    @classmethod
+    def load(cls, path: Path = SETTINGS_FILE) -> "UserConfig":
+        """Load saved selections, falling back to the deployed compose file."""
+        if path.exists():
+            with open(path) as f:
+                return cls.from_dict(yaml.safe_load(f) or {})
+        if COMPOSE_FILE.exists():
+            with open(COMPOSE_FILE) as f:
+                return cls.from_compose(yaml.safe_load(f) or {})
+        return cls()
+
+
+class StoragePaths:
+    """Resolves host directories from the layout and storage tier map.
+
+    Roles left out of UserConfig.storage_tiers keep the ASTRO_DIR defaults.
+    """
+
+    # Tier map roles: hot/random I/O first, cold/sequential last
+    ROLES = {
+        "config": "App configs, databases and media server metadata",
+        "transcode": "Transcode scratch (when RAM is too small for tmpfs)",
+        "incomplete": "In-progress torrent and usenet downloads",
+        "library": "Media library and completed downloads",
+    }
+
+    def __init__(self, config: UserConfig):
+        tiers = config.storage_tiers
+        self.unified = config.data_layout == "unified"
+        self.config_dir = Path(tiers.get("config", CONFIG_DIR))
+        self.transcode_dir = Path(tiers.get("transcode", TRANSCODE_DIR))
+
+        if "library" in tiers:
+            library = Path(tiers["library"])
+            media_dir, self.data_dir, split_root = library / "media", library / "data", library
+        else:
+            media_dir, self.data_dir, split_root = MEDIA_DIR, DATA_DIR, ASTRO_DIR
+        self.library_root = split_root
+
+        self.media_dir = self.data_dir / "media" if self.unified else media_dir
+        self.download_root = self.data_dir if self.unified else split_root
+        self.incomplete_root = Path(tiers["incomplete"]) if "incomplete" in tiers else None
+
+    def incomplete_dir(self, kind: str) -> Path:
+        """Return the in-progress download directory for torrents or usenet."""
+        if self.incomplete_root:
+            return self.incomplete_root / kind
+        return self.download_root / kind / "incomplete"
+
+    def shared_dirs(self) -> list[Path]:
+        """Return the trees the media server, *arr apps and downloaders all mount."""
+        if self.unified:
+            return [self.data_dir]
+        return [self.media_dir, self.download_root / "torrents", self.download_root / "usenet"]
+
+    def download_target(self, kind: str) -> str:
+        """Return where a download client sees its torrents or usenet directory."""
+        return f"/data/{kind}" if self.unified else "/downloads"
+
+
+class MediaPool:
+    """mergerfs pool of data disks, mounted as the library tier.
+
+    Generates a systemd mount unit for the pool and a oneshot service that
+    seeds the library skeleton on every branch before Docker starts.
+    """
+
+    # Placement policy -> mergerfs create policy. mergerfs has no strict
+    # round-robin, so random placement stands in for it.
+    POLICIES = {
+        "most-free": "mfs",
+        "existing-path": "epmfs",
+        "round-robin": "rand",
+    }
+
+    SERVICE = "astro-pool.service"
+
+    def __init__(self, branches: list[str], policy: str = "most-free", mountpoint: Path = POOL_MOUNT):
+        self.branches = [str(b) for b in branches]
+        self.policy = policy
+        self.mountpoint = Path(mountpoint)
+
+    @staticmethod
+    def unit_name(path: Path, suffix: str) -> str:
+        """Escape a path into a systemd unit name, like `systemd-escape --path`."""
+        parts = []
+        for i, ch in enumerate(str(path).strip("/")):
+            if ch == "/":
+                parts.append("-")
+            elif ch.isascii() and (ch.isalnum() or ch in ":_") or (ch == "." and i > 0):
+                parts.append(ch)
+            else:
+                parts.append(f"\\x{ord(ch):02x}")
+        return "".join(parts) + suffix
+
+    def mount_options(self) -> str:
+        """Return mergerfs options for the selected placement policy."""
+        return ",".join([
+            "defaults",
+            "allow_other",
+            "use_ino",
+            # Partial page caching keeps mmap working for qBittorrent
+            "cache.files=partial",
+            "dropcacheonclose=true",
+            "moveonenospc=true",
+            "minfreespace=20G",
+            f"category.create={self.POLICIES[self.policy]}",
+            "fsname=astro-pool",
+        ])
+
+    def units(self, skeleton: list[str]) -> dict[str, str]:
+        """Return {unit file name: contents} for the pool mount and service."""
+        mount_unit = self.unit_name(self.mountpoint, ".mount")
+        branches = " ".join(self.branches)
+        mkdirs = " ".join(f"{branch}/{rel}" for branch in self.branches for rel in skeleton)
+        # mkdir -p without arguments fails, and this unit is required by docker.service
+        prepare = f"/bin/mkdir -p {mkdirs}" if mkdirs else "/bin/true"
+        return {
+            mount_unit: f"""[Unit]
+Description=AstroMediaServer media pool
+RequiresMountsFor={branches}
+
+[Mount]
+What={":".join(self.branches)}
+Where={self.mountpoint}
+Type=fuse.mergerfs
+Options={self.mount_options()}
+
+[Install]
+WantedBy=multi-user.target
+""",
+            self.SERVICE: f"""[Unit]
+Description=AstroMediaServer media pool preparation
+Requires={mount_unit}
+After={mount_unit}
+Before=docker.service
+
+[Service]
+Type=oneshot
+ExecStart={prepare}
+RemainAfterExit=yes
+
+[Install]
+RequiredBy=docker.service
+""",
+        }
+
+    def install(self, skeleton: list[str], unit_dir: Path = SYSTEMD_DIR) -> None:
+        """Write the units and bring the pool up."""
+        self.mountpoint.mkdir(parents=True, exist_ok=True)
+        units = self.units(skeleton)
+        for name, contents in units.items():
+            (unit_dir / name).write_text(contents)
+        subprocess.run(["systemctl", "daemon-reload"], check=True)
+        subprocess.run(["systemctl", "enable", "--now", *units], check=True)
+
+
+@dataclass
+class StorageVolume:
+    """A mounted filesystem that could hold part of the stack."""
+
+    mountpoint: str
+    disks: list[str]
+    rotational: bool
+    size_bytes: int
+    free_bytes: int
+
+
+@dataclass
+class RenderDevice:
+    """A DRI render node and the GPU behind it."""
+
+    path: str
+    vendor: str  # intel, amd, nvidia, unknown
+    gid: int
+
+
+@dataclass
+class HostResources:
+    """CPU and memory available to the stack."""
+
+    cpus: int
+    memory_mb: int
+
+
+class HardwareProbe:
+    """Inspects sysfs and /dev for host hardware.
+
+    Roots are injectable so the probe can run against a fake tree.
+    """
+
+    # PCI vendor IDs from /sys/class/drm/*/device/vendor
+    GPU_VENDORS = {
+        "0x8086": "intel",
+        "0x1002": "amd",
+        "0x10de": "nvidia",
+    }
+
+    # Transcode API used for each vendor (NVIDIA needs the container toolkit)
+    VENDOR_ACCEL = {
+        "intel": "qsv",
+        "amd": "vaapi",
+    }
+
+    def __init__(self, sys_root: Path = Path("/sys"), dev_root: Path = Path("/dev"), proc_root: Path = Path("/proc")):
+        self.sys_root = Path(sys_root)
+        self.dev_root = Path(dev_root)
+        self.proc_root = Path(proc_root)
+
+    def memory_mb(self) -> int:
+        """Return total system memory in MiB from /proc/meminfo (0 if unknown)."""
+        try:
+            with open(self.proc_root / "meminfo") as f:
+                for line in f:
+                    if line.startswith("MemTotal:"):
+                        return int(line.split()[1]) // 1024
+        except (OSError, ValueError, IndexError):
+            pass
+        return 0
+
+    def cpu_count(self) -> int:
+        """Return the number of logical CPUs from /proc/cpuinfo."""
+        try:
+            with open(self.proc_root / "cpuinfo") as f:
+                count = sum(1 for line in f if line.startswith("processor"))
+        except OSError:
+            count = 0
+        return count or os.cpu_count() or 1
+
+    def resources(self) -> HostResources:
+        """Return the host's CPU and memory totals."""
+        return HostResources(cpus=self.cpu_count(), memory_mb=self.memory_mb())
+
+    def _disks_for(self, block: Path) -> set[str]:
+        """Resolve a sysfs block entry to the whole disks beneath it."""
+        block = block.resolve()
+        slaves = sorted((block / "slaves").glob("*"))
+        if slaves:
+            # device-mapper (LVM, LUKS): follow down to the physical disks
+            disks = set()
+            for slave in slaves:
+                disks |= self._disks_for(self.sys_root / "class" / "block" / slave.name)
+            return disks
+        if (block / "partition").exists():
+            block = block.parent
+        return {block.name}
+
+    def backing_disks(self, path: Path) -> list[str]:
+        """Return the /dev paths of the physical disks holding a path."""
+        path = Path(path)
+        while not path.exists() and path != path.parent:
+            path = path.parent
+        st_dev = path.stat().st_dev
+
+        block = self.sys_root / "dev" / "block" / f"{os.major(st_dev)}:{os.minor(st_dev)}"
+        if not block.exists():
+            # tmpfs, overlayfs and similar have no backing block device
+            return []
+        return [f"/dev/{name}" for name in sorted(self._disks_for(block))]
+
+    def is_rotational(self, disk: str) -> bool:
+        """Return True if a disk (e.g. /dev/sda) is a spinning drive."""
+        flag = self.sys_root / "block" / Path(disk).name / "queue" / "rotational"
+        try:
+            return flag.read_text().strip() == "1"
+        except OSError:
+            return False
+
+    def path_is_rotational(self, path: Path, pool_branches: Iterable[str] = ()) -> bool:
+        """Return True if a path lives on a spinning drive.
+
+        Paths on the mergerfs pool have no block device, so its branches
+        are checked instead.
+        """
+        paths = list(pool_branches) if Path(path).is_relative_to(POOL_MOUNT) else [path]
+        return any(self.is_rotational(disk) for p in paths for disk in self.backing_disks(p))
+
+    # Mount points that never hold stack data
+    SKIP_MOUNTS = ("/boot", "/snap", "/var/lib/docker", "/run", "/proc", "/sys", "/dev")
+
+    def storage_volumes(self) -> list[StorageVolume]:
+        """Return block-backed mounted filesystems with their disk type and space."""
+        volumes = {}
+        try:
+            with open(self.proc_root / "self" / "mounts") as f:
+                mounts = [line.split()[1].replace("\\040", " ") for line in f if line.startswith("/dev/")]
+        except OSError:
+            return []
+
+        for mountpoint in mounts:
+            if mountpoint.startswith(self.SKIP_MOUNTS) or mountpoint in volumes:
+                continue
+            disks = self.backing_disks(Path(mountpoint))
+            if not disks:
+                continue
+            try:
+                stat = os.statvfs(mountpoint)
+            except OSError:
+                continue
+            volumes[mountpoint] = StorageVolume(
+                mountpoint=mountpoint,
+                disks=disks,
+                rotational=any(self.is_rotational(d) for d in disks),
+                size_bytes=stat.f_blocks * stat.f_frsize,
+                free_bytes=stat.f_bavail * stat.f_frsize,
+            )
+        return list(volumes.values())
+
+    @staticmethod
+    def propose_tiers(volumes: list[StorageVolume], astro_mount: str = "/") -> dict[str, str]:
+        """Map hot roles to the roomiest SSD and the library to the roomiest HDD.
+
+        Returns an empty map unless the host has both kinds of storage.
+        """
+        ssds = sorted((v for v in volumes if not v.rotational), key=lambda v: v.free_bytes, reverse=True)
+        hdds = sorted((v for v in volumes if v.rotational), key=lambda v: v.free_bytes, reverse=True)
+        if not ssds or not hdds:
+            return {}
+
+        def base(volume: StorageVolume) -> Optional[Path]:
+            # Volumes holding ASTRO_DIR already use the default paths
+            if volume.mountpoint == astro_mount:
+                return None
+            return Path(volume.mountpoint) / "astro"
+
+        tiers = {}
+        hot, cold = base(ssds[0]), base(hdds[0])
+        if hot:
+            tiers["config"] = str(hot / "config")
+            tiers["transcode"] = str(hot / "transcode")
+        # Incomplete downloads go on SSD even when it is the OS disk
+        tiers["incomplete"] = str((hot or ASTRO_DIR) / "incomplete")
+        if cold:
+            tiers["library"] = str(cold)
+        return tiers
+
+    @staticmethod
+    def pool_candidates(volumes: list[StorageVolume], exclude: Iterable[str]) -> list[StorageVolume]:
+        """Return data disks that could join a media pool, roomiest first."""
+        exclude = set(exclude)
+        return sorted(
+            (v for v in volumes if v.mountpoint not in exclude and v.mountpoint != "/"),
+            key=lambda v: v.free_bytes,
+            reverse=True,
+        )
+
+    def transcode_tmpfs_mb(self, streams: int) -> int:
+        """Size a RAM-backed transcode dir for the stream count (0 = use disk)."""
+        budget = max(1, streams) * TRANSCODE_MB_PER_STREAM
+        size = min(budget, int(self.memory_mb() * TRANSCODE_MAX_RAM_FRACTION))
+        return size if size >= TRANSCODE_MIN_TMPFS_MB else 0
+
+    def render_devices(self) -> list[RenderDevice]:
+        """Return every DRI render node with its GPU vendor and owning group."""
+        devices = []
+        for node in sorted((self.dev_root / "dri").glob("renderD*")):
+            vendor_file = self.sys_root / "class" / "drm" / node.name / "device" / "vendor"
+            try:
+                vendor_id = vendor_file.read_text().strip().lower()
+            except OSError:
+                vendor_id = ""
+            devices.append(RenderDevice(
+                path=f"/dev/dri/{node.name}",
+                vendor=self.GPU_VENDORS.get(vendor_id, "unknown"),
+                gid=node.stat().st_gid,
+            ))
+        return devices
+
+    def video_gid(self) -> Optional[int]:
+        """Return the group owning the DRI card nodes (usually `video`)."""
+        cards = sorted((self.dev_root / "dri").glob("card*"))
+        return cards[0].stat().st_gid if cards else None
+
+    def transcode_support(self) -> tuple[str, list[RenderDevice]]:
+        """Return (accel, devices) for the preferred hardware transcoder."""
+        devices = self.render_devices()
+        for vendor in self.VENDOR_ACCEL:
+            matches = [d for d in devices if d.vendor == vendor]
+            if matches:
+                return self.VENDOR_ACCEL[vendor], matches
+        return "none", []
+
+    def apply_transcoding(self, config: "UserConfig", accel: Optional[str] = None) -> str:
+        """Record detected transcode hardware in the config. Returns the accel.
+
+        With an accel given, only render nodes of the matching vendor are
+        used, and the config keeps that accel even if none are found.
+        """
+        if accel is None:
+            accel, devices = self.transcode_support()
+        else:
+            vendors = {v for v, a in self.VENDOR_ACCEL.items() if a == accel}
+            devices = [d for d in self.render_devices() if d.vendor in vendors]
+        gids = {str(d.gid) for d in devices}
+        video = self.video_gid()
+        if video is not None:
+            gids.add(str(video))
+
+        config.hw_accel = accel
+        config.hw_devices = [d.path for d in devices]
+        config.hw_group_ids = sorted(gids) if devices else []
+        return accel
 
 
 class WhiptailUI:
@@ -53,7 +736,7 @@ class WhiptailUI:
         try:
             # Whiptail needs direct terminal access for display
             # It outputs user selections to stderr
-            with open("/dev/tty", "r") as tty_in, open("/dev/tty", "w") as tty_out:
+            with open(TTY, "r") as tty_in, open(TTY, "w") as tty_out:
                 result = subprocess.run(
                     cmd,
                     stdin=tty_in,
@@ -104,9 +787,67 @@ class WhiptailUI:
         return output if code == 0 else None
 
     @staticmethod
-    def gauge(text: str, percent: int, height: int = 7, width: int = 60) -> None:
-        """Display a progress gauge."""
-        WhiptailUI._run(["--gauge", text, str(height), str(width), str(percent)])
+    def gauge(text: str, updates: Iterable[tuple[int, str]], height: int = 8, width: int = 60) -> None:
+        """Display a progress gauge fed by (percent, text) updates until exhausted."""
+        cmd = ["whiptail", "--title", WhiptailUI.TITLE, "--backtitle", WhiptailUI.BACKTITLE,
+               "--gauge", text, str(height), str(width), "0"]
+        try:
+            # Gauge reads progress from stdin, so it cannot share _run's tty stdin
+            with open(TTY, "w") as tty_out:
+                proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=tty_out, stderr=tty_out, text=True)
+                try:
+                    for percent, message in updates:
+                        proc.stdin.write(f"XXX\n{max(0, min(100, int(percent)))}\n{message}\nXXX\n")
+                        proc.stdin.flush()
+                finally:
+                    proc.stdin.close()
+                    proc.wait()
+        except FileNotFoundError:
+            print("Error: whiptail not found. Please install it.")
+            sys.exit(1)
+        except BrokenPipeError:
+            pass
+
+
+class HeadlessUI:
+    """Drop-in replacement for WhiptailUI that never prompts.
+
+    Messages and progress go to stderr so stdout stays machine-readable.
+    """
+
+    @staticmethod
+    def msgbox(text: str, height: int = 10, width: int = 60) -> None:
+        """Log a message."""
+        print(text.strip(), file=sys.stderr)
+
+    @staticmethod
+    def yesno(text: str, height: int = 10, width: int = 60) -> bool:
+        """Accept every confirmation."""
+        return True
+
+    @staticmethod
+    def menu(text: str, choices: list[tuple[str, str]], height: int = 20, width: int = 70, menu_height: int = 10) -> Optional[str]:
+        """Menus have no default in headless mode."""
+        return None
+
+    @staticmethod
+    def checklist(text: str, choices: list[tuple[str, str, str]], height: int = 20, width: int = 70, list_height: int = 10) -> list[str]:
+        """Return the items that are checked by default."""
+        return [tag for tag, _, status in choices if status == "ON"]
+
+    @staticmethod
+    def inputbox(text: str, default: str = "", height: int = 10, width: int = 60) -> Optional[str]:
+        """Return the default value."""
+        return default
+
+    @staticmethod
+    def gauge(text: str, updates: Iterable[tuple[int, str]], height: int = 8, width: int = 60) -> None:
+        """Log progress every 10 percent until updates are exhausted."""
+        last = -10
+        for percent, message in updates:
+            if percent >= last + 10 or percent == 100:
+                print(f"[{percent:3d}%] {message.splitlines()[0]}", file=sys.stderr)
+                last = percent
 
 
 class ComposeGenerator:
@@ -140,10 +881,97 @@ class ComposeGenerator:
         "ombi": "lscr.io/linuxserver/ombi:latest",
         # Utilities
         "watchtower": "containrrr/watchtower:latest",
+        "astro-metrics": "python:3-alpine",
     }
 
-    def __init__(self, config: UserConfig):
+    # VA-API driver for each transcode API (Plex bundles its own drivers)
+    VAAPI_DRIVERS = {
+        "qsv": "iHD",
+        "vaapi": "radeonsi",
+    }
+
+    # Container healthcheck commands. LinuxServer images ship curl; the
+    # node-based images only have busybox wget.
+    HEALTHCHECKS = {
+        "plex": ["CMD", "curl", "-fs", "http://localhost:32400/identity"],
+        "jellyfin": ["CMD", "curl", "-fs", "http://localhost:8096/health"],
+        "emby": ["CMD", "curl", "-fs", "http://localhost:8096/emby/System/Info/Public"],
+        "radarr": ["CMD", "curl", "-fs", "http://localhost:7878/ping"],
+        "sonarr": ["CMD", "curl", "-fs", "http://localhost:8989/ping"],
+        "lidarr": ["CMD", "curl", "-fs", "http://localhost:8686/ping"],
+        "prowlarr": ["CMD", "curl", "-fs", "http://localhost:9696/ping"],
+        # Download clients answer 401/403 until configured; any response is healthy
+        "qbittorrent": ["CMD", "curl", "-so", "/dev/null", "http://localhost:8080/"],
+        "sabnzbd": ["CMD", "curl", "-so", "/dev/null", "http://localhost:8080/"],
+        "nzbget": ["CMD", "curl", "-so", "/dev/null", "http://localhost:6789/"],
+        "overseerr": ["CMD", "curl", "-fs", "http://localhost:5055/api/v1/status"],
+        "jellyseerr": ["CMD", "wget", "-qO", "/dev/null", "http://localhost:5055/api/v1/status"],
+        "ombi": ["CMD", "curl", "-so", "/dev/null", "http://localhost:3579/"],
+        "traefik": ["CMD", "traefik", "healthcheck", "--ping"],
+        "nginx-proxy-manager": ["CMD", "/usr/bin/check-health"],
+        "homepage": ["CMD", "wget", "-qO", "/dev/null", "http://localhost:3000/api/healthcheck"],
+        "heimdall": ["CMD", "curl", "-so", "/dev/null", "http://localhost:80/"],
+        "watchtower": ["CMD", "/watchtower", "--health-check"],
+        "astro-metrics": ["CMD", "wget", "-qO", "/dev/null", f"http://localhost:{METRICS_PORT}/metrics"],
+    }
+
+    # Seconds before failed checks count against slow-starting images
+    START_PERIODS = {"plex": "120s", "jellyfin": "90s", "emby": "90s"}
+
+    # Services that must be healthy before a dependent starts
+    DEPENDENCIES = {
+        "requests": ["media", "radarr", "sonarr"],
+        "dashboard": ["media", "radarr", "sonarr", "lidarr", "prowlarr"],
+    }
+
+    # Services deployed regardless of wizard selections
+    CORE_SERVICES = ["radarr", "sonarr", "lidarr", "prowlarr"]
+
+    # Resource class of each service, highest priority first
+    SERVICE_CLASSES = {
+        "media": ["plex", "jellyfin", "emby"],
+        "gateway": ["traefik", "nginx-proxy-manager"],
+        "requests": ["overseerr", "jellyseerr", "ombi"],
+        "arr": ["radarr", "sonarr", "lidarr", "prowlarr"],
+        "downloader": ["qbittorrent", "sabnzbd", "nzbget"],
+        "utility": ["homepage", "heimdall", "watchtower", "astro-metrics"],
+    }
+
+    # Per class: (cpu_shares, cpus as fraction of cores or None for no cap,
+    #             mem_limit and mem_reservation as fractions of RAM)
+    RESOURCE_PROFILES = {
+        "streaming-first": {
+            "media": (2048, None, 0.50, 0.25),
+            "gateway": (1024, 0.50, 0.05, 0),
+            "requests": (512, 0.50, 0.05, 0),
+            "arr": (256, 0.50, 0.08, 0),
+            "downloader": (128, 0.50, 0.10, 0),
+            "utility": (64, 0.25, 0.03, 0),
+        },
+        "balanced": {
+            "media": (1024, None, 0.40, 0.15),
+            "gateway": (768, 0.50, 0.05, 0),
+            "requests": (512, 0.50, 0.05, 0),
+            "arr": (512, 0.50, 0.10, 0),
+            "downloader": (512, 0.75, 0.15, 0),
+            "utility": (128, 0.25, 0.03, 0),
+        },
+        "download-first": {
+            "media": (1024, None, 0.30, 0.10),
+            "gateway": (512, 0.50, 0.05, 0),
+            "requests": (256, 0.50, 0.05, 0),
+            "arr": (512, 0.50, 0.10, 0),
+            "downloader": (1024, None, 0.25, 0.05),
+            "utility": (128, 0.25, 0.03, 0),
+        },
+    }
+
+    def __init__(self, config: UserConfig, resources: Optional[HostResources] = None,
+                 probe: Optional[HardwareProbe] = None):
         self.config = config
+        self.paths = StoragePaths(config)
+        self.probe = probe or HardwareProbe()
+        self.resources = resources
         self.services = {}
 
     def _base_env(self) -> dict:
@@ -154,6 +982,21 @@ class ComposeGenerator:
             "TZ": self.config.timezone,
         }
 
+    def _media_volumes(self, libraries: list[str]) -> list[str]:
+        """Return library mounts for the configured data layout."""
+        if self.paths.unified:
+            return [f"{self.paths.media_dir}:/data/media"]
+        return [f"{self.paths.media_dir}/{lib}:/{lib}" for lib in libraries]
+
+    def _download_volumes(self, kind: str) -> list[str]:
+        """Return the download client mounts for torrents or usenet."""
+        target = self.paths.download_target(kind)
+        volumes = [f"{self.paths.download_root}/{kind}:{target}"]
+        if self.paths.incomplete_root:
+            # Nested mount puts in-progress writes on the fast tier
+            volumes.append(f"{self.paths.incomplete_dir(kind)}:{target}/incomplete")
+        return volumes
+
     def _add_media_server(self) -> None:
         """Add selected media server to compose."""
         server = self.config.media_server
@@ -164,10 +1007,8 @@ class ComposeGenerator:
             "restart": "unless-stopped",
             "environment": self._base_env(),
             "volumes": [
-                f"{CONFIG_DIR}/{server}:/config",
-                f"{MEDIA_DIR}/movies:/movies",
-                f"{MEDIA_DIR}/tv:/tv",
-                f"{MEDIA_DIR}/music:/music",
+                f"{self.paths.config_dir}/{server}:/config",
+                *self._media_volumes(["movies", "tv", "music"]),
             ],
         }
 
@@ -179,8 +1020,38 @@ class ComposeGenerator:
         elif server == "emby":
             base["ports"] = ["8096:8096"]
 
+        self._add_transcode_mount(base)
+        self._add_hw_transcoding(base)
         self.services[server] = base
 
+    def _add_transcode_mount(self, service: dict) -> None:
+        """Mount dedicated transcode scratch space at /transcode."""
+        size_mb = self.config.transcode_tmpfs_mb
+        if size_mb > 0:
+            service["volumes"].append({
+                "type": "tmpfs",
+                "target": "/transcode",
+                "tmpfs": {"size": size_mb * 1024 * 1024},
+            })
+        else:
+            service["volumes"].append(f"{self.paths.transcode_dir}:/transcode")
+
+    def _add_hw_transcoding(self, service: dict) -> None:
+        """Pass detected render devices through to the media server."""
+        accel = self.config.hw_accel
+        if accel == "none" or not self.config.hw_devices:
+            return
+
+        server = self.config.media_server
+        service["devices"] = [f"{dev}:{dev}" for dev in self.config.hw_devices]
+        service["group_add"] = list(self.config.hw_group_ids)
+
+        if server != "plex":
+            service["environment"]["LIBVA_DRIVER_NAME"] = self.VAAPI_DRIVERS[accel]
+        if server == "jellyfin" and accel == "qsv":
+            # OpenCL runtime for HDR tone mapping on Intel
+            service["environment"]["DOCKER_MODS"] = "linuxserver/mods:jellyfin-opencl-intel"
+
     def _add_arr_suite(self) -> None:
         """Add Radarr, Sonarr, Lidarr, Prowlarr."""
         # Note: Readarr removed - LinuxServer deprecated the image
@@ -192,20 +1063,18 @@ class ComposeGenerator:
         }
 
         for name, conf in arr_configs.items():
-            volumes = [f"{CONFIG_DIR}/{name}:/config"]
+            volumes = [f"{self.paths.config_dir}/{name}:/config"]
 
             # Add media volumes for content managers
-            if name in ["radarr", "sonarr", "lidarr"]:
-                volumes.extend([
-                    f"{MEDIA_DIR}/movies:/movies",
-                    f"{MEDIA_DIR}/tv:/tv",
-                    f"{MEDIA_DIR}/music:/music",
-                    f"{MEDIA_DIR}/books:/books",
-                ])
+            if name in ["radarr", "sonarr", "lidarr"] and self.config.data_layout == "unified":
+                # One mount for downloads and library so imports are hardlinks/renames
+                volumes.append(f"{self.paths.data_dir}:/data")
+            elif name in ["radarr", "sonarr", "lidarr"]:
+                volumes.extend(self._media_volumes(["movies", "tv", "music", "books"]))
                 if self.config.enable_torrents:
-                    volumes.append(f"{ASTRO_DIR}/torrents:/downloads/torrents")
+                    volumes.append(f"{self.paths.download_root}/torrents:/downloads/torrents")
                 if self.config.enable_usenet:
-                    volumes.append(f"{ASTRO_DIR}/usenet:/downloads/usenet")
+                    volumes.append(f"{self.paths.download_root}/usenet:/downloads/usenet")
 
             self.services[name] = {
                 "image": self.IMAGES[name],
@@ -230,24 +1099,29 @@ class ComposeGenerator:
                 },
                 "ports": ["8080:8080", "6881:6881", "6881:6881/udp"],
                 "volumes": [
-                    f"{CONFIG_DIR}/qbittorrent:/config",
-                    f"{ASTRO_DIR}/torrents:/downloads",
+                    f"{self.paths.config_dir}/qbittorrent:/config",
+                    *self._download_volumes("torrents"),
                 ],
             }
 
-        if self.config.enable_usenet:
-            usenet_client = self.config.downloader if self.config.downloader in ["sabnzbd", "nzbget"] else "sabnzbd"
+        usenet_client = self.config.usenet_client
+        if usenet_client:
             port = "8080" if usenet_client == "sabnzbd" else "6789"
+            # qBittorrent already publishes 8080
+            published = "8085" if port == "8080" and self.config.enable_torrents else port
+            if Topology(self.config).enabled:
+                # Other hosts reach it by name, which cannot remap ports; listen on the published one
+                port = published
 
             self.services[usenet_client] = {
                 "image": self.IMAGES[usenet_client],
                 "container_name": usenet_client,
                 "restart": "unless-stopped",
                 "environment": self._base_env(),
-                "ports": [f"{port}:{port}"],
+                "ports": [f"{published}:{port}"],
                 "volumes": [
-                    f"{CONFIG_DIR}/{usenet_client}:/config",
-                    f"{ASTRO_DIR}/usenet:/downloads",
+                    f"{self.paths.config_dir}/{usenet_client}:/config",
+                    *self._download_volumes("usenet"),
                 ],
             }
 
@@ -266,12 +1140,19 @@ class ComposeGenerator:
                     "--providers.docker=true",
                     "--providers.docker.exposedbydefault=false",
                     "--entrypoints.web.address=:80",
+                    # Large uploads and slow clients must not be cut off mid-request
+                    "--entrypoints.web.transport.respondingTimeouts.readTimeout=0",
+                    "--providers.file.directory=/etc/traefik/dynamic",
+                    "--providers.file.watch=true",
+                    "--ping=true",
                 ],
                 "ports": ["80:80", "8081:8080"],
                 "volumes": [
                     "/var/run/docker.sock:/var/run/docker.sock:ro",
-                    f"{CONFIG_DIR}/traefik:/etc/traefik",
+                    f"{self.paths.config_dir}/traefik:/etc/traefik",
                 ],
+                # Plex runs on the host network and is reached through the host
+                "extra_hosts": ["host.docker.internal:host-gateway"],
             }
         elif gateway == "nginx-proxy-manager":
             self.services["nginx-proxy-manager"] = {
@@ -280,11 +1161,22 @@ class ComposeGenerator:
                 "restart": "unless-stopped",
                 "ports": ["80:80", "443:443", "81:81"],
                 "volumes": [
-                    f"{CONFIG_DIR}/npm/data:/data",
-                    f"{CONFIG_DIR}/npm/letsencrypt:/etc/letsencrypt",
+                    f"{self.paths.config_dir}/npm/data:/data",
+                    f"{self.paths.config_dir}/npm/letsencrypt:/etc/letsencrypt",
                 ],
+                "extra_hosts": ["host.docker.internal:host-gateway"],
             }
 
+    def _add_gateway_labels(self) -> None:
+        """Attach Traefik router and service labels to every routed service."""
+        if self.config.gateway != "traefik":
+            return
+        gateway = GatewayConfig(self.config, {"services": self.services})
+        for name in gateway.routes():
+            labels = gateway.labels(name)
+            if labels:
+                self.services[name]["labels"] = labels
+
     def _add_dashboard(self) -> None:
         """Add dashboard application."""
         dashboard = self.config.dashboard
@@ -296,7 +1188,9 @@ class ComposeGenerator:
                 "restart": "unless-stopped",
                 "ports": ["3000:3000"],
                 "volumes": [
-                    f"{CONFIG_DIR}/homepage:/app/config",
+                    f"{self.paths.config_dir}/homepage:/app/config",
+                    # Served at /astro/ for the library widgets
+                    f"{self.paths.config_dir}/homepage/public:/app/public/astro:ro",
                     "/var/run/docker.sock:/var/run/docker.sock:ro",
                 ],
                 "environment": {
@@ -310,7 +1204,7 @@ class ComposeGenerator:
                 "container_name": "heimdall",
                 "restart": "unless-stopped",
                 "ports": ["3000:80"],
-                "volumes": [f"{CONFIG_DIR}/heimdall:/config"],
+                "volumes": [f"{self.paths.config_dir}/heimdall:/config"],
                 "environment": self._base_env(),
             }
 
@@ -327,7 +1221,7 @@ class ComposeGenerator:
                 "container_name": "overseerr",
                 "restart": "unless-stopped",
                 "ports": ["5055:5055"],
-                "volumes": [f"{CONFIG_DIR}/overseerr:/config"],
+                "volumes": [f"{self.paths.config_dir}/overseerr:/config"],
                 "environment": self._base_env(),
             }
         elif manager == "jellyseerr":
@@ -336,7 +1230,7 @@ class ComposeGenerator:
                 "container_name": "jellyseerr",
                 "restart": "unless-stopped",
                 "ports": ["5055:5055"],
-                "volumes": [f"{CONFIG_DIR}/jellyseerr:/app/config"],
+                "volumes": [f"{self.paths.config_dir}/jellyseerr:/app/config"],
                 "environment": self._base_env(),
             }
         elif manager == "ombi":
@@ -345,12 +1239,14 @@ class ComposeGenerator:
                 "container_name": "ombi",
                 "restart": "unless-stopped",
                 "ports": ["3579:3579"],
-                "volumes": [f"{CONFIG_DIR}/ombi:/config"],
+                "volumes": [f"{self.paths.config_dir}/ombi:/config"],
                 "environment": self._base_env(),
             }
 
     def _add_watchtower(self) -> None:
-        """Add Watchtower for automatic updates."""
+        """Add Watchtower when it, rather than astro-update.timer, handles updates."""
+        if self.config.update_strategy != "watchtower":
+            return
         self.services["watchtower"] = {
             "image": self.IMAGES["watchtower"],
             "container_name": "watchtower",
@@ -359,9 +1255,180 @@ class ComposeGenerator:
             "environment": {
                 "WATCHTOWER_CLEANUP": "true",
                 "WATCHTOWER_SCHEDULE": "0 0 4 * * *",  # 4 AM daily
+                # Restart one container at a time instead of all at once
+                "WATCHTOWER_ROLLING_RESTART": "true",
             },
         }
 
+    def _add_metrics(self) -> None:
+        """Add the cgroup exporter, watching every container generated so far."""
+        if not self.config.metrics:
+            return
+        containers = [svc.get("container_name", name) for name, svc in self.services.items()]
+        self.services["astro-metrics"] = {
+            "image": self.IMAGES["astro-metrics"],
+            "container_name": "astro-metrics",
+            "restart": "unless-stopped",
+            "command": ["python3", "/app/astro-metrics.py", "--port", str(METRICS_PORT),
+                        "--cgroup-root", "/host/cgroup", "--proc-root", "/host/proc"],
+            "environment": {"ASTRO_CONTAINERS": ",".join(containers)},
+            # cgroup.procs lists processes outside our PID namespace as 0; with the host's
+            # namespace they are real PIDs in /host/proc. Reading their net/dev needs no
+            # extra capabilities; host-network containers are identified through Docker.
+            "pid": "host",
+            "ports": [f"{METRICS_PORT}:{METRICS_PORT}"],
+            "volumes": [
+                f"{SCRIPT_DIR / 'astro-metrics.py'}:/app/astro-metrics.py:ro",
+                "/sys/fs/cgroup:/host/cgroup:ro",
+                "/proc:/host/proc:ro",
+                "/var/run/docker.sock:/var/run/docker.sock:ro",
+            ],
+        }
+
+    def _service_class(self, name: str) -> Optional[str]:
+        """Return the resource class a service belongs to."""
+        for cls, names in self.SERVICE_CLASSES.items():
+            if name in names:
+                return cls
+        return None
+
+    def _apply_resource_profile(self) -> None:
+        """Set CPU and memory limits on every service from the chosen profile."""
+        profile = self.RESOURCE_PROFILES.get(self.config.resource_profile)
+        if profile is None:
+            return
+
+        resources = self.resources or self.probe.resources()
+        if not resources.memory_mb:
+            return
+
+        for name, service in self.services.items():
+            cls = self._service_class(name)
+            if cls is None:
+                continue
+            shares, cpus, mem_limit, mem_reservation = profile[cls]
+
+            limit_mb = max(MIN_MEM_LIMIT_MB, int(resources.memory_mb * mem_limit))
+            if cls == "media":
+                # tmpfs pages are charged to the container's memory cgroup
+                limit_mb += self.config.transcode_tmpfs_mb
+
+            service["cpu_shares"] = shares
+            if cpus is not None:
+                service["cpus"] = max(0.5, round(resources.cpus * cpus, 2))
+            service["mem_limit"] = f"{limit_mb}m"
+            if mem_reservation:
+                service["mem_reservation"] = f"{int(resources.memory_mb * mem_reservation)}m"
+
+        # Keep downloaders off most cores so hash checks can't starve transcodes
+        if self.config.resource_profile == "streaming-first" and resources.cpus >= 8:
+            first = resources.cpus - resources.cpus // 4
+            cpuset = f"{first}-{resources.cpus - 1}"
+            for name in self.SERVICE_CLASSES["downloader"]:
+                if name in self.services:
+                    self.services[name]["cpuset"] = cpuset
+
+    def _apply_blkio_policy(self) -> None:
+        """Give streaming reads priority over downloader and import writes."""
+        weights = self.config.blkio_weights
+        if not weights:
+            return
+
+        for name, service in self.services.items():
+            weight = weights.get(self._service_class(name))
+            if weight:
+                service["blkio_config"] = {"weight": weight}
+
+        download_throttles = {
+            "device_read_bps": self.config.download_read_bps,
+            "device_read_iops": self.config.download_read_iops,
+            "device_write_bps": self.config.download_write_bps,
+            "device_write_iops": self.config.download_write_iops,
+        }
+        import_throttles = {
+            "device_write_bps": self.config.import_write_bps,
+            "device_write_iops": self.config.import_write_iops,
+        }
+        if not any(download_throttles.values()) and not any(import_throttles.values()):
+            return
+
+        kinds = [k for k, on in (("torrents", self.config.enable_torrents), ("usenet", self.config.enable_usenet)) if on]
+        download_dirs = [self.paths.download_root / kind for kind in kinds]
+        download_dirs += [self.paths.incomplete_dir(kind) for kind in kinds]
+        media_disks = self._disks([self.paths.media_dir])
+        # Downloaders are held back wherever they compete with streaming reads
+        self._throttle("downloader", self._disks(download_dirs) | media_disks, download_throttles)
+        # *arr imports copy or move completed downloads onto the library
+        self._throttle("arr", media_disks, import_throttles)
+
+    def _disks(self, paths: Iterable[Path]) -> set[str]:
+        """Return the physical disks behind the given directories."""
+        pool_branches = self.config.pool_branches
+        disks = set()
+        for path in paths:
+            # The mergerfs pool has no block device of its own; its branches do
+            targets = pool_branches if pool_branches and Path(path).is_relative_to(POOL_MOUNT) else [path]
+            for target in targets:
+                disks.update(self.probe.backing_disks(Path(target)))
+        return disks
+
+    def _throttle(self, service_class: str, disks: set[str], throttles: dict[str, int]) -> None:
+        """Add per-device blkio limits to every service of a class."""
+        if not disks:
+            return
+        for name in self.SERVICE_CLASSES[service_class]:
+            if name not in self.services:
+                continue
+            blkio = self.services[name].setdefault("blkio_config", {})
+            for key, rate in throttles.items():
+                if rate:
+                    blkio[key] = [{"path": disk, "rate": rate} for disk in sorted(disks)]
+
+    def _apply_logging_policy(self) -> None:
+        """Cap each container's logs with the compressed local driver."""
+        for name, service in self.services.items():
+            budget = self.config.log_limits_mb.get(self._service_class(name))
+            if not budget:
+                continue
+            service["logging"] = {
+                "driver": "local",
+                "options": {
+                    "max-size": f"{max(1, budget // LOG_FILES)}m",
+                    "max-file": str(LOG_FILES),
+                    "compress": "true",
+                },
+            }
+
+    def _add_healthchecks(self) -> None:
+        """Give every service a healthcheck and wait on healthy dependencies."""
+        for name, service in self.services.items():
+            test = self.HEALTHCHECKS.get(name)
+            if name == "sabnzbd":
+                listen = str(service["ports"][0]).rsplit(":", 1)[1]
+                test = [*test[:-1], f"http://localhost:{listen}/"]
+            if test:
+                service["healthcheck"] = {
+                    "test": test,
+                    "interval": "30s",
+                    "timeout": "10s",
+                    "retries": 3,
+                    "start_period": self.START_PERIODS.get(name, "60s"),
+                }
+
+        dependents = {
+            "requests": [self.config.request_manager],
+            "dashboard": [self.config.dashboard],
+        }
+        for group, needs in self.DEPENDENCIES.items():
+            required = [self.config.media_server if n == "media" else n for n in needs]
+            for name in dependents[group]:
+                if name not in self.services:
+                    continue
+                self.services[name]["depends_on"] = {
+                    dep: {"condition": "service_healthy"}
+                    for dep in required if dep in self.services
+                }
+
     def generate(self) -> dict:
         """Generate the complete docker-compose configuration."""
         self._add_media_server()
@@ -371,23 +1438,2252 @@ class ComposeGenerator:
         self._add_gateway()
         self._add_dashboard()
         self._add_watchtower()
+        self._add_metrics()
+        self._add_gateway_labels()
+        self._add_healthchecks()
+        self._apply_resource_profile()
+        self._apply_blkio_policy()
+        self._apply_logging_policy()
+        self._pin_images()
+
+        return {
+            "services": self.services,
+            "networks": {
+                "default": {
+                    "name": "astro-network",
+                }
+            },
+        }
+
+    def _pin_images(self) -> None:
+        """Reference images by their locked digest; Watchtower only follows tags."""
+        if self.config.update_strategy == "watchtower":
+            return
+        lock = ImageLock()
+        for service in self.services.values():
+            service["image"] = lock.pin(service["image"])
+
+    def generate_split(self) -> dict[str, dict]:
+        """Generate one compose configuration per host of the topology."""
+        topology = Topology(self.config)
+        compose = self.generate()
+        if not topology.enabled:
+            return {topology.local: compose}
+        return topology.split(compose)
+
+    @staticmethod
+    def diff(old: dict, new: dict) -> dict:
+        """Structurally compare two compose configs service by service."""
+        old_services = (old or {}).get("services", {})
+        new_services = new.get("services", {})
+
+        changed = {}
+        for name in [n for n in new_services if n in old_services]:
+            before, after = old_services[name], new_services[name]
+            keys = sorted(k for k in before.keys() | after.keys() if before.get(k) != after.get(k))
+            if keys:
+                changed[name] = keys
+
+        return {
+            "added": [name for name in new_services if name not in old_services],
+            "removed": [name for name in old_services if name not in new_services],
+            "changed": changed,
+            "unchanged": [name for name in new_services if name in old_services and name not in changed],
+        }
+
+
+class GatewayConfig:
+    """Routes every web UI through the gateway by hostname.
+
+    UIs get compression and long browser caching of static assets. Media
+    servers get neither: their responses are flushed as they arrive,
+    with no proxy timeouts, so streams pass through untouched.
+    """
+
+    # Static UI assets worth caching in the browser
+    STATIC_ASSETS = r"\.(css|js|mjs|map|png|jpe?g|gif|svg|webp|ico|woff2?|ttf)$"
+    STATIC_CACHE = "public, max-age=604800, stale-while-revalidate=86400"
+
+    # The gateways themselves are not routed
+    GATEWAYS = ["traefik", "nginx-proxy-manager"]
+
+    def __init__(self, config: "UserConfig", compose: dict, remote: Optional[dict[str, str]] = None):
+        self.config = config
+        self.services = compose["services"]
+        # {service: address} for services in compose that another host runs
+        self.remote = remote or {}
+
+    def _via_file(self, name: str) -> bool:
+        """Return True if Traefik cannot see the service's labels and routes it from the file."""
+        return name in self.remote or self.services[name].get("network_mode") == "host"
+
+    def routes(self) -> dict[str, dict]:
+        """Return {service: {"upstream": url, "media": bool}} for every web UI."""
+        routes = {}
+        for name, svc in self.services.items():
+            if name in self.GATEWAYS:
+                continue
+            if name in self.remote and (svc.get("ports") or svc.get("network_mode") == "host"):
+                port = 32400 if svc.get("network_mode") == "host" else str(svc["ports"][0]).split(":")[0]
+                upstream = f"http://{self.remote[name]}:{port}"
+            elif svc.get("network_mode") == "host" and name == "plex":
+                upstream = "http://host.docker.internal:32400"
+            elif svc.get("ports"):
+                port = str(svc["ports"][0]).split("/")[0].split(":")[-1]
+                upstream = f"http://{svc.get('container_name', name)}:{port}"
+            else:
+                continue
+            routes[name] = {"upstream": upstream, "media": name in ComposeGenerator.SERVICE_CLASSES["media"]}
+        return routes
+
+    def rule(self, name: str) -> str:
+        """Return the Traefik host rule for a service."""
+        if self.config.domain:
+            return f"Host(`{name}.{self.config.domain}`)"
+        return f"HostRegexp(`^{name}\\..+`)"
+
+    def labels(self, name: str) -> dict[str, str]:
+        """Return docker labels for a container-routed service (host-network ones use the file)."""
+        route = self.routes()[name]
+        if self._via_file(name):
+            return {}
+        port = route["upstream"].rsplit(":", 1)[1]
+        router = f"traefik.http.routers.{name}"
+        service = f"traefik.http.services.{name}.loadbalancer"
+        labels = {
+            "traefik.enable": "true",
+            f"{router}.rule": self.rule(name),
+            f"{router}.entrypoints": "web",
+            f"{router}.service": name,
+            f"{service}.server.port": port,
+        }
+        if route["media"]:
+            labels[f"{service}.responseforwarding.flushinterval"] = "-1"
+            labels[f"{service}.serverstransport"] = "astro-media@file"
+        else:
+            labels[f"{router}.middlewares"] = "astro-compress@file"
+            # Longer rule, so Traefik gives it priority over the catch-all router
+            labels[f"{router}-static.rule"] = f"{self.rule(name)} && PathRegexp(`{self.STATIC_ASSETS}`)"
+            labels[f"{router}-static.entrypoints"] = "web"
+            labels[f"{router}-static.service"] = name
+            labels[f"{router}-static.middlewares"] = "astro-compress@file,astro-static-cache@file"
+        return labels
+
+    def traefik_dynamic(self) -> dict:
+        """Return the file-provider config: shared middlewares plus host-network and remote routes."""
+        dynamic = {
+            "http": {
+                "middlewares": {
+                    "astro-compress": {"compress": {"minResponseBodyBytes": 1024}},
+                    "astro-static-cache": {"headers": {"customResponseHeaders": {"Cache-Control": self.STATIC_CACHE}}},
+                },
+                "serversTransports": {
+                    # No response deadline, so long transcodes and direct plays are never cut
+                    "astro-media": {"forwardingTimeouts": {"dialTimeout": "30s", "responseHeaderTimeout": "0s",
+                                                           "idleConnTimeout": "300s"}},
+                },
+            }
+        }
+        for name, route in self.routes().items():
+            if not self._via_file(name):
+                continue
+            routers = dynamic["http"].setdefault("routers", {})
+            routers[name] = {"rule": self.rule(name), "entryPoints": ["web"], "service": name}
+            balancer = {"servers": [{"url": route["upstream"]}]}
+            if route["media"]:
+                balancer["responseForwarding"] = {"flushInterval": "-1"}
+                balancer["serversTransport"] = "astro-media"
+            else:
+                routers[name]["middlewares"] = ["astro-compress"]
+                routers[f"{name}-static"] = {
+                    "rule": f"{self.rule(name)} && PathRegexp(`{self.STATIC_ASSETS}`)",
+                    "entryPoints": ["web"],
+                    "service": name,
+                    "middlewares": ["astro-compress", "astro-static-cache"],
+                }
+            dynamic["http"].setdefault("services", {})[name] = {"loadBalancer": balancer}
+        return dynamic
+
+    def nginx_servers(self) -> str:
+        """Return nginx server blocks equivalent to the Traefik routes, for NPM's custom include."""
+        blocks = ["# Generated by astro-setup.py; edit astro-config.yaml and run --apply instead"]
+        for name, route in self.routes().items():
+            server_name = f"{name}.{self.config.domain}" if self.config.domain else f"~^{name}\\..+"
+            proxy = [
+                f"        proxy_pass {route['upstream']};",
+                "        proxy_http_version 1.1;",
+                "        proxy_set_header Host $host;",
+                "        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;",
+                "        proxy_set_header X-Forwarded-Proto $scheme;",
+                "        proxy_set_header Upgrade $http_upgrade;",
+                "        proxy_set_header Connection $http_connection;",
+            ]
+            if route["media"]:
+                body = [
+                    "    location / {",
+                    *proxy,
+                    "        proxy_buffering off;",
+                    "        proxy_request_buffering off;",
+                    "        proxy_read_timeout 1d;",
+                    "        proxy_send_timeout 1d;",
+                    "    }",
+                ]
+            else:
+                body = [
+                    "    gzip on;",
+                    "    gzip_proxied any;",
+                    "    gzip_min_length 1024;",
+                    "    gzip_types text/css application/javascript application/json image/svg+xml;",
+                    f"    location ~* {self.STATIC_ASSETS} {{",
+                    *proxy,
+                    f'        add_header Cache-Control "{self.STATIC_CACHE}";',
+                    "    }",
+                    "    location / {",
+                    *proxy,
+                    "    }",
+                ]
+            blocks.append("\n".join([
+                "server {",
+                "    listen 80;",
+                f"    server_name {server_name};",
+                "    client_max_body_size 0;",
+                *body,
+                "}",
+            ]))
+        return "\n\n".join(blocks) + "\n"
+
+    def files(self) -> dict[str, str]:
+        """Return {path relative to the config dir: contents} for the chosen gateway."""
+        if self.config.gateway == "traefik":
+            return {"traefik/dynamic/astro.yml": yaml.dump(self.traefik_dynamic(), default_flow_style=False, sort_keys=False)}
+        if self.config.gateway == "nginx-proxy-manager":
+            return {"npm/data/nginx/custom/http.conf": self.nginx_servers()}
+        return {}
+
+
+class Topology:
+    """Spreads the stack over named hosts, e.g. a download node and a streaming node.
+
+    Service classes are assigned to hosts in UserConfig.topology. Every
+    container gets extra_hosts entries naming the services on other hosts.
+    Those only resolve the name, so `qbittorrent:8080` in Sonarr reaches
+    a remote qBittorrent only because it is published on the port it
+    listens on; check() flags services where the two differ. Hosts other
+    than the one exporting data_share mount the library and download
+    trees from it over NFS or SMB.
+    """
+
+    SHARE_SCHEMES = ["nfs", "smb"]
+    # Classes other containers address by name, e.g. Sonarr calling sabnzbd:8085
+    REACHED_BY_NAME = ["media", "requests", "arr", "downloader"]
+
+    def __init__(self, config: UserConfig):
+        self.config = config
+        self.hosts = config.hosts
+        self.paths = StoragePaths(config)
+        self.share = urllib.parse.urlsplit(config.data_share) if config.data_share else None
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.hosts) > 1
+
+    @property
+    def primary(self) -> str:
+        return next(iter(self.hosts), "")
+
+    @property
+    def local(self) -> str:
+        """Return the name of the host this setup runs on."""
+        return self.config.this_host or self.primary
+
+    def host_of(self, name: str) -> str:
+        """Return the host a service runs on."""
+        for service_class, members in ComposeGenerator.SERVICE_CLASSES.items():
+            if name in members:
+                return self.config.topology.get(service_class, self.primary)
+        return self.primary
+
+    def address(self, name: str, default: str) -> str:
+        """Return the address a browser reaches a service at."""
+        return self.hosts[self.host_of(name)] if self.enabled else default
+
+    def mounts_share(self, host: str) -> bool:
+        """Return True if a host reaches the data trees over the network."""
+        return self.share is not None and self.hosts[host] != self.share.hostname
+
+    def share_volume(self, source: Path) -> tuple[str, dict]:
+        """Return the name and definition of a network volume for a data directory."""
+        relative = source.relative_to(self.paths.library_root)
+        path = f"{self.share.path.rstrip('/')}/{relative.as_posix()}"
+        if self.share.scheme == "nfs":
+            options = {"type": "nfs", "o": f"addr={self.share.hostname},rw,nfsvers=4.1,hard,noatime",
+                       "device": f":{path}"}
+        else:
+            options = {"type": "cifs", "device": f"//{self.share.hostname}{path}",
+                       "o": f"addr={self.share.hostname},uid={self.config.puid},gid={self.config.pgid},"
+                            "file_mode=0664,dir_mode=0775"}
+        if self.config.data_share_options:
+            options["o"] += f",{self.config.data_share_options}"
+        return "astro-" + "-".join(relative.parts), {"driver": "local", "driver_opts": options}
+
+    def _remote_mount(self, volume, volumes: dict):
+        """Swap a bind mount of a shared data directory for a network volume."""
+        if not isinstance(volume, str):
+            # Long-form entries such as the /transcode tmpfs hold no host path
+            return volume
+        source, _, rest = volume.partition(":")
+        for root in self.paths.shared_dirs():
+            if Path(source).is_relative_to(root):
+                name, definition = self.share_volume(Path(source))
+                volumes[name] = definition
+                return f"{name}:{rest}"
+        return volume
+
+    def split(self, compose: dict) -> dict[str, dict]:
+        """Return {host: compose} with cross-host names and shared volumes wired in."""
+        hosts = {host: {"services": {}, "networks": compose["networks"]} for host in self.hosts}
+        for name, service in compose["services"].items():
+            hosts[self.host_of(name)]["services"][name] = copy.deepcopy(service)
+
+        for host, part in hosts.items():
+            services = part["services"]
+            remote = {
+                service.get("container_name", name): self.hosts[other]
+                for other, other_part in hosts.items() if other != host
+                for name, service in other_part["services"].items()
+            }
+            volumes = {}
+            for name, service in services.items():
+                # Compose can only wait on services in the same file
+                depends = {dep: cond for dep, cond in service.pop("depends_on", {}).items() if dep in services}
+                if depends:
+                    service["depends_on"] = depends
+                if remote and service.get("network_mode") != "host":
+                    service["extra_hosts"] = service.get("extra_hosts", []) + [
+                        f"{other}:{address}" for other, address in remote.items()]
+                if self.mounts_share(host):
+                    service["volumes"] = [self._remote_mount(v, volumes) for v in service.get("volumes", [])]
+            if volumes:
+                part["volumes"] = volumes
+        return hosts
+
+    def _reached_by_name(self) -> set[str]:
+        return {name for service_class in self.REACHED_BY_NAME
+                for name in ComposeGenerator.SERVICE_CLASSES[service_class]}
+
+    @staticmethod
+    def _published(service: dict) -> list[str]:
+        """Return a service's published host ports as port/protocol."""
+        if service.get("network_mode") == "host":
+            return []
+        published = []
+        for port in map(str, service.get("ports", [])):
+            mapping, _, protocol = port.partition("/")
+            if ":" in mapping:
+                published.append(f"{mapping.rsplit(':', 1)[0]}/{protocol or 'tcp'}")
+        return published
+
+    def check(self, hosts: dict[str, dict]) -> list[str]:
+        """Return problems in generated per-host configs that would stop them deploying."""
+        problems = []
+        owners: dict[str, str] = {}
+        for host, part in hosts.items():
+            ports: dict[str, str] = {}
+            for name, service in part["services"].items():
+                if name in owners:
+                    problems.append(f"{name}: on both {owners[name]} and {host}")
+                owners[name] = host
+                for port in self._published(service):
+                    if port in ports:
+                        problems.append(f"{host}: {name} and {ports[port]} both publish port {port}")
+                    ports[port] = name
+                if name in self._reached_by_name() and service.get("network_mode") != "host":
+                    for mapping in map(str, service.get("ports", [])):
+                        published, _, listen = mapping.partition("/")[0].rpartition(":")
+                        published = published.rsplit(":", 1)[-1]
+                        if published and published != listen:
+                            problems.append(f"{host}: {name} publishes port {listen} as {published}; "
+                                            f"other hosts reaching {name}:{listen} would hit port {listen} of {host}")
+                for dep in service.get("depends_on", {}):
+                    if dep not in part["services"]:
+                        problems.append(f"{host}: {name} depends on {dep}, which is not on this host")
+                for volume in service.get("volumes", []):
+                    if isinstance(volume, dict):
+                        source = volume.get("source") if volume.get("type") == "volume" else None
+                        if source and source not in part.get("volumes", {}):
+                            problems.append(f"{host}: {name} mounts undefined volume {source}")
+                        continue
+                    source = str(volume).split(":")[0]
+                    if not source.startswith("/") and source not in part.get("volumes", {}):
+                        problems.append(f"{host}: {name} mounts undefined volume {source}")
+                    elif self.mounts_share(host) and any(
+                            Path(source).is_relative_to(root) for root in self.paths.shared_dirs()):
+                        problems.append(f"{host}: {name} bind-mounts shared data {source} from the local disk")
+                for entry in service.get("extra_hosts", []):
+                    address = entry.rsplit(":", 1)[1]
+                    if address not in self.hosts.values() and address != "host-gateway":
+                        problems.append(f"{host}: {name} points {entry} at an unknown host")
+        return problems
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over the Docker daemon's unix socket."""
+
+    def __init__(self, socket_path: str = DOCKER_SOCKET, timeout: float = 300):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class ImagePuller:
+    """Pulls container images concurrently with per-layer byte progress.
+
+    Pulls go straight to the Docker Engine API so every layer reports
+    current/total bytes. A bounded worker pool keeps registries from
+    throttling us; failed pulls are retried with exponential backoff.
+    Cancelling closes in-flight connections, which makes the daemon
+    abort those pulls, so worker threads exit promptly.
+    """
+
+    def __init__(self, workers: int = PULL_WORKERS, retries: int = PULL_RETRIES, socket_path: str = DOCKER_SOCKET):
+        self.retries = retries
+        self.socket_path = socket_path
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pull")
+        self.futures: dict[str, Future] = {}
+        self.layers: dict[str, dict[str, tuple[int, int]]] = {}
+        self.errors: dict[str, str] = {}
+        self.lock = threading.Lock()
+        self.connections: set[_UnixHTTPConnection] = set()
+        self.cancelled = threading.Event()
+
+    @staticmethod
+    def _split_ref(image: str) -> dict:
+        """Split an image reference into Engine API query parameters."""
+        if "@" in image:
+            return {"fromImage": image}
+        name, sep, tag = image.rpartition(":")
+        if not sep or "/" in tag:
+            return {"fromImage": image, "tag": "latest"}
+        return {"fromImage": name, "tag": tag}
+
+    def _record(self, image: str, event: dict) -> None:
+        """Update layer byte counters from a single pull progress event."""
+        layer = event.get("id")
+        status = event.get("status", "")
+        # "Pulling from <repo>" events carry the tag as their id, not a layer
+        if not layer or status.startswith("Pulling from"):
+            return
+        with self.lock:
+            layers = self.layers.setdefault(image, {})
+            current, total = layers.get(layer, (0, 0))
+            detail = event.get("progressDetail") or {}
+            if status == "Downloading" and detail.get("total"):
+                layers[layer] = (detail.get("current", 0), detail["total"])
+            elif status in ("Download complete", "Pull complete", "Already exists"):
+                layers[layer] = (total, total) if total else (1, 1)
+            elif layer not in layers:
+                layers[layer] = (0, 0)
+
+    def _pull_once(self, image: str) -> None:
+        """Pull an image through the Engine API, streaming progress events."""
+        conn = _UnixHTTPConnection(self.socket_path)
+        with self.lock:
+            if self.cancelled.is_set():
+                raise RuntimeError("cancelled")
+            self.connections.add(conn)
+        try:
+            query = urllib.parse.urlencode(self._split_ref(image))
+            conn.request("POST", f"/images/create?{query}")
+            response = conn.getresponse()
+            if response.status != 200:
+                raise RuntimeError(f"HTTP {response.status}: {response.read().decode(errors='replace').strip()}")
+            for line in response:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if "error" in event:
+                    raise RuntimeError(event["error"])
+                self._record(image, event)
+            if self.cancelled.is_set():
+                # The stream ends cleanly when shutdown() closes the socket
+                raise RuntimeError("cancelled")
+        finally:
+            with self.lock:
+                self.connections.discard(conn)
+            conn.close()
+
+    def _pull(self, image: str) -> bool:
+        """Pull an image, retrying with backoff. Returns True on success."""
+        for attempt in range(1, self.retries + 1):
+            try:
+                self._pull_once(image)
+                with self.lock:
+                    self.errors.pop(image, None)
+                return True
+            except (OSError, RuntimeError, ValueError, http.client.HTTPException) as e:
+                with self.lock:
+                    self.errors[image] = str(e)
+                if attempt < self.retries and self.cancelled.wait(2 ** attempt):
+                    break
+        return False
+
+    def submit(self, images: Iterable[str]) -> None:
+        """Queue images for pulling; images already queued are skipped."""
+        for image in images:
+            if image not in self.futures:
+                self.futures[image] = self.executor.submit(self._pull, image)
+
+    def done(self) -> bool:
+        """Return True once every queued pull has finished."""
+        return all(f.done() for f in self.futures.values())
+
+    def progress(self) -> tuple[int, str]:
+        """Return overall (percent, status text) across all queued pulls."""
+        with self.lock:
+            finished = [i for i, f in self.futures.items() if f.done()]
+            fraction = 0.0
+            current_bytes = total_bytes = 0
+            for image in self.futures:
+                layers = self.layers.get(image, {}).values()
+                current = sum(c for c, _ in layers)
+                total = sum(t for _, t in layers)
+                current_bytes += current
+                total_bytes += total
+                if image in finished:
+                    fraction += 1.0
+                elif total:
+                    # Reserve the last 10% of each image for extraction
+                    fraction += 0.9 * current / total
+        count = len(self.futures) or 1
+        percent = int(100 * fraction / count)
+        text = (
+            f"Pulling container images ({len(finished)}/{len(self.futures)} done)\n"
+            f"{current_bytes / 1e6:,.0f} MB of {total_bytes / 1e6:,.0f} MB downloaded"
+        )
+        return percent, text
+
+    def watch(self, interval: float = 0.5) -> Iterable[tuple[int, str]]:
+        """Yield progress updates until every queued pull has finished."""
+        while not self.done():
+            yield self.progress()
+            # Wakes early once the last pull lands instead of sleeping out the interval
+            wait(list(self.futures.values()), timeout=interval, return_when=ALL_COMPLETED)
+        yield self.progress()
+
+    def shutdown(self, cancel: bool = False) -> None:
+        """Stop accepting work, optionally aborting pulls in flight and dropping queued ones."""
+        if cancel:
+            with self.lock:
+                self.cancelled.set()
+                connections = list(self.connections)
+            for conn in connections:
+                if conn.sock:
+                    try:
+                        conn.sock.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+        self.executor.shutdown(wait=not cancel, cancel_futures=cancel)
+
+
+class ReadinessGate:
+    """Polls service web UIs concurrently until each one is serving.
+
+    A service is ready once its port answers HTTP with anything other than
+    a 5xx, so login pages count but proxy 502s do not.
+    """
+
+    # Probe paths that respond without authentication
+    PATHS = {
+        "plex": "/identity",
+        "jellyfin": "/health",
+        "radarr": "/ping",
+        "sonarr": "/ping",
+        "lidarr": "/ping",
+        "prowlarr": "/ping",
+        "homepage": "/api/healthcheck",
+        "astro-metrics": "/metrics",
+    }
+
+    def __init__(self, targets: dict[str, str], timeout: float = READY_TIMEOUT):
+        self.targets = targets
+        self.timeout = timeout
+        self.started = time.monotonic()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(targets)), thread_name_prefix="ready")
+        self.futures: dict[str, Future] = {}
+
+    @classmethod
+    def from_compose(cls, compose: dict, timeout: float = READY_TIMEOUT) -> "ReadinessGate":
+        """Build probe URLs from each service's published port."""
+        targets = {}
+        for name, svc in compose["services"].items():
+            if svc.get("network_mode") == "host" and name == "plex":
+                port = "32400"
+            elif svc.get("ports"):
+                port = str(svc["ports"][0]).split(":")[0]
+            else:
+                continue
+            targets[name] = f"http://127.0.0.1:{port}{cls.PATHS.get(name, '/')}"
+        return cls(targets, timeout)
+
+    def _wait(self, url: str) -> Optional[float]:
+        """Poll a URL with backoff. Returns seconds until it served, or None."""
+        delay = 0.5
+        while time.monotonic() - self.started < self.timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=5):
+                    return time.monotonic() - self.started
+            except urllib.error.HTTPError as e:
+                if e.code < 500:
+                    return time.monotonic() - self.started
+            except (OSError, http.client.HTTPException):
+                pass
+            time.sleep(delay)
+            delay = min(delay * 2, 5)
+        return None
+
+    def start(self) -> None:
+        """Begin probing every target in parallel."""
+        for name, url in self.targets.items():
+            self.futures[name] = self.executor.submit(self._wait, url)
+
+    def watch(self, interval: float = 1) -> Iterable[tuple[int, str]]:
+        """Yield progress updates until every service is ready or timed out."""
+        while True:
+            done = [name for name, f in self.futures.items() if f.done()]
+            waiting = [name for name in self.futures if name not in done]
+            percent = int(100 * len(done) / (len(self.futures) or 1))
+            text = f"Waiting for services to start ({len(done)}/{len(self.futures)} ready)"
+            if waiting:
+                text += f"\nStill starting: {', '.join(waiting[:4])}"
+            yield percent, text
+            if not waiting:
+                return
+            wait([self.futures[name] for name in waiting], timeout=interval, return_when=FIRST_COMPLETED)
+
+    def results(self) -> dict[str, Optional[float]]:
+        """Return {service: seconds to ready, or None if it never served}."""
+        times = {name: f.result() for name, f in self.futures.items()}
+        self.executor.shutdown(wait=False)
+        return {name: round(t, 1) if t is not None else None for name, t in times.items()}
+
+    @staticmethod
+    def record(results: dict[str, Optional[float]], path: Path = STARTUP_LOG) -> None:
+        """Append a run's per-service startup times to the history file."""
+        history = []
+        if path.exists():
+            try:
+                history = json.loads(path.read_text())
+            except ValueError:
+                history = []
+        history.append({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "services": results})
+        path.write_text(json.dumps(history[-READY_HISTORY:], indent=2))
+
+
+class ImageBundle:
+    """Offline image bundle of content-addressed, gzip-compressed blobs.
+
+    Built from a single `docker save` of every image so shared layers are
+    stored once. Loading streams a tar containing only the blobs the
+    requested images reference into `docker load`.
+    """
+
+    INDEX = "bundle.json"
+
+    def __init__(self, path: Path = IMAGE_BUNDLE_DIR):
+        self.path = Path(path)
+        self.index = {"images": {}, "blobs": {}}
+        if (self.path / self.INDEX).exists():
+            with open(self.path / self.INDEX) as f:
+                self.index = json.load(f)
+
+    def contains(self, image: str) -> bool:
+        """Return True if the bundle holds the given image reference."""
+        return image in self.index["images"]
+
+    def _store_blob(self, member: BinaryIO, blobs_dir: Path) -> tuple[str, int]:
+        """Compress an extracted tar member into the blob store, returning (digest, size)."""
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=blobs_dir, delete=False) as tmp:
+            with gzip.GzipFile(fileobj=tmp, mode="wb", compresslevel=6, mtime=0) as gz:
+                while chunk := member.read(1 << 20):
+                    digest.update(chunk)
+                    gz.write(chunk)
+                    size += len(chunk)
+        key = digest.hexdigest()
+        target = blobs_dir / f"{key}.gz"
+        if target.exists():
+            os.unlink(tmp.name)
+        else:
+            os.rename(tmp.name, target)
+        return key, size
+
+    def build(self, images: Iterable[str]) -> None:
+        """Pull and save images, then store them as a de-duplicated bundle."""
+        images = list(images)
+        blobs_dir = self.path / "blobs"
+        blobs_dir.mkdir(parents=True, exist_ok=True)
+
+        for image in images:
+            subprocess.run(["docker", "pull", image], check=True)
+
+        paths: dict[str, tuple[str, int]] = {}
+        manifest = []
+        save = subprocess.Popen(["docker", "save", *images], stdout=subprocess.PIPE)
+        with tarfile.open(fileobj=save.stdout, mode="r|") as archive:
+            for entry in archive:
+                if not entry.isfile():
+                    continue
+                name = os.path.normpath(entry.name)
+                if name == "manifest.json":
+                    manifest = json.load(archive.extractfile(entry))
+                else:
+                    paths[name] = self._store_blob(archive.extractfile(entry), blobs_dir)
+        if save.wait() != 0:
+            raise RuntimeError("docker save failed")
+
+        self.index = {"images": {}, "blobs": {}}
+        for entry in manifest:
+            config = os.path.normpath(entry["Config"])
+            layers = [os.path.normpath(name) for name in entry["Layers"]]
+            for tag in entry.get("RepoTags") or []:
+                self.index["images"][tag] = {"config": paths[config][0],
+                                             "layers": [paths[name][0] for name in layers]}
+            for name in [config, *layers]:
+                key, size = paths[name]
+                self.index["blobs"][key] = size
+
+        missing = [image for image in images if image not in self.index["images"]]
+        if missing:
+            raise RuntimeError(f"Images missing from docker save output: {', '.join(missing)}")
+
+        # Drop OCI index/manifest blobs that no image config or layer references
+        for blob in blobs_dir.glob("*.gz"):
+            if blob.name[:-3] not in self.index["blobs"]:
+                blob.unlink()
+
+        with open(self.path / self.INDEX, "w") as f:
+            json.dump(self.index, f, indent=2)
+
+    def _add_blob(self, archive: tarfile.TarFile, key: str) -> str:
+        """Decompress a blob into the outgoing tar stream, returning its name."""
+        name = f"blobs/sha256/{key}"
+        info = tarfile.TarInfo(name)
+        info.size = self.index["blobs"][key]
+        with gzip.open(self.path / "blobs" / f"{key}.gz", "rb") as blob:
+            archive.addfile(info, blob)
+        return name
+
+    def load(self, images: Iterable[str]) -> list[str]:
+        """Load the bundled subset of images into Docker. Returns loaded refs."""
+        wanted = [image for image in images if self.contains(image)]
+        if not wanted:
+            return []
+
+        load = subprocess.Popen(["docker", "load", "--quiet"], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+        added: dict[str, str] = {}
+        manifest = []
+        with tarfile.open(fileobj=load.stdin, mode="w|") as archive:
+            for image in wanted:
+                entry = self.index["images"][image]
+                for key in [entry["config"], *entry["layers"]]:
+                    if key not in added:
+                        added[key] = self._add_blob(archive, key)
+                manifest.append({
+                    "Config": added[entry["config"]],
+                    "RepoTags": [image],
+                    "Layers": [added[key] for key in entry["layers"]],
+                })
+            data = json.dumps(manifest).encode()
+            info = tarfile.TarInfo("manifest.json")
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+        load.stdin.close()
+        if load.wait() != 0:
+            raise RuntimeError("docker load failed")
+        return wanted
+
+
+class ImageLock:
+    """Image digests that deployments are pinned to.
+
+    Compose files name images as repo@sha256:..., so starting or recreating
+    a container never re-resolves a tag against the registry. An update
+    resolves each tag with a manifest lookup that downloads no layers, and
+    only services whose digest moved are pulled. The lock being replaced
+    is kept beside it for rollback.
+    """
+
+    def __init__(self, path: Path = IMAGE_LOCK, socket_path: str = DOCKER_SOCKET):
+        self.path = path
+        self.previous_path = path.with_name(path.name + ".prev")
+        self.socket_path = socket_path
+        self.images = self._read(path)
+
+    @staticmethod
+    def _read(path: Path) -> dict[str, str]:
+        """Return {tag: digest} from a lock file, or nothing if there is none."""
+        try:
+            return json.loads(path.read_text())["images"]
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    @staticmethod
+    def repository(tag: str) -> str:
+        """Return an image reference without its tag."""
+        name, sep, version = tag.rpartition(":")
+        return name if sep and "/" not in version else tag
+
+    def pin(self, image: str) -> str:
+        """Return the digest reference for a tag, or the tag if it is not locked."""
+        digest = self.images.get(image)
+        return f"{self.repository(image)}@{digest}" if digest else image
+
+    def unpin(self, image: str) -> str:
+        """Return the tag a pinned reference was resolved from."""
+        return next((tag for tag in self.images if self.pin(tag) == image), image)
+
+    def _get(self, path: str) -> Optional[dict]:
+        conn = _UnixHTTPConnection(self.socket_path, timeout=60)
+        try:
+            conn.request("GET", urllib.parse.quote(path, safe="/:@"))
+            response = conn.getresponse()
+            body = response.read()
+            return json.loads(body) if response.status == 200 else None
+        except (OSError, ValueError, http.client.HTTPException):
+            return None
+        finally:
+            conn.close()
+
+    def local_digest(self, tag: str) -> Optional[str]:
+        """Return the registry digest a locally pulled tag came from."""
+        info = self._get(f"/images/{tag}/json") or {}
+        for ref in info.get("RepoDigests") or []:
+            repository, _, digest = ref.partition("@")
+            if repository == self.repository(tag):
+                return digest
+        # Loaded from a bundle: the tarball carries no registry digest
+        return None
+
+    def remote_digest(self, tag: str) -> Optional[str]:
+        """Return the digest a tag currently points to, fetching only its manifest."""
+        info = self._get(f"/distribution/{tag}/json") or {}
+        return info.get("Descriptor", {}).get("digest")
+
+    def record(self, tags: Iterable[str]) -> list[str]:
+        """Lock newly deployed tags at the digest they were pulled at."""
+        added = []
+        for tag in tags:
+            if tag not in self.images and (digest := self.local_digest(tag)):
+                self.images[tag] = digest
+                added.append(tag)
+        if added:
+            self._write(self.path, self.images)
+        return added
+
+    def resolve(self, tags: Iterable[str]) -> tuple[dict[str, str], list[str]]:
+        """Look up current digests for tags in parallel; return them and the tags that failed."""
+        tags = list(dict.fromkeys(tags))
+        with ThreadPoolExecutor(max_workers=PULL_WORKERS, thread_name_prefix="resolve") as pool:
+            digests = dict(zip(tags, pool.map(self.remote_digest, tags)))
+        return {tag: d for tag, d in digests.items() if d}, [tag for tag, d in digests.items() if not d]
+
+    def update(self, digests: dict[str, str]) -> dict[str, dict[str, Optional[str]]]:
+        """Move tags to new digests, keeping the current lock for rollback; return what moved."""
+        changed = {tag: {"from": self.images.get(tag), "to": digest}
+                   for tag, digest in digests.items() if self.images.get(tag) != digest}
+        if changed:
+            if self.path.exists():
+                os.replace(self.path, self.previous_path)
+            self.images = {**self.images, **digests}
+            self._write(self.path, self.images)
+        return changed
+
+    def rollback(self, dry_run: bool = False) -> dict[str, dict[str, Optional[str]]]:
+        """Swap the lock with the previous one; return what moved. Raises FileNotFoundError."""
+        previous = self._read(self.previous_path)
+        if not previous:
+            raise FileNotFoundError(f"no previous image lock at {self.previous_path}")
+        changed = {tag: {"from": self.images.get(tag), "to": digest}
+                   for tag, digest in previous.items() if self.images.get(tag) != digest}
+        if dry_run:
+            return changed
+        tmp = self.path.with_name(self.path.name + ".swap")
+        os.replace(self.path, tmp)
+        os.replace(self.previous_path, self.path)
+        os.replace(tmp, self.previous_path)
+        self.images = previous
+        return changed
+
+    @staticmethod
+    def _write(path: Path, images: dict[str, str]) -> None:
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps({"resolved": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "images": images}, indent=2))
+        os.replace(tmp, path)
+
+
+class SessionMonitor:
+    """Counts active playback sessions through the media server's API.
+
+    Plex authenticates with the token in its Preferences.xml; Jellyfin and
+    Emby need media_server_api_key. Any failure reads as an unknown count.
+    Failures that waiting cannot fix, a missing or rejected key, are also
+    left in `error` so callers can give up at once.
+    """
+
+    def __init__(self, server: str, url: str, token: str = ""):
+        self.server = server
+        self.url = url.rstrip("/")
+        self.token = token
+        self.error = ""
+
+    @classmethod
+    def from_config(cls, config: "UserConfig", compose: dict) -> Optional["SessionMonitor"]:
+        """Build a monitor for the deployed media server, if any."""
+        server = config.media_server
+        svc = compose["services"].get(server)
+        if svc is None:
+            return None
+        if svc.get("network_mode") == "host" and server == "plex":
+            port = "32400"
+        elif svc.get("ports"):
+            port = str(svc["ports"][0]).split(":")[0]
+        else:
+            return None
+
+        token = config.media_server_api_key
+        if server == "plex" and not token:
+            prefs = (StoragePaths(config).config_dir / "plex" / "Library" / "Application Support"
+                     / "Plex Media Server" / "Preferences.xml")
+            try:
+                token = ET.parse(prefs).getroot().get("PlexOnlineToken", "")
+            except (OSError, ET.ParseError):
+                token = ""
+        return cls(server, f"http://127.0.0.1:{port}", token)
+
+    def active_sessions(self) -> Optional[int]:
+        """Return the number of streams playing now, or None if unknown."""
+        self.error = ""
+        if self.server != "plex" and not self.token:
+            self.error = f"no media_server_api_key set, so {self.server.title()} sessions cannot be checked"
+            return None
+        if self.server == "plex":
+            request = urllib.request.Request(
+                f"{self.url}/status/sessions",
+                headers={"Accept": "application/json", "X-Plex-Token": self.token},
+            )
+        else:
+            request = urllib.request.Request(
+                f"{self.url}/Sessions?activeWithinSeconds=960",
+                headers={"Accept": "application/json", "X-Emby-Token": self.token},
+            )
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                data = json.load(response)
+            if self.server == "plex":
+                return int(data["MediaContainer"].get("size", 0))
+            return sum(1 for session in data if session.get("NowPlayingItem"))
+        except urllib.error.HTTPError as e:
+            if e.code in (401, 403):
+                self.error = f"{self.server.title()} rejected the API key (HTTP {e.code})"
+            return None
+        except (OSError, ValueError, KeyError, TypeError, AttributeError, http.client.HTTPException):
+            return None
+
+
+def wait_healthy(container: str, timeout: float = UPDATE_HEALTH_TIMEOUT) -> bool:
+    """Poll a (re)started container until it runs and its healthcheck passes."""
+    deadline = time.monotonic() + timeout
+    delay = 1.0
+    while time.monotonic() < deadline:
+        result = subprocess.run(
+            ["docker", "inspect", "--format", "{{.State.Running}} {{if .State.Health}}{{.State.Health.Status}}{{end}}",
+             container],
+            capture_output=True, text=True,
+        )
+        running, _, health = result.stdout.strip().partition(" ")
+        if running == "true" and health in ("", "healthy"):
+            return True
+        time.sleep(delay)
+        delay = min(delay * 2, 10)
+    return False
+
+
+class UpdateCoordinator:
+    """Rolls image updates through the stack a batch at a time.
+
+    Batches follow depends_on order, so a dependency is updated and healthy
+    before its dependents restart. Pulls are limited to one batch at a
+    time, and the media server waits until nobody is watching.
+    """
+
+    TIMER = "astro-update.timer"
+    SERVICE = "astro-update.service"
+
+    def __init__(self, compose: dict, batch_size: int = 1, window: Optional[str] = None,
+                 monitor: Optional[SessionMonitor] = None, health_timeout: float = UPDATE_HEALTH_TIMEOUT,
+                 only: Optional[Iterable[str]] = None):
+        self.services = {name: svc for name, svc in compose["services"].items() if "image" in svc}
+        if only is not None:
+            only = set(only)
+            self.services = {name: svc for name, svc in self.services.items() if name in only}
+        self.batch_size = max(1, batch_size)
+        self.window = self.parse_window(window) if window else None
+        self.monitor = monitor
+        self.health_timeout = health_timeout
+        self.puller = ImagePuller(workers=self.batch_size)
+
+    @staticmethod
+    def parse_window(window: str) -> tuple[dtime, dtime]:
+        """Parse "HH:MM-HH:MM" into start and end times. Raises ValueError."""
+        start, end = window.split("-")
+        return dtime.fromisoformat(start.strip()), dtime.fromisoformat(end.strip())
+
+    def in_window(self, now: Optional[datetime] = None) -> bool:
+        """Return True while updates are allowed."""
+        return self.window is None or self.window_open(self.window, now)
+
+    @staticmethod
+    def window_open(window: tuple[dtime, dtime], now: Optional[datetime] = None) -> bool:
+        """Return True if now falls inside a parsed window; windows may cross midnight."""
+        start, end = window
+        current = (now or datetime.now()).time()
+        if start <= end:
+            return start <= current < end
+        return current >= start or current < end
+
+    def batches(self) -> list[list[str]]:
+        """Group services into batches, dependencies first, in compose order."""
+        remaining = list(self.services)
+        done: set[str] = set()
+        batches = []
+        while remaining:
+            ready = [name for name in remaining
+                     if all(dep in done or dep not in self.services
+                            for dep in self.services[name].get("depends_on", {}))]
+            if not ready:
+                ready = remaining[:]  # dependency cycle; fall back to compose order
+            for i in range(0, len(ready), self.batch_size):
+                batches.append(ready[i:i + self.batch_size])
+            done.update(ready)
+            remaining = [name for name in remaining if name not in done]
+        return batches
+
+    def _container(self, name: str) -> str:
+        return self.services[name].get("container_name", name)
+
+    @staticmethod
+    def drifted(compose: dict) -> list[str]:
+        """Return services whose container was created from another image reference than compose names."""
+        drifted = []
+        for name, svc in compose["services"].items():
+            if "image" not in svc:
+                continue
+            result = subprocess.run(["docker", "inspect", "--format", "{{.Config.Image}}", svc.get("container_name", name)],
+                                    capture_output=True, text=True)
+            if result.stdout.strip() != svc["image"]:
+                drifted.append(name)
+        return drifted
+
+    def _outdated(self, names: list[str]) -> list[str]:
+        """Return services whose container runs another image than the compose reference."""
+        outdated = []
+        for name in names:
+            reference = self.services[name]["image"]
+            image = subprocess.run(["docker", "image", "inspect", "--format", "{{.Id}}", reference],
+                                   capture_output=True, text=True)
+            running = subprocess.run(["docker", "inspect", "--format", "{{.Image}} {{.Config.Image}}", self._container(name)],
+                                     capture_output=True, text=True)
+            image_id, _, created_from = running.stdout.strip().partition(" ")
+            # A newly pinned digest of the same image still needs the container to adopt the pin
+            if image.returncode == 0 and (image.stdout.strip() != image_id or created_from != reference):
+                outdated.append(name)
+        return outdated
+
+    def _wait_healthy(self, name: str) -> bool:
+        """Poll a restarted container until its healthcheck passes."""
+        return wait_healthy(self._container(name), self.health_timeout)
+
+    def _update(self, batch: list[str], report: dict) -> None:
+        """Pull one batch, recreate what changed, and confirm it came back healthy."""
+        self.puller.submit(self.services[name]["image"] for name in batch)
+        for _ in self.puller.watch(interval=2):
+            pass
+        for name in batch:
+            image = self.services[name]["image"]
+            if image in self.puller.errors:
+                report["failed"][name] = f"pull failed: {self.puller.errors[image]}"
+
+        outdated = self._outdated([name for name in batch if name not in report["failed"]])
+        report["current"] += [name for name in batch if name not in outdated and name not in report["failed"]]
+        if not outdated:
+            return
+
+        result = subprocess.run(["docker", "compose", "-f", str(COMPOSE_FILE), "up", "-d", "--no-deps", *outdated],
+                                cwd=str(ASTRO_DIR), capture_output=True, text=True)
+        for name in outdated:
+            if result.returncode != 0:
+                report["failed"][name] = result.stderr.strip() or "docker compose up failed"
+            elif self._wait_healthy(name):
+                report["updated"].append(name)
+            else:
+                report["failed"][name] = f"not healthy after {self.health_timeout:.0f}s"
+
+    def _media_busy(self, name: str) -> bool:
+        """Return True if this is the media server and it may be streaming."""
+        if self.monitor is None or name != self.monitor.server:
+            return False
+        # An unknown count is treated as busy, so playback is never cut off
+        return self.monitor.active_sessions() != 0
+
+    def run(self) -> dict:
+        """Update every service, returning updated/current/deferred/failed lists."""
+        report = {"updated": [], "current": [], "deferred": [], "deferred_reasons": {}, "failed": {}}
+        waiting: list[str] = []
+        batches = self.batches()
+        for i, batch in enumerate(batches):
+            if not self.in_window():
+                report["deferred"] += [name for rest in batches[i:] for name in rest]
+                break
+            # Leave dependents of a failed update on their working version
+            blocked = [name for name in batch
+                       if set(self.services[name].get("depends_on", {})) & set(report["failed"])]
+            report["deferred"] += blocked
+            waiting += [name for name in batch if name not in blocked and self._media_busy(name)]
+            batch = [name for name in batch if name not in blocked and name not in waiting]
+            if batch:
+                self._update(batch, report)
+
+        while waiting and self.in_window():
+            if not self._media_busy(waiting[0]):
+                self._update(waiting, report)
+                waiting = []
+            elif self.monitor.error:
+                # Polling until the window closes would not change the answer
+                break
+            else:
+                time.sleep(SESSION_POLL_INTERVAL)
+        report["deferred"] += waiting
+        for name in waiting:
+            report["deferred_reasons"][name] = (f"session check unavailable: {self.monitor.error}" if self.monitor.error
+                                                else "streams were playing until the window closed")
+
+        self.puller.shutdown()
+        if report["updated"]:
+            subprocess.run(["docker", "image", "prune", "-f"], capture_output=True)
+        return report
+
+    @classmethod
+    def units(cls, window: str, command: list[str]) -> dict[str, str]:
+        """Return {unit file name: contents} for the nightly update timer.
+
+        Updates start a minute into the window, so on maintenance nights
+        the database job is already running and systemd queues the update
+        behind it instead of the two racing for the maintenance lock.
+        """
+        start, _ = cls.parse_window(window)
+        begin = (datetime.combine(datetime.min, start) + timedelta(minutes=1)).time()
+        return {
+            cls.SERVICE: f"""[Unit]
+Description=AstroMediaServer rolling container updates
+Requires=docker.service
+After=docker.service {DatabaseMaintenance.SERVICE}
+
+[Service]
+Type=oneshot
+ExecStart={" ".join(command)}
+""",
+            cls.TIMER: f"""[Unit]
+Description=AstroMediaServer rolling container updates
+
+[Timer]
+OnCalendar=*-*-* {begin.strftime("%H:%M")}:00
+AccuracySec=1s
+
+[Install]
+WantedBy=timers.target
+""",
+        }
+
+
+class DatabaseMaintenance:
+    """Compacts and prunes the SQLite databases of the *arr apps and request managers.
+
+    Services are handled strictly one at a time: the container is stopped,
+    each of its databases is checkpointed, integrity-checked, pruned,
+    vacuumed and analyzed, and the container must be healthy again before
+    the next one is stopped. A database that fails its integrity check is
+    left untouched.
+    """
+
+    SERVICES = ["sonarr", "radarr", "lidarr", "prowlarr", "overseerr", "jellyseerr", "ombi"]
+    # (table, timestamp column, retention setting); absent tables are skipped
+    PRUNE = [
+        ("Logs", "Time", "db_log_days"),
+        ("Commands", "EndedAt", "db_log_days"),
+        ("History", "Date", "db_history_days"),
+        ("DownloadHistory", "Date", "db_history_days"),
+        ("RequestLog", "RequestDate", "db_history_days"),
+    ]
+    STOP_TIMEOUT = 60
+    TIMER = "astro-dbmaint.timer"
+    SERVICE = "astro-dbmaint.service"
+
+    def __init__(self, compose: dict, config_dir: Path, retention: dict[str, int], window: Optional[str] = None,
+                 health_timeout: float = UPDATE_HEALTH_TIMEOUT):
+        self.services = {name: compose["services"][name] for name in self.SERVICES if name in compose["services"]}
+        self.config_dir = Path(config_dir)
+        self.retention = retention
+        self.window = UpdateCoordinator.parse_window(window) if window else None
+        self.health_timeout = health_timeout
+
+    def databases(self, name: str) -> list[Path]:
+        """Return the SQLite databases in a service's config directory."""
+        found = []
+        root = self.config_dir / name
+        for path in sorted(root.glob("*")) + sorted(root.glob("*/*")):
+            if path.suffix not in (".db", ".sqlite", ".sqlite3") or not path.is_file():
+                continue
+            with open(path, "rb") as f:
+                if f.read(len(ConfigBackup.SQLITE_MAGIC)) == ConfigBackup.SQLITE_MAGIC:
+                    found.append(path)
+        return found
+
+    @staticmethod
+    def _stats(db: sqlite3.Connection, path: Path) -> dict:
+        """Return file size, free pages and the time to scan every table."""
+        tables = [row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        start = time.perf_counter()
+        rows = sum(db.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables)
+        scan_ms = (time.perf_counter() - start) * 1000
+        return {
+            "bytes": path.stat().st_size,
+            "free_pages": db.execute("PRAGMA freelist_count").fetchone()[0],
+            "rows": rows,
+            "scan_ms": round(scan_ms, 2),
+        }
+
+    def _prune(self, db: sqlite3.Connection) -> dict[str, int]:
+        """Delete rows older than their retention, returning counts per table."""
+        pruned = {}
+        for table, column, setting in self.PRUNE:
+            days = self.retention.get(setting, 0)
+            columns = [row[1] for row in db.execute(f'PRAGMA table_info("{table}")')]
+            if not days or column not in columns:
+                continue
+            # The apps store UTC timestamps as ISO-8601 text, which sorts chronologically
+            cutoff = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() - days * 86400))
+            with db:
+                deleted = db.execute(f'DELETE FROM "{table}" WHERE "{column}" < ?', (cutoff,)).rowcount
+            if deleted:
+                pruned[table] = deleted
+        return pruned
+
+    def maintain(self, path: Path) -> dict:
+        """Check, prune, compact and re-analyze one database, returning before/after stats."""
+        started = time.monotonic()
+        st = path.stat()
+        db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        try:
+            db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            result = {"before": self._stats(db, path)}
+            integrity = db.execute("PRAGMA integrity_check").fetchone()[0]
+            result["integrity"] = integrity
+            if integrity != "ok":
+                return result
+
+            result["pruned"] = self._prune(db)
+            # VACUUM writes a full temporary copy first
+            free = shutil.disk_usage(path.parent).free
+            if free > 2 * st.st_size:
+                db.execute("VACUUM")
+            else:
+                result["vacuum_skipped"] = f"needs {2 * st.st_size} bytes free, {free} available"
+            db.execute("ANALYZE")
+            db.execute("PRAGMA optimize")
+            db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            result["after"] = self._stats(db, path)
+        finally:
+            db.close()
+            # Leave any journal files this connection created to the app's user
+            for sidecar in [path, *(Path(f"{path}{suffix}") for suffix in ConfigBackup.SQLITE_SIDECARS)]:
+                if sidecar.exists():
+                    os.chown(sidecar, st.st_uid, st.st_gid)
+        result["seconds"] = round(time.monotonic() - started, 2)
+        return result
+
+    def _running(self, container: str) -> bool:
+        result = subprocess.run(["docker", "inspect", "--format", "{{.State.Running}}", container],
+                                capture_output=True, text=True)
+        return result.stdout.strip() == "true"
+
+    def run(self) -> dict:
+        """Maintain every service in turn, returning per-database results."""
+        report = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "services": {}, "deferred": [], "failed": {}}
+        names = list(self.services)
+        for i, name in enumerate(names):
+            if self.window and not UpdateCoordinator.window_open(self.window):
+                report["deferred"] += names[i:]
+                break
+            databases = self.databases(name)
+            if not databases:
+                continue
+
+            container = self.services[name].get("container_name", name)
+            running = self._running(container)
+            if running:
+                stopped = subprocess.run(["docker", "stop", "-t", str(self.STOP_TIMEOUT), container],
+                                         capture_output=True, text=True)
+                if stopped.returncode != 0:
+                    report["failed"][name] = stopped.stderr.strip() or "docker stop failed"
+                    continue
+
+            results = {}
+            try:
+                for path in databases:
+                    try:
+                        results[str(path.relative_to(self.config_dir))] = self.maintain(path)
+                    except (OSError, sqlite3.Error) as e:
+                        results[str(path.relative_to(self.config_dir))] = {"error": str(e)}
+            finally:
+                if running:
+                    subprocess.run(["docker", "start", container], capture_output=True)
+            report["services"][name] = results
+
+            # The next service is only stopped once this one is back
+            if running and not wait_healthy(container, self.health_timeout):
+                report["failed"][name] = f"not healthy after {self.health_timeout:.0f}s"
+                report["deferred"] += names[i + 1:]
+                break
+        return report
+
+    @staticmethod
+    def record(report: dict, path: Path = DB_MAINTENANCE_LOG) -> None:
+        """Append a run's report to the maintenance history file."""
+        history = []
+        if path.exists():
+            try:
+                history = json.loads(path.read_text())
+            except ValueError:
+                history = []
+        history.append(report)
+        path.write_text(json.dumps(history[-DB_MAINTENANCE_HISTORY:], indent=2))
+
+    @classmethod
+    def units(cls, window: str, command: list[str]) -> dict[str, str]:
+        """Return {unit file name: contents} for weekly maintenance in the update window."""
+        start, _ = UpdateCoordinator.parse_window(window)
+        return {
+            cls.SERVICE: f"""[Unit]
+Description=AstroMediaServer database maintenance
+Requires=docker.service
+After=docker.service
+
+[Service]
+Type=oneshot
+ExecStart={" ".join(command)}
+Nice=10
+IOSchedulingClass=idle
+""",
+            cls.TIMER: f"""[Unit]
+Description=AstroMediaServer database maintenance
+
+[Timer]
+OnCalendar=Sun *-*-* {start.strftime("%H:%M")}:00
+AccuracySec=1s
+
+[Install]
+WantedBy=timers.target
+""",
+        }
+
+
+class ManagedSettings:
+    """Merges generated keys into an application's own config file.
+
+    The values last written are remembered in a hidden sidecar file, so a
+    key the user has since changed in the application is left alone.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.record = path.with_name(f".{path.name}.astro.json")
+
+    def _previous(self) -> dict[str, str]:
+        try:
+            return json.loads(self.record.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def merge(self, current: dict[str, str], wanted: dict[str, str]) -> dict[str, str]:
+        """Return the wanted keys that are missing or still hold the value we last wrote."""
+        previous = self._previous()
+        return {key: value for key, value in wanted.items()
+                if key not in current or previous.get(key) == current[key]}
+
+    def commit(self, written: dict[str, str]) -> None:
+        """Remember the values just written."""
+        self.record.write_text(json.dumps({**self._previous(), **written}, indent=2, sort_keys=True))
+
+
+class DownloaderTuning:
+    """Sizes download client caches, threads and connection limits for the resources given."""
+
+    def __init__(self, resources: HostResources, rotational: bool):
+        self.cpus = max(1, resources.cpus)
+        self.memory_mb = resources.memory_mb or 2048
+        self.rotational = rotational
+
+    # Compose memory size suffixes, in MiB
+    MEMORY_UNITS = {"b": 1 / (1 << 20), "k": 1 / 1024, "m": 1, "g": 1024}
+
+    @classmethod
+    def for_container(cls, service: Optional[dict], host: HostResources, rotational: bool) -> "DownloaderTuning":
+        """Size for the cores and memory a container's limits leave it, or the host's without limits."""
+        cpus, memory_mb = host.cpus, host.memory_mb
+        service = service or {}
+        if service.get("cpuset"):
+            cpus = 0
+            for part in str(service["cpuset"]).split(","):
+                first, _, last = part.partition("-")
+                cpus += int(last or first) - int(first) + 1
+        elif service.get("cpus"):
+            cpus = math.ceil(float(service["cpus"]))
+        if service.get("mem_limit"):
+            limit = str(service["mem_limit"]).lower()
+            unit = cls.MEMORY_UNITS.get(limit[-1])
+            memory_mb = int(float(limit[:-1]) * unit) if unit else int(limit) >> 20
+        return cls(HostResources(cpus=cpus, memory_mb=memory_mb), rotational)
+
+    def qbittorrent(self, save_path: str, temp_path: str) -> dict[str, dict[str, str]]:
+        """Return qBittorrent.conf keys by section."""
+        cache_mb = min(2048, max(128, self.memory_mb // 16))
+        if self.rotational:
+            # Extra threads on one spindle only add seeks
+            aio_threads, hashing_threads = 8, 2
+        else:
+            aio_threads, hashing_threads = min(32, max(10, self.cpus * 4)), min(8, max(2, self.cpus // 2))
+        max_connections = min(1500, max(500, self.cpus * 150))
+        return {
+            "BitTorrent": {
+                "Session\\Port": "6881",
+                "Session\\DefaultSavePath": save_path,
+                "Session\\TempPath": temp_path,
+                "Session\\TempPathEnabled": "true",
+                # libtorrent 1.2 builds use the disk cache, 2.x the disk queue
+                "Session\\DiskCacheSize": str(cache_mb),
+                "Session\\DiskQueueSize": str(min(64, cache_mb // 16) << 20),
+                "Session\\AsyncIOThreadsCount": str(aio_threads),
+                "Session\\HashingThreadsCount": str(hashing_threads),
+                # Larger read buffer makes rechecks of big torrents sequential
+                "Session\\CheckingMemUsageSize": str(min(256, cache_mb // 4)),
+                "Session\\FilePoolSize": str(500 if self.memory_mb >= 4096 else 200),
+                "Session\\MaxConnections": str(max_connections),
+                "Session\\MaxConnectionsPerTorrent": str(200 if self.cpus >= 4 else 100),
+                "Session\\SocketBacklogSize": str(max_connections // 4),
+                "Session\\SendBufferWatermark": "5120",
+                "Session\\SendBufferLowWatermark": "1024",
+            },
+            "Preferences": {
+                "Connection\\PortRangeMin": "6881",
+                "Downloads\\SavePath": save_path,
+                "Downloads\\TempPath": temp_path,
+                "Downloads\\TempPathEnabled": "true",
+            },
+            "LegalNotice": {"Accepted": "true"},
+        }
+
+    def _usenet_cache_mb(self) -> int:
+        # Articles are held in RAM until a whole file can be written out
+        return min(2048, max(128, self.memory_mb // 8))
+
+    def _unpack_threads(self) -> int:
+        # Unpacking on the download spindle competes with incoming writes
+        return 2 if self.rotational else min(6, max(3, self.cpus // 2))
+
+    def sabnzbd(self, target: str) -> dict[str, str]:
+        """Return sabnzbd.ini [misc] keys for a client that sees its downloads at target."""
+        return {
+            "download_dir": f"{target}/incomplete",
+            "complete_dir": f"{target}/complete",
+            "dirscan_dir": f"{target}/watch",
+            "cache_dir": f"{target}/cache",
+            "cache_limit": f"{self._usenet_cache_mb()}M",
+            "par2_multicore": "1",
+            "par_option": f"-t{self.cpus}",
+            "direct_unpack": "1",
+            "direct_unpack_threads": str(self._unpack_threads()),
+            "receive_threads": str(min(6, max(2, self.cpus // 2))),
+        }
+
+    def nzbget(self, target: str) -> dict[str, str]:
+        """Return nzbget.conf keys for a client that sees its downloads at target."""
+        return {
+            "MainDir": target,
+            "ArticleCache": str(self._usenet_cache_mb()),
+            "WriteBuffer": "1024",
+            "DirectWrite": "yes",
+            "DirectUnpack": "yes",
+            "ParThreads": str(self.cpus),
+            "ParBuffer": str(min(1024, self._usenet_cache_mb() // 4)),
+            # Overlap repair/unpack of several NZBs only where the disk can take it
+            "PostStrategy": "balanced" if self.rotational else "aggressive",
+        }
+
+
+class TorrentResume:
+    """Rewrites save paths in qBittorrent's bencoded .fastresume files."""
+
+    # Keys holding container paths (libtorrent's own, then qBittorrent's)
+    PATH_KEYS = [b"save_path", b"qBt-savePath", b"qBt-downloadPath"]
+
+    @classmethod
+    def decode(cls, data: bytes, pos: int = 0):
+        """Decode one bencoded value at pos, returning (value, next pos)."""
+        kind = data[pos:pos + 1]
+        if kind == b"i":
+            end = data.index(b"e", pos)
+            return int(data[pos + 1:end]), end + 1
+        if kind in (b"l", b"d"):
+            items, pos = [], pos + 1
+            while data[pos:pos + 1] != b"e":
+                item, pos = cls.decode(data, pos)
+                items.append(item)
+            if kind == b"l":
+                return items, pos + 1
+            return dict(zip(items[::2], items[1::2])), pos + 1
+        colon = data.index(b":", pos)
+        end = colon + 1 + int(data[pos:colon])
+        return data[colon + 1:end], end
+
+    @classmethod
+    def encode(cls, value) -> bytes:
+        """Bencode a value; dict keys are written in sorted order."""
+        if isinstance(value, int):
+            return b"i%de" % value
+        if isinstance(value, bytes):
+            return b"%d:%s" % (len(value), value)
+        if isinstance(value, list):
+            return b"l" + b"".join(cls.encode(v) for v in value) + b"e"
+        return b"d" + b"".join(cls.encode(k) + cls.encode(value[k]) for k in sorted(value)) + b"e"
+
+    @classmethod
+    def rewrite(cls, resume_dir: Path, old: str, new: str) -> int:
+        """Move save paths under old to new in every resume file. Returns files changed."""
+        old_prefix, new_prefix = old.rstrip("/").encode(), new.rstrip("/").encode()
+        changed = 0
+        for path in sorted(resume_dir.glob("*.fastresume")):
+            try:
+                resume, _ = cls.decode(path.read_bytes())
+            except (OSError, ValueError, IndexError):
+                print(f"Skipping unreadable {path}")
+                continue
+            dirty = False
+            for key in cls.PATH_KEYS:
+                value = resume.get(key)
+                if isinstance(value, bytes) and (value == old_prefix or value.startswith(old_prefix + b"/")):
+                    resume[key] = new_prefix + value[len(old_prefix):]
+                    dirty = True
+            if dirty:
+                tmp = path.with_suffix(".tmp")
+                tmp.write_bytes(cls.encode(resume))
+                shutil.copystat(path, tmp)
+                os.chown(tmp, path.stat().st_uid, path.stat().st_gid)
+                tmp.replace(path)
+                changed += 1
+        return changed
+
+    @staticmethod
+    def rewrite_categories(path: Path, old: str, new: str) -> None:
+        """Move category save paths under old to new in categories.json."""
+        try:
+            categories = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return
+        old, new = old.rstrip("/"), new.rstrip("/")
+        for category in categories.values():
+            save_path = category.get("save_path", "")
+            if save_path == old or save_path.startswith(old + "/"):
+                category["save_path"] = new + save_path[len(old):]
+        path.write_text(json.dumps(categories, indent=4))
+
+
+class LibraryIndex:
+    """Incremental size index of the media libraries.
+
+    Every directory's entry holds its mtime and the (inode, size, mtime) of
+    its files. Adding, removing or renaming a file changes the directory's
+    mtime, so an unchanged directory is trusted without listing or
+    stat'ing its files. A file rewritten in place under the same name is
+    only seen by a full rescan.
+    """
+
+    LIBRARIES = ["movies", "tv", "music", "books"]
+
+    def __init__(self, media_dir: Path, index_path: Path = LIBRARY_INDEX):
+        self.media_dir = Path(media_dir)
+        self.index_path = index_path
+        self.dirs: dict[str, list] = {}
+        self.rescanned = 0
+        try:
+            with gzip.open(index_path, "rt") as f:
+                self.dirs = json.load(f)["dirs"]
+        except (OSError, ValueError, KeyError):
+            self.dirs = {}
+
+    def _entry(self, path: str, full: bool) -> list:
+        """Return [mtime_ns, files, subdirs] for a directory, listing it only if it changed."""
+        mtime = os.stat(path).st_mtime_ns
+        entry = self.dirs.get(path)
+        if entry and entry[0] == mtime and not full:
+            return entry
+
+        files, subdirs = [], []
+        with os.scandir(path) as it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        subdirs.append(e.name)
+                    elif e.is_file(follow_symlinks=False):
+                        st = e.stat(follow_symlinks=False)
+                        files.append([e.name, st.st_ino, st.st_size, st.st_mtime_ns])
+                except OSError:
+                    continue
+        self.rescanned += 1
+        self.dirs[path] = [mtime, files, subdirs]
+        return self.dirs[path]
+
+    def scan(self, full: bool = False) -> dict[str, dict]:
+        """Return {library: {bytes, files, free_bytes}}, refreshing the index."""
+        seen: dict[str, list] = {}
+        totals = {}
+        for library in self.LIBRARIES:
+            root = self.media_dir / library
+            size, count, inodes = 0, 0, set()
+            stack = [str(root)] if root.is_dir() else []
+            while stack:
+                path = stack.pop()
+                try:
+                    entry = self._entry(path, full)
+                except OSError:
+                    continue
+                seen[path] = entry
+                for _, inode, file_size, _ in entry[1]:
+                    # Hardlinked copies of one file are counted once
+                    if inode not in inodes:
+                        inodes.add(inode)
+                        size += file_size
+                        count += 1
+                stack.extend(os.path.join(path, name) for name in entry[2])
+
+            try:
+                st = os.statvfs(root)
+                free = st.f_bavail * st.f_frsize
+            except OSError:
+                free = 0
+            totals[library] = {"bytes": size, "files": count, "free_bytes": free}
+
+        # Directories that vanished drop out of the index
+        self.dirs = seen
+        return totals
+
+    def save(self) -> None:
+        """Write the index atomically as compressed JSON."""
+        tmp = self.index_path.with_name(self.index_path.name + ".tmp")
+        with gzip.open(tmp, "wt", compresslevel=1) as f:
+            json.dump({"version": 1, "dirs": self.dirs}, f, separators=(",", ":"))
+        os.replace(tmp, self.index_path)
+
+    TIMER = "astro-libindex.timer"
+    SERVICE = "astro-libindex.service"
+
+    @classmethod
+    def units(cls, command: list[str]) -> dict[str, str]:
+        """Return {unit file name: contents} for the hourly index refresh."""
+        return {
+            cls.SERVICE: f"""[Unit]
+Description=AstroMediaServer media library index
+
+[Service]
+Type=oneshot
+ExecStart={" ".join(command)}
+Nice=19
+IOSchedulingClass=idle
+""",
+            cls.TIMER: """[Unit]
+Description=AstroMediaServer media library index
+
+[Timer]
+OnCalendar=hourly
+Persistent=true
+
+[Install]
+WantedBy=timers.target
+""",
+        }
+
+    @staticmethod
+    def publish(totals: dict[str, dict], path: Path = LIBRARY_STATS) -> dict:
+        """Add growth rates from the daily history in the stats file and rewrite it."""
+        history = []
+        if path.exists():
+            try:
+                history = json.loads(path.read_text()).get("history", [])
+            except ValueError:
+                history = []
+        today = time.strftime("%Y-%m-%d")
+        history = [day for day in history if day["date"] != today]
+        history.append({"date": today, "bytes": {name: lib["bytes"] for name, lib in totals.items()}})
+        history = history[-LIBRARY_HISTORY_DAYS:]
+
+        # Compare against the oldest day within the past week
+        week = history[-8:]
+        days = max(1, len(week) - 1)
+        stats = {"updated": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+        for name, lib in totals.items():
+            start = week[0]["bytes"].get(name, lib["bytes"])
+            stats[name] = {**lib, "growth_bytes_per_day": (lib["bytes"] - start) // days}
+        stats["total"] = {
+            key: sum(stats[name][key] for name in totals)
+            for key in ("bytes", "files", "growth_bytes_per_day")
+        }
+        stats["history"] = history
+        path.write_text(json.dumps(stats, indent=2))
+        return stats
+
+
+class ConfigBackup:
+    """Incremental, deduplicated snapshots of the config directory.
+
+    Files are cut into fixed-size chunks, each stored once under its
+    SHA-256 and compressed when that helps. Fixed offsets suit SQLite,
+    whose page-aligned writes leave a database's other chunks untouched.
+    A file whose size and mtime match the previous snapshot reuses its
+    chunk list without being read. Live databases are copied through the
+    SQLite online backup API, so a snapshot never catches one mid-write.
+    """
+
+    CHUNK_SIZE = 1 << 20
+    SQLITE_MAGIC = b"SQLite format 3\x00"
+    SQLITE_SIDECARS = ("-wal", "-shm", "-journal")
+    # Seconds a database may stay locked by its app before the file is reported
+    BUSY_TIMEOUT = 30
+    # Rebuilt by the apps on demand, not worth storing
+    EXCLUDE = {"Cache", "cache", "Crash Reports", "Logs", "logs", "logs.db", "transcodes"}
+
+    def __init__(self, repo: Path, workers: Optional[int] = None):
+        self.repo = Path(repo)
+        self.chunks_dir = self.repo / "chunks"
+        self.snapshots_dir = self.repo / "snapshots"
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self._lock = threading.Lock()
+        self.new_chunks = 0
+        self.stored_bytes = 0
+
+    def snapshots(self) -> list[str]:
+        """Return snapshot names, oldest first."""
+        if not self.snapshots_dir.is_dir():
+            return []
+        return sorted(p.name.removesuffix(".json.gz") for p in self.snapshots_dir.glob("*.json.gz"))
+
+    def load(self, name: str) -> dict:
+        """Return a snapshot's manifest."""
+        with gzip.open(self.snapshots_dir / f"{name}.json.gz", "rt") as f:
+            return json.load(f)
+
+    def _chunk_path(self, digest: str) -> Path:
+        return self.chunks_dir / digest[:2] / digest
+
+    def _store(self, data: bytes) -> str:
+        """Store a chunk unless the repository already has it, returning its digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(digest)
+        if path.exists():
+            return digest
+        packed = zlib.compress(data, 3)
+        # Images and archives do not shrink; keep those raw
+        body = b"z" + packed if len(packed) < len(data) else b"-" + data
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_name(f"{digest}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(body)
+        os.replace(tmp, path)
+        with self._lock:
+            self.new_chunks += 1
+            self.stored_bytes += len(body)
+        return digest
+
+    def _chunk(self, digest: str) -> bytes:
+        """Read and verify a chunk."""
+        body = self._chunk_path(digest).read_bytes()
+        data = zlib.decompress(body[1:]) if body[:1] == b"z" else body[1:]
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"chunk {digest} is corrupt")
+        return data
+
+    def _store_file(self, path: str) -> list[str]:
+        """Chunk a file into the repository."""
+        digests = []
+        with open(path, "rb") as f:
+            while data := f.read(self.CHUNK_SIZE):
+                digests.append(self._store(data))
+        return digests
+
+    def _is_sqlite(self, path: str, size: int) -> bool:
+        if size < 100:
+            return False
+        with open(path, "rb") as f:
+            return f.read(len(self.SQLITE_MAGIC)) == self.SQLITE_MAGIC
+
+    @staticmethod
+    def _busy(error: sqlite3.Error) -> bool:
+        """Return True if an error only means another connection holds a lock."""
+        name = getattr(error, "sqlite_errorname", "")
+        return name.startswith(("SQLITE_BUSY", "SQLITE_LOCKED")) or str(error).endswith("is locked")
+
+    def _store_database(self, path: str, scratch: Path) -> Optional[list[str]]:
+        """Chunk a consistent copy of a live SQLite database.
+
+        Returns None if the database cannot be opened read-only at all. A
+        lock that outlasts BUSY_TIMEOUT raises TimeoutError instead, since a
+        raw copy of a database being written is not safe to restore.
+        """
+        # Read-only, so root never leaves its own -wal/-shm files behind
+        source = sqlite3.connect(f"file:{urllib.parse.quote(path)}?mode=ro", uri=True, timeout=self.BUSY_TIMEOUT)
+        try:
+            try:
+                source.execute("PRAGMA schema_version").fetchone()
+            except sqlite3.Error as e:
+                if self._busy(e):
+                    raise TimeoutError(f"database stayed locked for {self.BUSY_TIMEOUT}s") from e
+                return None
+
+            deadline = time.monotonic() + self.BUSY_TIMEOUT
+
+            def give_up(status: int, remaining: int, total: int) -> None:
+                # The backup retries busy steps on its own; bound how long it keeps trying
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"database stayed locked for {self.BUSY_TIMEOUT}s")
+
+            fd, copy = tempfile.mkstemp(dir=scratch, suffix=".db")
+            os.close(fd)
+            try:
+                target = sqlite3.connect(copy)
+                try:
+                    source.backup(target, progress=give_up)
+                finally:
+                    target.close()
+                return self._store_file(copy)
+            finally:
+                os.unlink(copy)
+        finally:
+            source.close()
+
+    def _signature(self, path: str, st: os.stat_result) -> list[int]:
+        """Return what must be unchanged for a file's chunks to be reused."""
+        signature = [st.st_size, st.st_mtime_ns]
+        try:
+            # Committed WAL frames change a database without touching its mtime
+            wal = os.stat(path + "-wal")
+            signature += [wal.st_size, wal.st_mtime_ns]
+        except OSError:
+            pass
+        return signature
+
+    def _entry(self, path: str, st: os.stat_result, previous: Optional[dict], scratch: Path) -> dict:
+        """Back up one regular file, reusing the previous snapshot's chunks when unchanged."""
+        entry = {"type": "file", "mode": st.st_mode & 0o7777, "uid": st.st_uid, "gid": st.st_gid,
+                 "mtime_ns": st.st_mtime_ns, "sig": self._signature(path, st)}
+        if previous and previous.get("sig") == entry["sig"]:
+            entry["chunks"] = previous["chunks"]
+            if "sidecars" in previous:
+                entry["sidecars"] = previous["sidecars"]
+            entry["reused"] = True
+            return entry
+        if self._is_sqlite(path, st.st_size):
+            chunks = self._store_database(path, scratch)
+            if chunks is not None:
+                entry["chunks"] = chunks
+                return entry
+            # Not openable read-only while closed without its -shm; nothing is writing it
+            # then, but committed pages may still sit in the -wal, so keep the sidecars
+            entry["sidecars"] = {}
+            for suffix in self.SQLITE_SIDECARS:
+                try:
+                    entry["sidecars"][suffix] = self._store_file(path + suffix)
+                except FileNotFoundError:
+                    continue
+        entry["chunks"] = self._store_file(path)
+        return entry
+
+    def _walk(self, root: Path) -> Iterable[tuple[str, str, os.stat_result]]:
+        """Yield (relative path, absolute path, lstat) for everything worth backing up."""
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d not in self.EXCLUDE]
+            names = set(filenames)
+            for name in dirnames + filenames:
+                if name in self.EXCLUDE:
+                    continue
+                # A database's journal is folded into its snapshot copy
+                if name.endswith(self.SQLITE_SIDECARS) and name.rsplit("-", 1)[0] in names:
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    yield os.path.relpath(path, root), path, os.lstat(path)
+                except OSError:
+                    continue
+
+    def create(self, root: Path, keep: int = BACKUP_KEEP) -> dict:
+        """Snapshot a tree, prune old snapshots and return a report."""
+        started = time.monotonic()
+        for d in (self.chunks_dir, self.snapshots_dir):
+            d.mkdir(parents=True, exist_ok=True)
+        self.repo.chmod(0o700)
+        existing = self.snapshots()
+        previous = self.load(existing[-1])["files"] if existing else {}
+
+        files: dict[str, dict] = {}
+        errors = []
+        scratch = Path(tempfile.mkdtemp(dir=self.repo, prefix=".scratch-"))
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="backup") as pool:
+                pending = {}
+                for rel, path, st in self._walk(Path(root)):
+                    owner = {"mode": st.st_mode & 0o7777, "uid": st.st_uid, "gid": st.st_gid}
+                    if os.path.islink(path):
+                        files[rel] = {"type": "link", "target": os.readlink(path), **owner}
+                    elif os.path.isdir(path):
+                        files[rel] = {"type": "dir", **owner}
+                    elif os.path.isfile(path):
+                        pending[pool.submit(self._entry, path, st, previous.get(rel), scratch)] = rel
+                for future, rel in pending.items():
+                    try:
+                        files[rel] = future.result()
+                    except (OSError, ValueError, sqlite3.Error) as e:
+                        errors.append(f"{rel}: {e}")
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+        reused = sum(1 for entry in files.values() if entry.pop("reused", False))
+        name = time.strftime("%Y%m%dT%H%M%S")
+        manifest = self.snapshots_dir / f"{name}.json.gz"
+        tmp = manifest.with_name(manifest.name + ".tmp")
+        with gzip.open(tmp, "wt", compresslevel=6) as f:
+            json.dump({"root": str(root), "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "files": files},
+                      f, separators=(",", ":"))
+        os.replace(tmp, manifest)
+
+        pruned = self.prune(keep)
+        return {
+            "snapshot": name,
+            "files": sum(1 for entry in files.values() if entry["type"] == "file"),
+            "unchanged": reused,
+            "new_chunks": self.new_chunks,
+            "stored_bytes": self.stored_bytes,
+            "pruned": pruned,
+            "errors": errors,
+            "seconds": round(time.monotonic() - started, 2),
+        }
+
+    def prune(self, keep: int) -> list[str]:
+        """Delete snapshots beyond the newest `keep`, then chunks none of the rest use."""
+        names = self.snapshots()
+        expired = names[:-keep] if keep else names
+        if not expired:
+            return []
+        for name in expired:
+            (self.snapshots_dir / f"{name}.json.gz").unlink()
+
+        live = set()
+        for name in names[len(expired):]:
+            for entry in self.load(name)["files"].values():
+                live.update(entry.get("chunks", []))
+                for chunks in entry.get("sidecars", {}).values():
+                    live.update(chunks)
+        for path in self.chunks_dir.glob("*/*"):
+            if path.name not in live:
+                path.unlink()
+        return expired
+
+    def _write(self, path: Path, chunks: list[str], entry: dict) -> None:
+        """Rebuild one file from its chunks with the entry's mtime."""
+        with open(path, "wb") as f:
+            for digest in chunks:
+                f.write(self._chunk(digest))
+        os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+
+    def restore(self, root: Path, services: Iterable[str], name: Optional[str] = None) -> dict:
+        """Rehydrate whole service directories from a snapshot (the latest by default).
+
+        Each service is rebuilt beside its current directory and swapped in
+        only once complete, so a failed restore leaves the old config alone.
+        """
+        name = name or (self.snapshots() or [None])[-1]
+        if name is None:
+            raise FileNotFoundError(f"no snapshots in {self.repo}")
+        files = self.load(name)["files"]
+        root = Path(root)
+        report = {"snapshot": name, "restored": {}, "missing": []}
+
+        for service in services:
+            entries = sorted((rel, entry) for rel, entry in files.items()
+                             if rel == service or rel.startswith(service + os.sep))
+            if not entries:
+                report["missing"].append(service)
+                continue
+
+            staging = root / f".{service}.restoring"
+            shutil.rmtree(staging, ignore_errors=True)
+            for rel, entry in entries:
+                path = staging.joinpath(*Path(rel).parts[1:])
+                if entry["type"] == "dir":
+                    path.mkdir(parents=True, exist_ok=True)
+                elif entry["type"] == "link":
+                    os.symlink(entry["target"], path)
+                else:
+                    self._write(path, entry["chunks"], entry)
+                    for suffix, chunks in entry.get("sidecars", {}).items():
+                        self._write(Path(f"{path}{suffix}"), chunks, entry)
+                        os.chown(f"{path}{suffix}", entry["uid"], entry["gid"])
+                        os.chmod(f"{path}{suffix}", entry["mode"])
+                os.chown(path, entry["uid"], entry["gid"], follow_symlinks=False)
+                if entry["type"] != "link":
+                    os.chmod(path, entry["mode"])
+
+            target = root / service
+            replaced = root / f".{service}.replaced"
+            if target.exists():
+                os.replace(target, replaced)
+            os.replace(staging, target)
+            shutil.rmtree(replaced, ignore_errors=True)
+            report["restored"][service] = sum(1 for _, entry in entries if entry["type"] == "file")
+        return report
+
+    TIMER = "astro-backup.timer"
+    SERVICE = "astro-backup.service"
 
+    @classmethod
+    def units(cls, window: str, command: list[str]) -> dict[str, str]:
+        """Return {unit file name: contents} for a nightly backup an hour before updates."""
+        start, _ = UpdateCoordinator.parse_window(window)
         return {
-            "services": self.services,
-            "networks": {
-                "default": {
-                    "name": "astro-network",
-                }
-            },
+            cls.SERVICE: f"""[Unit]
+Description=AstroMediaServer config backup
+
+[Service]
+Type=oneshot
+ExecStart={" ".join(command)}
+Nice=10
+IOSchedulingClass=idle
+""",
+            cls.TIMER: f"""[Unit]
+Description=AstroMediaServer config backup
+
+[Timer]
+OnCalendar=*-*-* {(start.hour - 1) % 24:02d}:{start.minute:02d}:00
+Persistent=true
+
+[Install]
+WantedBy=timers.target
+""",
         }
 
 
+class PermissionReconciler:
+    """Brings a tree's ownership in line with PUID/PGID, touching only what differs.
+
+    Directories are listed in parallel, one task per directory. Each entry
+    costs a single lstat; chown and chmod only run on mismatches. Modes
+    only gain the owner bits the containers need, so deliberately strict
+    files such as acme.json keep their permissions.
+    """
+
+    DIR_BITS = 0o700
+    FILE_BITS = 0o600
+    REPORT_LIMIT = 200
+
+    def __init__(self, uid: int, gid: int, dry_run: bool = False, workers: Optional[int] = None):
+        self.uid = uid
+        self.gid = gid
+        self.dry_run = dry_run
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 4)
+
+    def _check(self, path: str, st: os.stat_result, is_dir: bool, is_link: bool) -> list[str]:
+        """Fix one entry, returning the changes made (or due, in a dry run)."""
+        changes = []
+        if st.st_uid != self.uid or st.st_gid != self.gid:
+            changes.append(f"chown {st.st_uid}:{st.st_gid}->{self.uid}:{self.gid}")
+            if not self.dry_run:
+                os.chown(path, self.uid, self.gid, follow_symlinks=False)
+        if not is_link:
+            bits = self.DIR_BITS if is_dir else self.FILE_BITS
+            mode = st.st_mode & 0o7777
+            if mode & bits != bits:
+                changes.append(f"chmod {mode:o}->{mode | bits:o}")
+                if not self.dry_run:
+                    os.chmod(path, mode | bits)
+        return changes
+
+    def _walk(self, path: str) -> tuple[list[str], int, list[tuple[str, str]], list[str]]:
+        """Reconcile one directory's entries; return (subdirs, scanned, changes, errors)."""
+        subdirs, changes, errors = [], [], []
+        scanned = 0
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    scanned += 1
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        for change in self._check(entry.path, st, is_dir, entry.is_symlink()):
+                            changes.append((entry.path, change))
+                        if is_dir:
+                            subdirs.append(entry.path)
+                    except OSError as e:
+                        errors.append(f"{entry.path}: {e.strerror}")
+        except OSError as e:
+            errors.append(f"{path}: {e.strerror}")
+        return subdirs, scanned, changes, errors
+
+    def run(self, roots: Iterable[Path]) -> dict:
+        """Reconcile every tree under the given roots and return a change report."""
+        report = {"dry_run": self.dry_run, "scanned": 0, "changed": 0, "changes": [], "errors": []}
+
+        def record(changes: list[tuple[str, str]], errors: list[str]) -> None:
+            report["changed"] += len({path for path, _ in changes})
+            report["changes"] += [f"{path}: {change}" for path, change in changes][:self.REPORT_LIMIT - len(report["changes"])]
+            report["errors"] += errors
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="perms") as pool:
+            pending = set()
+            for root in roots:
+                try:
+                    st = os.lstat(root)
+                except OSError:
+                    continue
+                report["scanned"] += 1
+                record([(str(root), c) for c in self._check(str(root), st, True, False)], [])
+                pending.add(pool.submit(self._walk, str(root)))
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    subdirs, scanned, changes, errors = future.result()
+                    report["scanned"] += scanned
+                    record(changes, errors)
+                    pending.update(pool.submit(self._walk, subdir) for subdir in subdirs)
+
+        report["seconds"] = round(time.monotonic() - started, 2)
+        return report
+
+
+class PhaseTimer:
+    """Records nested wall-time spans of a setup run on the monotonic clock.
+
+    Spans from astro-init.sh arrive via ASTRO_INIT_TIMINGS as
+    space-separated name=seconds pairs, since they finish before Python starts.
+    """
+
+    def __init__(self):
+        self.origin = time.monotonic()
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        self.spans: list[dict] = []
+        self._stack: list[str] = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attrs):
+        """Time the enclosed block as a child of the innermost open span."""
+        parent = self._stack[-1] if self._stack else None
+        self._stack.append(name)
+        start = time.monotonic()
+        try:
+            yield attrs
+        finally:
+            end = time.monotonic()
+            self._stack.pop()
+            with self._lock:
+                self.spans.append({
+                    "name": name,
+                    "parent": parent,
+                    "start": round(start - self.origin, 4),
+                    "seconds": round(end - start, 4),
+                    **attrs,
+                })
+
+    def import_init_timings(self, raw: str) -> None:
+        """Add spans measured by astro-init.sh before this process started."""
+        for pair in raw.split():
+            name, _, seconds = pair.partition("=")
+            try:
+                self.spans.append({"name": name, "parent": "astro-init", "start": None, "seconds": float(seconds)})
+            except ValueError:
+                continue
+
+    def totals(self) -> dict[str, float]:
+        """Return summed seconds per span name."""
+        totals: dict[str, float] = {}
+        for span in self.spans:
+            totals[span["name"]] = round(totals.get(span["name"], 0) + span["seconds"], 4)
+        return totals
+
+    def write(self, path: Path = TRACE_FILE) -> None:
+        """Write the trace, ordered by start time, as JSON."""
+        spans = sorted(self.spans, key=lambda s: (s["start"] is not None, s["start"] or 0))
+        path.write_text(json.dumps({"started": self.started, "spans": spans}, indent=2))
+
+
+@contextlib.contextmanager
+def maintenance_lock(path: Path = MAINTENANCE_LOCK, wait: float = MAINTENANCE_LOCK_WAIT):
+    """Hold the lock that keeps updates and database maintenance from overlapping.
+
+    Raises TimeoutError if another job still holds it after `wait` seconds,
+    so a long update run cannot leave maintenance queued behind it all night.
+    """
+    deadline = time.monotonic() + wait
+    with open(path, "w") as f:
+        while True:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"another maintenance job held {path} for over {wait:.0f}s")
+                time.sleep(MAINTENANCE_LOCK_POLL)
+        yield
+
+
+def traced(method):
+    """Record each call of a SetupWizard method as a span named after it."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.timer.span(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class SetupWizard:
     """Main setup wizard orchestrator."""
 
-    def __init__(self):
-        self.ui = WhiptailUI()
+    def __init__(self, ui=None):
+        self.ui = ui or WhiptailUI()
         self.config = UserConfig()
+        self.deploy_error = ""
+        self.warnings: list[str] = []
+        self.puller = ImagePuller()
+        self.bundle = ImageBundle()
+        self.timer = PhaseTimer()
+        self.timer.import_init_timings(os.environ.get("ASTRO_INIT_TIMINGS", ""))
+
+    def prefetch_core_images(self) -> None:
+        """Start pulling always-included images while the user answers prompts."""
+        images = [ComposeGenerator.IMAGES[name] for name in ComposeGenerator.CORE_SERVICES]
+        lock = ImageLock()
+        self.puller.submit(lock.pin(image) for image in images if not self.bundle.contains(image))
 
     def show_welcome(self) -> bool:
         """Display welcome message."""
@@ -427,6 +3723,28 @@ Press OK to continue or Cancel to exit.
             return True
         return False
 
+    def detect_hardware(self) -> bool:
+        """Size transcode scratch space and offer hardware transcoding."""
+        probe = HardwareProbe()
+        self.config.transcode_tmpfs_mb = probe.transcode_tmpfs_mb(self.config.transcode_streams)
+
+        accel = probe.apply_transcoding(self.config)
+        if accel == "none":
+            return True
+
+        names = {"qsv": "Intel Quick Sync", "vaapi": "AMD VA-API"}
+        enable = self.ui.yesno(
+            f"{names[accel]} hardware transcoding is available:\n\n"
+            f"  {', '.join(self.config.hw_devices)}\n\n"
+            f"Enable it for {self.config.media_server.title()}?",
+            height=12,
+        )
+        if not enable:
+            self.config.hw_accel = "none"
+            self.config.hw_devices = []
+            self.config.hw_group_ids = []
+        return True
+
     def select_request_manager(self) -> bool:
         """Let user choose request manager."""
         choices = [
@@ -494,6 +3812,99 @@ Press OK to continue or Cancel to exit.
             return True
         return False
 
+    def select_data_layout(self) -> bool:
+        """Let user choose how downloads and libraries are laid out on disk."""
+        choices = [
+            ("split", "Separate media and download folders (classic)"),
+            ("unified", "Single /data root - instant imports via hardlinks"),
+        ]
+
+        result = self.ui.menu(
+            "Select your storage layout:\n(Unified lets imports use hardlinks instead of copies)",
+            choices,
+            height=15,
+            menu_height=4,
+        )
+
+        if result:
+            self.config.data_layout = result
+            return True
+        return False
+
+    def select_storage_tiers(self) -> bool:
+        """Offer to put random-I/O paths on SSD and the library on HDD."""
+        volumes = HardwareProbe().storage_volumes()
+        astro_mount = max((v.mountpoint for v in volumes if ASTRO_DIR.is_relative_to(v.mountpoint)),
+                          key=len, default="/")
+        tiers = HardwareProbe.propose_tiers(volumes, astro_mount)
+        if not tiers:
+            return True
+
+        lines = "\n".join(f"  {role:<11} {path}" for role, path in tiers.items())
+        if self.ui.yesno(
+            "SSD and HDD storage detected. Suggested layout:\n\n"
+            f"{lines}\n\n"
+            "Fast SSD: configs, databases, incomplete downloads\n"
+            "Large HDD: media library, completed downloads\n\n"
+            "Use this storage layout?",
+            height=18,
+            width=70,
+        ):
+            self.config.storage_tiers = tiers
+        return True
+
+    def select_media_pool(self) -> bool:
+        """Offer to pool additional data disks behind the media library."""
+        volumes = HardwareProbe().storage_volumes()
+        hot = [self.config.storage_tiers.get(role, "") for role in ["config", "incomplete"]]
+        exclude = [v.mountpoint for v in volumes
+                   if any(Path(h).is_relative_to(v.mountpoint) for h in hot if h) or ASTRO_DIR.is_relative_to(v.mountpoint)]
+        candidates = HardwareProbe.pool_candidates(volumes, exclude)
+        if len(candidates) < 2:
+            return True
+
+        choices = [
+            (v.mountpoint, f"{v.size_bytes / 1e12:.1f} TB, {v.free_bytes / 1e12:.1f} TB free", "ON")
+            for v in candidates
+        ]
+        branches = self.ui.checklist(
+            "Multiple data disks found. Pool them into one media library?\n"
+            "(Select at least two disks, or none to skip)",
+            choices,
+            height=18,
+            list_height=len(choices),
+        )
+        if len(branches) < 2:
+            return True
+
+        policy = self.ui.menu(
+            "Where should new files be placed?",
+            [
+                ("most-free", "Disk with the most free space"),
+                ("existing-path", "Keep shows/albums together on one disk"),
+                ("round-robin", "Spread new files across all disks"),
+            ],
+            height=14,
+            menu_height=4,
+        )
+        if not policy:
+            return False
+
+        self.config.pool_branches = branches
+        self.config.pool_policy = policy
+        self.config.storage_tiers["library"] = str(POOL_MOUNT)
+        return True
+
+    @traced
+    def install_media_pool(self) -> None:
+        """Write and start the pool units when data disks are pooled."""
+        if not self.config.pool_branches:
+            return
+        # Directories and compose mounts are generated from the library tier after this
+        library = Path(self.config.storage_tiers.setdefault("library", str(POOL_MOUNT)))
+        skeleton = [str(d.relative_to(library)) for d in self._data_dirs() if d.is_relative_to(library)]
+        MediaPool(self.config.pool_branches, self.config.pool_policy, library).install(skeleton)
+
     def select_gateway(self) -> bool:
         """Let user choose reverse proxy."""
         choices = [
@@ -532,6 +3943,62 @@ Press OK to continue or Cancel to exit.
             return True
         return False
 
+    def select_resource_profile(self) -> bool:
+        """Let user choose how CPU and memory are shared between services."""
+        choices = [
+            ("balanced", "Fair share between streaming and downloads"),
+            ("streaming-first", "Media server always wins (best playback)"),
+            ("download-first", "Prioritize download and unpack speed"),
+            ("none", "No limits - containers compete freely"),
+        ]
+
+        result = self.ui.menu(
+            "Select a resource profile:\n(How CPU and memory are shared)",
+            choices,
+            height=16,
+            menu_height=6,
+        )
+
+        if result:
+            self.config.resource_profile = result
+            return True
+        return False
+
+    def select_update_strategy(self) -> bool:
+        """Let user choose how container images are kept up to date."""
+        choices = [
+            ("rolling", f"One service at a time, {self.config.update_window}, never mid-stream"),
+            ("watchtower", "Watchtower checks every container at 4 AM"),
+            ("none", "Manual updates only"),
+        ]
+
+        result = self.ui.menu(
+            "How should container updates be applied?",
+            choices,
+            height=14,
+            menu_height=4,
+        )
+
+        if not result:
+            return False
+        self.config.update_strategy = result
+
+        if result == "rolling" and self.config.media_server in ["jellyfin", "emby"]:
+            server = self.config.media_server.title()
+            key = self.ui.inputbox(
+                f"Rolling updates wait until nobody is watching, which needs a {server} API key\n"
+                "(Dashboard > API Keys).\n\n"
+                f"{server} is not running yet, so this can be left blank and set later as\n"
+                f"media_server_api_key in {SETTINGS_FILE}. Until then, updates skip {server}.",
+                self.config.media_server_api_key,
+                height=14,
+                width=72,
+            )
+            if key is None:
+                return False
+            self.config.media_server_api_key = key.strip()
+        return True
+
     def configure_timezone(self) -> bool:
         """Let user set timezone."""
         result = self.ui.inputbox(
@@ -548,6 +4015,7 @@ Press OK to continue or Cancel to exit.
         """Display configuration summary."""
         req_mgr = self.config.request_manager
         req_mgr_display = "None" if req_mgr == "none" else req_mgr.title()
+        hw_display = "Disabled" if self.config.hw_accel == "none" else self.config.hw_accel.upper()
 
         summary = f"""
 Configuration Summary:
@@ -561,61 +4029,480 @@ Download Methods:
   Torrents:    {'Enabled' if self.config.enable_torrents else 'Disabled'}
   Usenet:      {'Enabled' if self.config.enable_usenet else 'Disabled'}
 
+Storage:       {self.config.data_layout.title()} layout{' (SSD/HDD tiered)' if self.config.storage_tiers else ''}
+Media Pool:    {f"{len(self.config.pool_branches)} disks, {self.config.pool_policy}" if self.config.pool_branches else 'None'}
 Timezone:      {self.config.timezone}
+HW Transcode:  {hw_display}
+Resources:     {self.config.resource_profile.replace('-', ' ').title()}
+Updates:       {self.config.update_strategy.title()}{f" ({self.config.update_window})" if self.config.update_strategy == "rolling" else ""}
 
 Always Included:
-  Radarr, Sonarr, Lidarr,
-  Prowlarr, Watchtower
+  Radarr, Sonarr, Lidarr, Prowlarr
 
 Proceed with this configuration?
 """
-        return self.ui.yesno(summary, height=24, width=52)
+        return self.ui.yesno(summary, height=28, width=52)
+
+    def _data_dirs(self) -> list[Path]:
+        """Return library and download directories for the configured layout."""
+        paths = StoragePaths(self.config)
+        dirs = [paths.data_dir] if paths.unified else []
+        download_root = paths.download_root
+
+        dirs += [paths.media_dir / lib for lib in ["movies", "tv", "music", "books"]]
+        dirs += [
+            download_root / "torrents",
+            download_root / "usenet",
+            # Usenet subdirectories for SABnzbd
+            download_root / "usenet" / "complete",
+            download_root / "usenet" / "incomplete",
+            download_root / "usenet" / "watch",
+            # Torrent subdirectories for qBittorrent
+            download_root / "torrents" / "complete",
+            download_root / "torrents" / "incomplete",
+        ]
+        if paths.incomplete_root:
+            dirs += [paths.incomplete_dir("torrents"), paths.incomplete_dir("usenet")]
+        return dirs
+
+    @traced
+    def install_update_timer(self) -> None:
+        """Schedule rolling updates, or remove the timer if another strategy is chosen."""
+        timer = SYSTEMD_DIR / UpdateCoordinator.TIMER
+        if self.config.update_strategy != "rolling":
+            if timer.exists():
+                subprocess.run(["systemctl", "disable", "--now", UpdateCoordinator.TIMER], capture_output=True)
+                timer.unlink()
+                (SYSTEMD_DIR / UpdateCoordinator.SERVICE).unlink(missing_ok=True)
+            return
+
+        command = [sys.executable, str(Path(__file__).resolve()), "--update", "--maintenance-window"]
+        self._install_timer(UpdateCoordinator.units(self.config.update_window, command), UpdateCoordinator.TIMER)
+
+    @staticmethod
+    def _install_timer(units: dict[str, str], timer: str) -> None:
+        """Write unit files and start a timer."""
+        for name, contents in units.items():
+            (SYSTEMD_DIR / name).write_text(contents)
+        subprocess.run(["systemctl", "daemon-reload"], check=True)
+        subprocess.run(["systemctl", "enable", "--now", timer], check=True)
+
+    @traced
+    def install_library_indexer(self) -> None:
+        """Refresh library sizes for the dashboard every hour."""
+        command = [sys.executable, str(Path(__file__).resolve()), "--index-library"]
+        self._install_timer(LibraryIndex.units(command), LibraryIndex.TIMER)
+
+    @traced
+    def install_database_maintenance(self) -> None:
+        """Compact the app databases weekly, within the update window."""
+        command = [sys.executable, str(Path(__file__).resolve()), "--maintain-databases", "--maintenance-window"]
+        self._install_timer(DatabaseMaintenance.units(self.config.update_window, command), DatabaseMaintenance.TIMER)
+
+    @traced
+    def install_backup_timer(self) -> None:
+        """Back up the config directory nightly, ahead of the update window."""
+        command = [sys.executable, str(Path(__file__).resolve()), "--backup"]
+        self._install_timer(ConfigBackup.units(self.config.update_window, command), ConfigBackup.TIMER)
+
+    def _backup_repo(self) -> ConfigBackup:
+        return ConfigBackup(Path(self.config.backup_dir or BACKUP_DIR))
+
+    def backup(self) -> int:
+        """Snapshot the config directory, printing a JSON report."""
+        self.config = UserConfig.load()
+        report = self._backup_repo().create(StoragePaths(self.config).config_dir, keep=self.config.backup_keep)
+        print(json.dumps(report, indent=2))
+        return 1 if report["errors"] else 0
+
+    @traced
+    def restore_config(self) -> None:
+        """Rehydrate the configs listed in restore_services before the stack first starts."""
+        if not self.config.restore_services:
+            return
+        report = self._backup_repo().restore(StoragePaths(self.config).config_dir, self.config.restore_services)
+        if report["missing"]:
+            raise RuntimeError(f"Backup {report['snapshot']} has no config for {', '.join(report['missing'])}")
+
+    def restore(self, services: list[str], snapshot: Optional[str] = None) -> int:
+        """Restore service configs into a deployed stack, stopping each service meanwhile."""
+        self.config = UserConfig.load()
+        compose = ["docker", "compose", "-f", str(COMPOSE_FILE)]
+        subprocess.run([*compose, "stop", *services], cwd=str(ASTRO_DIR), capture_output=True)
+        try:
+            report = self._backup_repo().restore(StoragePaths(self.config).config_dir, services, snapshot)
+        finally:
+            subprocess.run([*compose, "up", "-d", *services], cwd=str(ASTRO_DIR), capture_output=True)
+        print(json.dumps(report, indent=2))
+        return 1 if report["missing"] else 0
+
+    def fix_permissions(self, dry_run: bool = False) -> int:
+        """Reconcile ownership of config, media and download trees, printing a JSON report."""
+        self.config = UserConfig.load()
+        paths = StoragePaths(self.config)
+        candidates = [paths.config_dir, paths.transcode_dir]
+        if paths.unified:
+            candidates.append(paths.data_dir)
+        else:
+            candidates += [paths.media_dir, paths.download_root / "torrents", paths.download_root / "usenet"]
+        if paths.incomplete_root:
+            candidates.append(paths.incomplete_root)
+
+        # Nested roots would be walked twice
+        roots = []
+        for root in sorted(set(candidates), key=lambda p: len(p.parts)):
+            if not any(root.is_relative_to(r) for r in roots):
+                roots.append(root)
+
+        reconciler = PermissionReconciler(int(self.config.puid), int(self.config.pgid), dry_run=dry_run)
+        report = reconciler.run(roots)
+        report["roots"] = [str(r) for r in roots]
+        print(json.dumps(report, indent=2))
+        return 1 if report["errors"] else 0
+
+    def index_library(self, full: bool = False) -> int:
+        """Update the library index and publish per-library totals."""
+        self.config = UserConfig.load()
+        paths = StoragePaths(self.config)
+        index = LibraryIndex(paths.media_dir)
+        started = time.monotonic()
+        stats = LibraryIndex.publish(index.scan(full=full))
+        index.save()
+
+        # Homepage serves its public/ mount to the library widgets
+        public = paths.config_dir / "homepage" / "public"
+        if self.config.dashboard == "homepage" and public.is_dir():
+            shutil.copyfile(LIBRARY_STATS, public / LIBRARY_STATS.name)
+
+        summary = {name: lib for name, lib in stats.items() if name in LibraryIndex.LIBRARIES + ["total"]}
+        print(json.dumps({
+            "seconds": round(time.monotonic() - started, 2),
+            "directories": len(index.dirs),
+            "rescanned": index.rescanned,
+            "libraries": summary,
+        }, indent=2))
+        return 0
 
+    def update(self, maintenance_window: bool = False, dry_run: bool = False, rollback: bool = False) -> int:
+        """Roll image updates (or the previous image lock) through the stack, printing a JSON report.
+
+        With pinned images, only services whose locked digest moved, or
+        whose container still runs an older pin, are pulled and recreated.
+        A dry run only looks digests up, for either strategy.
+        """
+        self.config = UserConfig.load()
+        with open(COMPOSE_FILE) as f:
+            compose = yaml.safe_load(f)
+        pinned = self.config.update_strategy != "watchtower"
+        lock = ImageLock()
+        changed, unresolved = {}, []
+
+        if rollback and not pinned:
+            print(json.dumps({"error": "rollback needs pinned images; update_strategy is watchtower"}, indent=2))
+            return 1
+        if dry_run:
+            if rollback:
+                try:
+                    changed = lock.rollback(dry_run=True)
+                except FileNotFoundError as e:
+                    print(json.dumps({"error": str(e)}, indent=2))
+                    return 1
+            else:
+                tags = [lock.unpin(svc["image"]) for svc in compose["services"].values() if "image" in svc]
+                digests, unresolved = lock.resolve(tags)
+                # Unpinned tags are compared with the image the host last pulled
+                current = {tag: lock.images.get(tag) if pinned else lock.local_digest(tag) for tag in digests}
+                changed = {tag: {"from": current[tag], "to": digest}
+                           for tag, digest in digests.items() if current[tag] != digest}
+            print(json.dumps({"changed": changed, "unresolved": unresolved}, indent=2))
+            return 0
+
+        with contextlib.ExitStack() as stack:
+            try:
+                stack.enter_context(maintenance_lock())
+            except TimeoutError as e:
+                print(json.dumps({"error": str(e)}, indent=2))
+                return 1
+            if pinned:
+                if rollback:
+                    try:
+                        changed = lock.rollback()
+                    except FileNotFoundError as e:
+                        print(json.dumps({"error": str(e)}, indent=2))
+                        return 1
+                else:
+                    tags = [lock.unpin(svc["image"]) for svc in compose["services"].values() if "image" in svc]
+                    digests, unresolved = lock.resolve(tags)
+                    changed = lock.update(digests)
+                if changed:
+                    self.generate_compose()
+                    with open(COMPOSE_FILE) as f:
+                        compose = yaml.safe_load(f)
+
+            coordinator = UpdateCoordinator(
+                compose,
+                batch_size=self.config.update_batch,
+                window=self.config.update_window if maintenance_window else None,
+                monitor=SessionMonitor.from_config(self.config, compose),
+                only=UpdateCoordinator.drifted(compose) if pinned else None,
+            )
+            report = coordinator.run()
+        report["changed"] = changed
+        report["unresolved"] = unresolved
+        print(json.dumps(report, indent=2))
+        return 1 if report["failed"] else 0
+
+    def maintain_databases(self, maintenance_window: bool = False) -> int:
+        """Compact and prune app databases one service at a time, printing a JSON report."""
+        self.config = UserConfig.load()
+        with open(COMPOSE_FILE) as f:
+            compose = yaml.safe_load(f)
+        maintenance = DatabaseMaintenance(
+            compose,
+            StoragePaths(self.config).config_dir,
+            retention={"db_log_days": self.config.db_log_days, "db_history_days": self.config.db_history_days},
+            window=self.config.update_window if maintenance_window else None,
+        )
+        with contextlib.ExitStack() as stack:
+            try:
+                stack.enter_context(maintenance_lock())
+            except TimeoutError as e:
+                print(json.dumps({"error": str(e)}, indent=2))
+                return 1
+            report = maintenance.run()
+        try:
+            DatabaseMaintenance.record(report)
+        except OSError:
+            pass
+        print(json.dumps(report, indent=2))
+        return 1 if report["failed"] else 0
+
+    @traced
     def create_directories(self) -> None:
         """Create required directory structure."""
+        paths = StoragePaths(self.config)
         dirs = [
-            CONFIG_DIR,
-            MEDIA_DIR / "movies",
-            MEDIA_DIR / "tv",
-            MEDIA_DIR / "music",
-            MEDIA_DIR / "books",
-            ASTRO_DIR / "torrents",
-            ASTRO_DIR / "usenet",
-            # Usenet subdirectories for SABnzbd
-            ASTRO_DIR / "usenet" / "complete",
-            ASTRO_DIR / "usenet" / "incomplete",
-            ASTRO_DIR / "usenet" / "watch",
-            # Torrent subdirectories for qBittorrent
-            ASTRO_DIR / "torrents" / "complete",
-            ASTRO_DIR / "torrents" / "incomplete",
+            paths.config_dir,
+            *self._data_dirs(),
+            # Disk fallback for transcode scratch on low-RAM hosts
+            paths.transcode_dir,
         ]
 
         for d in dirs:
             d.mkdir(parents=True, exist_ok=True)
             os.chown(d, int(self.config.puid), int(self.config.pgid))
 
-    def generate_compose(self) -> None:
-        """Generate docker-compose.yml file."""
-        generator = ComposeGenerator(self.config)
-        compose_config = generator.generate()
+    @traced
+    def generate_compose(self, hosts: Optional[dict[str, dict]] = None) -> None:
+        """Generate docker-compose.yml, plus every host's file for a split stack."""
+        if hosts is None:
+            hosts = ComposeGenerator(self.config).generate_split()
+        topology = Topology(self.config)
 
         with open(COMPOSE_FILE, "w") as f:
-            yaml.dump(compose_config, f, default_flow_style=False, sort_keys=False)
+            yaml.dump(hosts[topology.local], f, default_flow_style=False, sort_keys=False)
+        if topology.enabled:
+            for host, compose_config in hosts.items():
+                (HOSTS_DIR / host).mkdir(parents=True, exist_ok=True)
+                with open(HOSTS_DIR / host / COMPOSE_FILE.name, "w") as f:
+                    yaml.dump(compose_config, f, default_flow_style=False, sort_keys=False)
+
+    def _load_xml(self, path: Path, root_tag: str) -> ET.ElementTree:
+        """Parse an XML config, or start an empty one with the given root."""
+        if path.exists():
+            return ET.parse(path)
+        return ET.ElementTree(ET.Element(root_tag))
+
+    def _chown_config(self, path: Path) -> None:
+        """Hand a generated file and its new parent dirs to PUID/PGID."""
+        # Only walk up to the config root; never recurse into existing metadata
+        config_dir = StoragePaths(self.config).config_dir
+        for p in [path, *path.parents]:
+            if p == config_dir:
+                break
+            os.chown(p, int(self.config.puid), int(self.config.pgid))
+
+    def _write_xml(self, path: Path, tree: ET.ElementTree) -> None:
+        """Write an XML config owned by PUID/PGID, including new parent dirs."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tree.write(path, encoding="utf-8", xml_declaration=True)
+        self._chown_config(path)
+
+    def _container_running(self, name: str) -> bool:
+        """Return True if a container by this name is up."""
+        state = self._container_states([name]).get(name)
+        return bool(state and state["State"]["Running"])
+
+    def _downloads_rotational(self, kind: str) -> bool:
+        """Return True if in-progress downloads of a kind land on a spinning drive."""
+        return HardwareProbe().path_is_rotational(StoragePaths(self.config).incomplete_dir(kind),
+                                                  self.config.pool_branches)
+
+    @traced
+    def generate_qbittorrent_config(self) -> None:
+        """Render a hardware-tuned qBittorrent.conf, keeping the user's own edits."""
+        # qBittorrent saves its in-memory settings on exit, overwriting edits made while it runs
+        if not self.config.enable_torrents or self._container_running("qbittorrent"):
+            return
+        paths = StoragePaths(self.config)
+        conf = paths.config_dir / "qbittorrent" / "qBittorrent" / "qBittorrent.conf"
+        target = paths.download_target("torrents")
+        tuning = self._downloader_tuning("qbittorrent", "torrents")
+        wanted = tuning.qbittorrent(f"{target}/complete", f"{target}/incomplete")
+
+        # Qt settings keys contain backslashes and are case-sensitive
+        parser = configparser.RawConfigParser(delimiters=("=",), strict=False)
+        parser.optionxform = str
+        parser.read(conf)
+        current = {f"{section}/{key}": value for section in parser.sections() for key, value in parser.items(section)}
+        managed = ManagedSettings(conf)
+        updates = managed.merge(current, {f"{section}/{key}": value
+                                          for section, keys in wanted.items() for key, value in keys.items()})
+        for name, value in updates.items():
+            section, key = name.split("/", 1)
+            if not parser.has_section(section):
+                parser.add_section(section)
+            parser.set(section, key, value)
+
+        conf.parent.mkdir(parents=True, exist_ok=True)
+        with open(conf, "w") as f:
+            parser.write(f, space_around_delimiters=False)
+        managed.commit(updates)
+        self._chown_config(conf)
+        self._chown_config(managed.record)
+
+    def _render_settings(self, path: Path, template: Path, wanted: dict[str, str],
+                         section: Optional[str] = None, separator: str = "=") -> None:
+        """Merge managed keys into a line-based key/value config, seeding it from a template.
+
+        Only the lines of managed keys change, so comments, ordering and
+        everything the user added survive. With a section, only that
+        top-level [section] is edited.
+        """
+        fresh = not path.exists()
+        source = template if fresh else path
+        lines = source.read_text().splitlines() if source.exists() else []
+
+        start, end = 0, len(lines)
+        if section:
+            header = f"[{section}]"
+            if header not in [line.strip() for line in lines]:
+                lines[:0] = [header, ""]
+            start = [line.strip() for line in lines].index(header) + 1
+            end = next((i for i in range(start, len(lines)) if lines[i].startswith("[")), len(lines))
+
+        positions, current = {}, {}
+        for i in range(start, end):
+            key, sep, value = lines[i].partition("=")
+            if sep and not key.lstrip().startswith(("#", ";")):
+                positions[key.strip()] = i
+                current[key.strip()] = value.strip()
+
+        managed = ManagedSettings(path)
+        # Template values are defaults, not edits, so a fresh file takes every key
+        updates = managed.merge({} if fresh else current, wanted)
+        insert_at = end
+        while insert_at > start and not lines[insert_at - 1].strip():
+            insert_at -= 1
+        for key, value in updates.items():
+            line = f"{key}{separator}{value}"
+            if key in positions:
+                lines[positions[key]] = line
+            else:
+                lines.insert(insert_at, line)
+                insert_at += 1
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("\n".join(lines) + "\n")
+        managed.commit(updates)
+        self._chown_config(path)
+        self._chown_config(managed.record)
+
+    @staticmethod
+    def _compose_service(name: str) -> Optional[dict]:
+        """Return a service as generated into the compose file, or None."""
+        try:
+            with open(COMPOSE_FILE) as f:
+                return (yaml.safe_load(f) or {}).get("services", {}).get(name)
+        except OSError:
+            return None
+
+    def _downloader_tuning(self, name: str, kind: str) -> DownloaderTuning:
+        """Size a download client for the limits its container was generated with."""
+        service = self._compose_service(name)
+        return DownloaderTuning.for_container(service, HardwareProbe().resources(), self._downloads_rotational(kind))
+
+    @traced
+    def generate_sabnzbd_config(self) -> None:
+        """Render sabnzbd.ini from the template with hardware-sized post-processing."""
+        if self.config.usenet_client != "sabnzbd" or self._container_running("sabnzbd"):
+            return
+        paths = StoragePaths(self.config)
+        tuning = self._downloader_tuning("sabnzbd", "usenet")
+        settings = tuning.sabnzbd(paths.download_target("usenet"))
+        service = self._compose_service("sabnzbd")
+        if service and service.get("ports"):
+            # A split stack has it listen on its published port
+            settings["port"] = str(service["ports"][0]).rsplit(":", 1)[1]
+        self._render_settings(paths.config_dir / "sabnzbd" / "sabnzbd.ini", TEMPLATE_DIR / "sabnzbd.ini",
+                              settings, section="misc", separator=" = ")
+
+    @traced
+    def generate_nzbget_config(self) -> None:
+        """Render nzbget.conf from the template with hardware-sized post-processing."""
+        if self.config.usenet_client != "nzbget" or self._container_running("nzbget"):
+            return
+        paths = StoragePaths(self.config)
+        tuning = self._downloader_tuning("nzbget", "usenet")
+        self._render_settings(paths.config_dir / "nzbget" / "nzbget.conf", TEMPLATE_DIR / "nzbget.conf",
+                              tuning.nzbget(paths.download_target("usenet")))
+
+    @traced
+    def seed_media_server_config(self) -> None:
+        """Point the media server's transcoder at /transcode before first start."""
+        server = self.config.media_server
+        server_dir = StoragePaths(self.config).config_dir / server
+
+        if server == "plex":
+            # Plex stores settings as attributes on the root element
+            prefs = server_dir / "Library" / "Application Support" / "Plex Media Server" / "Preferences.xml"
+            tree = self._load_xml(prefs, "Preferences")
+            tree.getroot().set("TranscoderTempDirectory", "/transcode")
+            self._write_xml(prefs, tree)
+            return
 
+        values = {"TranscodingTempPath": "/transcode"}
+        if server == "jellyfin":
+            encoding = server_dir / "encoding.xml"
+            if self.config.hw_accel != "none" and self.config.hw_devices:
+                values["HardwareAccelerationType"] = self.config.hw_accel
+                values["VaapiDevice"] = self.config.hw_devices[0]
+        else:
+            encoding = server_dir / "config" / "encoding.xml"
+
+        tree = self._load_xml(encoding, "EncodingOptions")
+        for tag, value in values.items():
+            element = tree.getroot().find(tag)
+            if element is None:
+                element = ET.SubElement(tree.getroot(), tag)
+            element.text = value
+        self._write_xml(encoding, tree)
+
+    @traced
     def generate_homepage_config(self) -> None:
         """Generate Homepage dashboard configuration."""
         if self.config.dashboard != "homepage":
             return
 
-        homepage_dir = CONFIG_DIR / "homepage"
+        homepage_dir = StoragePaths(self.config).config_dir / "homepage"
         homepage_dir.mkdir(parents=True, exist_ok=True)
 
-        # Get local IP for service URLs
-        try:
-            result = subprocess.run(["hostname", "-I"], capture_output=True, text=True)
-            ip = result.stdout.strip().split()[0]
-        except Exception:
-            ip = "localhost"
+        # Services on other hosts of a split stack are linked at those hosts
+        ip = self._local_ip("localhost")
+        topology = Topology(self.config)
+
+        def address(name: str) -> str:
+            return topology.address(name, ip)
 
         # Build services config
         media_server = self.config.media_server
@@ -628,7 +4515,7 @@ Proceed with this configuration?
                     {
                         media_server.title(): {
                             "icon": f"{media_server}.png",
-                            "href": f"http://{ip}:{media_port}",
+                            "href": f"http://{address(media_server)}:{media_port}",
                             "description": "Media Server",
                         }
                     }
@@ -639,28 +4526,28 @@ Proceed with this configuration?
                     {
                         "Radarr": {
                             "icon": "radarr.png",
-                            "href": f"http://{ip}:7878",
+                            "href": f"http://{address('radarr')}:7878",
                             "description": "Movie Management",
                         }
                     },
                     {
                         "Sonarr": {
                             "icon": "sonarr.png",
-                            "href": f"http://{ip}:8989",
+                            "href": f"http://{address('sonarr')}:8989",
                             "description": "TV Show Management",
                         }
                     },
                     {
                         "Lidarr": {
                             "icon": "lidarr.png",
-                            "href": f"http://{ip}:8686",
+                            "href": f"http://{address('lidarr')}:8686",
                             "description": "Music Management",
                         }
                     },
                     {
                         "Prowlarr": {
                             "icon": "prowlarr.png",
-                            "href": f"http://{ip}:9696",
+                            "href": f"http://{address('prowlarr')}:9696",
                             "description": "Indexer Management",
                         }
                     },
@@ -675,7 +4562,7 @@ Proceed with this configuration?
             services[0]["Media"].append({
                 req_mgr.title(): {
                     "icon": f"{req_mgr}.png",
-                    "href": f"http://{ip}:{req_ports.get(req_mgr, 5055)}",
+                    "href": f"http://{address(req_mgr)}:{req_ports.get(req_mgr, 5055)}",
                     "description": "Request Manager",
                 }
             })
@@ -686,21 +4573,80 @@ Proceed with this configuration?
             downloaders.append({
                 "qBittorrent": {
                     "icon": "qbittorrent.png",
-                    "href": f"http://{ip}:8080",
+                    "href": f"http://{address('qbittorrent')}:8080",
                     "description": "Torrent Client",
                 }
             })
         if self.config.enable_usenet:
+            usenet_port = 8085 if self.config.enable_torrents else 8080
             downloaders.append({
                 "SABnzbd": {
                     "icon": "sabnzbd.png",
-                    "href": f"http://{ip}:8080",
+                    "href": f"http://{address(self.config.usenet_client)}:{usenet_port}",
                     "description": "Usenet Client",
                 }
             })
         if downloaders:
             services.append({"Downloads": downloaders})
 
+        # Library sizes come from the stats file astro-libindex.timer publishes
+        library = []
+        for name, icon in [("movies", "mdi-filmstrip"), ("tv", "mdi-television-classic"),
+                           ("music", "mdi-music"), ("books", "mdi-book-open-variant")]:
+            library.append({
+                name.title() if name != "tv" else "TV": {
+                    "icon": icon,
+                    "widget": {
+                        "type": "customapi",
+                        "url": f"http://localhost:3000/astro/{LIBRARY_STATS.name}",
+                        "refreshInterval": 300000,
+                        "mappings": [
+                            {"field": {name: "bytes"}, "label": "Size", "format": "bytes"},
+                            {"field": {name: "files"}, "label": "Files", "format": "number"},
+                            {"field": {name: "growth_bytes_per_day"}, "label": "Per Day", "format": "bytes"},
+                            {"field": {name: "free_bytes"}, "label": "Free", "format": "bytes"},
+                        ],
+                    },
+                }
+            })
+        services.append({"Library": library})
+
+        # Live usage from the astro-metrics exporter, reached over the compose network
+        if self.config.metrics:
+            titles = {media_server: media_server.title(), "qbittorrent": "qBittorrent",
+                      "sabnzbd": "SABnzbd", "nzbget": "NZBGet"}
+            containers = []
+            for name in [media_server, "qbittorrent" if self.config.enable_torrents else None,
+                         self.config.usenet_client]:
+                if not name:
+                    continue
+                containers.append({
+                    titles[name]: {
+                        "icon": f"{name}.png",
+                        "widget": {
+                            "type": "customapi",
+                            "url": f"http://astro-metrics:{METRICS_PORT}/api/summary",
+                            "refreshInterval": 10000,
+                            "mappings": [
+                                {"field": {name: "cpu_percent"}, "label": "CPU", "format": "percent"},
+                                {"field": {name: "memory_bytes"}, "label": "Memory", "format": "bytes"},
+                                {"field": {name: "read_bytes_per_s"}, "label": "Disk Read", "format": "bytes"},
+                                {"field": {name: "rx_bytes_per_s"}, "label": "Net In", "format": "bytes"},
+                            ],
+                        },
+                    }
+                })
+            services.append({"Containers": containers})
+
+        public = homepage_dir / "public"
+        public.mkdir(exist_ok=True)
+        if LIBRARY_STATS.exists():
+            shutil.copyfile(LIBRARY_STATS, public / LIBRARY_STATS.name)
+        elif not (public / LIBRARY_STATS.name).exists():
+            # Zeroes until the first index run, so the widgets render
+            empty = {"bytes": 0, "files": 0, "free_bytes": 0, "growth_bytes_per_day": 0}
+            (public / LIBRARY_STATS.name).write_text(json.dumps({name: empty for name in LibraryIndex.LIBRARIES}))
+
         # Write services.yaml
         with open(homepage_dir / "services.yaml", "w") as f:
             yaml.dump(services, f, default_flow_style=False, sort_keys=False)
@@ -721,6 +4667,8 @@ Proceed with this configuration?
                 "Media": {"style": "row", "columns": 2},
                 "Management": {"style": "row", "columns": 4},
                 "Downloads": {"style": "row", "columns": 2},
+                "Library": {"style": "row", "columns": 4},
+                "Containers": {"style": "row", "columns": 3},
             },
         }
         with open(homepage_dir / "settings.yaml", "w") as f:
@@ -739,38 +4687,235 @@ Proceed with this configuration?
             f.write("# Add your bookmarks here\n[]")
 
         # Set ownership
-        for f in homepage_dir.iterdir():
+        for f in [*homepage_dir.iterdir(), *public.iterdir()]:
             os.chown(f, int(self.config.puid), int(self.config.pgid))
         os.chown(homepage_dir, int(self.config.puid), int(self.config.pgid))
 
+    @traced
+    def generate_gateway_config(self) -> None:
+        """Write the gateway's routing, compression and caching config."""
+        with open(COMPOSE_FILE) as f:
+            compose = yaml.safe_load(f)
+        topology = Topology(self.config)
+        remote = {}
+        if topology.enabled:
+            # The gateway also fronts the services other hosts run
+            for host in topology.hosts:
+                if host == topology.local:
+                    continue
+                with open(HOSTS_DIR / host / COMPOSE_FILE.name) as f:
+                    services = yaml.safe_load(f)["services"]
+                compose["services"].update(services)
+                remote.update(dict.fromkeys(services, topology.hosts[host]))
+        config_dir = StoragePaths(self.config).config_dir
+        for relative, contents in GatewayConfig(self.config, compose, remote).files().items():
+            path = config_dir / relative
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(contents)
+            self._chown_config(path)
+
+    @traced
+    def pull_images(self) -> None:
+        """Pull every image in the compose file, showing live progress."""
+        with open(COMPOSE_FILE) as f:
+            compose_config = yaml.safe_load(f)
+
+        images = [svc["image"] for svc in compose_config["services"].values() if "image" in svc]
+
+        # Images baked into the ISO load from disk and never touch the network
+        with self.timer.span("bundle_load") as span:
+            try:
+                loaded = self.bundle.load(images)
+            except (OSError, RuntimeError) as e:
+                # Headless mode reserves stdout for its JSON report
+                warning = f"image bundle load failed, pulling instead: {e}"
+                print(f"Warning: {warning}", file=sys.stderr)
+                self.warnings.append(warning)
+                span["error"] = str(e)
+                loaded = []
+            span["images"] = len(loaded)
+        remaining = [image for image in images if image not in loaded]
+        if not remaining:
+            return
+
+        # Includes any prefetch still in flight from the wizard prompts
+        with self.timer.span("image_pulls", images=len(remaining)):
+            self.puller.submit(remaining)
+            self.ui.gauge("Pulling container images...", self.puller.watch(), height=9)
+
+    @traced
+    def lock_images(self) -> None:
+        """Lock newly pulled tags at their digests and pin them in the compose file."""
+        if self.config.update_strategy == "watchtower":
+            return
+        with open(COMPOSE_FILE) as f:
+            compose_config = yaml.safe_load(f)
+        images = [svc["image"] for svc in compose_config["services"].values() if "image" in svc]
+        if ImageLock().record(image for image in images if "@" not in image):
+            self.generate_compose()
+
+    @traced
     def deploy_stack(self) -> bool:
         """Deploy the Docker stack."""
-        self.ui.msgbox("Deploying services...\n\nThis may take several minutes as container images are downloaded.", height=10)
+        # Failed pulls are left for compose to retry during `up`
+        self.pull_images()
+        self.lock_images()
 
         try:
-            result = subprocess.run(
-                ["docker", "compose", "-f", str(COMPOSE_FILE), "up", "-d"],
-                cwd=str(ASTRO_DIR),
-                capture_output=True,
-                text=True,
-            )
+            with self.timer.span("compose_up"):
+                result = subprocess.run(
+                    ["docker", "compose", "-f", str(COMPOSE_FILE), "up", "-d"],
+                    cwd=str(ASTRO_DIR),
+                    capture_output=True,
+                    text=True,
+                )
+            self.deploy_error = result.stderr.strip() if result.returncode != 0 else ""
             return result.returncode == 0
         except Exception as e:
+            self.deploy_error = str(e)
             self.ui.msgbox(f"Deployment failed:\n{str(e)}", height=10)
             return False
 
-    def show_completion(self) -> None:
-        """Display completion message with access URLs."""
-        # Get IP address
+    @traced
+    def wait_until_ready(self) -> dict[str, Optional[float]]:
+        """Block until every deployed service is serving, recording startup times."""
+        with open(COMPOSE_FILE) as f:
+            gate = ReadinessGate.from_compose(yaml.safe_load(f))
+        gate.start()
+        self.ui.gauge("Starting services...", gate.watch(), height=9)
+
+        results = gate.results()
         try:
-            result = subprocess.run(
-                ["hostname", "-I"],
-                capture_output=True,
-                text=True,
+            ReadinessGate.record(results)
+        except OSError:
+            pass
+
+        slow = [name for name, seconds in results.items() if seconds is None]
+        if slow:
+            self.ui.msgbox(
+                f"These services did not respond within {READY_TIMEOUT // 60} minutes:\n\n"
+                f"  {', '.join(slow)}\n\n"
+                "They may still be starting. Check with:\n  docker compose ps",
+                height=14,
             )
-            ip = result.stdout.strip().split()[0]
+        return results
+
+    def service_urls(self, ip: str) -> dict[str, str]:
+        """Return the web UI URL of every deployed service that has one."""
+        with open(COMPOSE_FILE) as f:
+            services = yaml.safe_load(f)["services"]
+
+        topology = Topology(self.config)
+        urls = {}
+        for name, svc in services.items():
+            if svc.get("network_mode") == "host" and name == "plex":
+                urls[name] = f"http://{topology.address(name, ip)}:32400/web"
+            elif svc.get("ports"):
+                urls[name] = f"http://{topology.address(name, ip)}:{str(svc['ports'][0]).split(':')[0]}"
+        return urls
+
+    def run_headless(self, answers: Optional[Path] = None) -> int:
+        """Configure and deploy from an answers file and ASTRO_* variables.
+
+        Prints a JSON result document on stdout.
+        """
+        result = {"status": "error", "errors": []}
+        try:
+            data = {}
+            if answers:
+                with open(answers) as f:
+                    data = yaml.safe_load(f) or {}
+            if not isinstance(data, dict):
+                raise ValueError(f"{answers} must contain a mapping of settings, not a {type(data).__name__}")
+            data.update(UserConfig.env_overrides(os.environ))
+        except (OSError, ValueError, yaml.YAMLError) as e:
+            result["errors"].append(f"Could not read configuration: {e}")
+            print(json.dumps(result, indent=2))
+            return 2
+
+        hw_accel = data.pop("hw_accel", "auto")
+        self.config = UserConfig.from_dict(data)
+        if hw_accel != "auto":
+            self.config.hw_accel = hw_accel
+        errors = self.config.validate()
+        if errors:
+            result["errors"] = errors
+            print(json.dumps(result, indent=2))
+            return 2
+
+        # Detect only what the answers left unspecified
+        probe = HardwareProbe()
+        if "transcode_tmpfs_mb" not in data:
+            self.config.transcode_tmpfs_mb = probe.transcode_tmpfs_mb(self.config.transcode_streams)
+        if hw_accel == "auto":
+            probe.apply_transcoding(self.config)
+        elif hw_accel != "none" and not self.config.hw_devices:
+            # An explicit accel only skips choosing one; its devices are still found here
+            probe.apply_transcoding(self.config, hw_accel)
+            if not self.config.hw_devices:
+                result["errors"].append(f"hw_accel: no {hw_accel} render device found; set hw_devices or use none")
+                print(json.dumps(result, indent=2))
+                return 2
+
+        try:
+            with self.timer.span("setup"):
+                self.prefetch_core_images()
+                self.install_media_pool()
+                self.create_directories()
+                self.generate_compose()
+                with self.timer.span("save_settings"):
+                    self.config.save()
+                self.seed_media_server_config()
+                self.generate_homepage_config()
+                self.generate_gateway_config()
+                self.generate_qbittorrent_config()
+                self.generate_sabnzbd_config()
+                self.generate_nzbget_config()
+                self.install_update_timer()
+                self.install_library_indexer()
+                self.install_backup_timer()
+                self.install_database_maintenance()
+                self.restore_config()
+                deployed = self.deploy_stack()
+                if deployed:
+                    result["startup_seconds"] = self.wait_until_ready()
+        except Exception as e:
+            deployed = False
+            self.deploy_error = str(e)
+
+        result["config"] = asdict(self.config)
+        result["compose_file"] = str(COMPOSE_FILE)
+        if deployed:
+            result["status"] = "ok"
+            result["urls"] = self.service_urls(self._local_ip("localhost"))
+        else:
+            result["errors"].append(self.deploy_error or "Deployment failed")
+        if self.warnings:
+            result["warnings"] = self.warnings
+        result["phase_seconds"] = self.timer.totals()
+        self.write_trace()
+        print(json.dumps(result, indent=2))
+        return 0 if deployed else 1
+
+    def write_trace(self) -> None:
+        """Save the phase timing trace next to the compose file."""
+        try:
+            self.timer.write()
+        except OSError:
+            pass
+
+    @staticmethod
+    def _local_ip(default: str) -> str:
+        """Return the host's primary IP address."""
+        try:
+            result = subprocess.run(["hostname", "-I"], capture_output=True, text=True)
+            return result.stdout.strip().split()[0]
         except Exception:
-            ip = "YOUR_IP"
+            return default
+
+    def show_completion(self) -> None:
+        """Display completion message with access URLs."""
+        ip = self._local_ip("YOUR_IP")
 
         ports = {
             "jellyfin": 8096,
@@ -787,6 +4932,7 @@ Proceed with this configuration?
             "ombi": 3579,
         }
 
+        topology = Topology(self.config)
         media_port = ports.get(self.config.media_server, 8096)
         dashboard_port = ports.get(self.config.dashboard, 3000)
 
@@ -795,7 +4941,7 @@ Proceed with this configuration?
         req_mgr_line = ""
         if req_mgr != "none":
             req_port = ports.get(req_mgr, 5055)
-            req_mgr_line = f"\nRequests:      http://{ip}:{req_port}"
+            req_mgr_line = f"\nRequests:      http://{topology.address(req_mgr, ip)}:{req_port}"
 
         completion_text = f"""
 Setup Complete!
@@ -804,11 +4950,11 @@ Your services are now running.
 
 Access your server at:
 
-Dashboard:     http://{ip}:{dashboard_port}
-{self.config.media_server.title()}:      http://{ip}:{media_port}{req_mgr_line}
-Radarr:        http://{ip}:7878
-Sonarr:        http://{ip}:8989
-Prowlarr:      http://{ip}:9696
+Dashboard:     http://{topology.address(self.config.dashboard, ip)}:{dashboard_port}
+{self.config.media_server.title()}:      http://{topology.address(self.config.media_server, ip)}:{media_port}{req_mgr_line}
+Radarr:        http://{topology.address('radarr', ip)}:7878
+Sonarr:        http://{topology.address('sonarr', ip)}:8989
+Prowlarr:      http://{topology.address('prowlarr', ip)}:9696
 
 Configuration saved to:
 {COMPOSE_FILE}
@@ -821,51 +4967,337 @@ Enjoy your media server!
 """
         self.ui.msgbox(completion_text, height=28, width=55)
 
+    def _move_tree(self, src: Path, dst: Path) -> None:
+        """Move a directory's contents into dst, renaming where possible."""
+        if not src.exists():
+            return
+        dst.mkdir(parents=True, exist_ok=True)
+        for entry in src.iterdir():
+            target = dst / entry.name
+            if target.exists() and entry.is_dir() and not entry.is_symlink():
+                self._move_tree(entry, target)
+            elif target.exists():
+                print(f"Skipping {entry}: {target} already exists")
+                continue
+            else:
+                # Same-filesystem rename is instant; shutil falls back to copy
+                shutil.move(str(entry), str(target))
+        try:
+            src.rmdir()
+        except OSError:
+            pass
+
+    def migrate_data_layout(self) -> int:
+        """Move an existing split-layout install onto the unified /data root."""
+        self.config = UserConfig.load()
+        if self.config.data_layout == "unified":
+            print("Already using the unified /data layout.")
+            return 0
+
+        compose = ["docker", "compose", "-f", str(COMPOSE_FILE)]
+        if COMPOSE_FILE.exists():
+            print("Stopping services...")
+            subprocess.run([*compose, "stop"], cwd=str(ASTRO_DIR), check=True)
+
+        old = StoragePaths(self.config)
+        old_target = old.download_target("torrents")
+        self.config.data_layout = "unified"
+        new = StoragePaths(self.config)
+
+        moves = [(old.media_dir / lib, new.media_dir / lib) for lib in ["movies", "tv", "music", "books"]]
+        moves += [(old.download_root / kind, new.download_root / kind) for kind in ["torrents", "usenet"]]
+        for src, dst in moves:
+            print(f"Moving {src} -> {dst}")
+            self._move_tree(src, dst)
+        try:
+            old.media_dir.rmdir()
+        except OSError:
+            pass
+
+        self.create_directories()
+        self.generate_compose()
+        self.config.save()
+
+        if self.config.enable_torrents:
+            # Existing torrents and categories would otherwise look for their data under the old mount
+            qbittorrent = new.config_dir / "qbittorrent" / "qBittorrent"
+            new_target = new.download_target("torrents")
+            changed = sum(TorrentResume.rewrite(d, old_target, new_target)
+                          for d in (qbittorrent / "BT_backup", qbittorrent / "data" / "BT_backup"))
+            TorrentResume.rewrite_categories(qbittorrent / "categories.json", old_target, new_target)
+            print(f"Re-pointed {changed} torrents at {new_target}")
+            self.generate_qbittorrent_config()
+
+        print("Starting services...")
+        result = subprocess.run([*compose, "up", "-d", "--remove-orphans"], cwd=str(ASTRO_DIR))
+        print(
+            "\nMigration complete. Update paths inside your apps:\n"
+            "  Radarr/Sonarr/Lidarr root folders: /data/media/{movies,tv,music}\n"
+            "  qBittorrent default save path:    /data/torrents/complete (if you had changed it)\n"
+            "  SABnzbd/NZBGet folders:           /data/usenet/{incomplete,complete}\n"
+            "  Media server libraries:           /data/media/{movies,tv,music}"
+        )
+        return result.returncode
+
+    def _container_states(self, names: list[str]) -> dict[str, dict]:
+        """Return {container_name: inspect data} for containers that exist."""
+        if not names:
+            return {}
+        result = subprocess.run(["docker", "inspect", *names], capture_output=True, text=True)
+        # inspect exits non-zero when some names are missing but still lists the rest
+        try:
+            return {c["Name"].lstrip("/"): c for c in json.loads(result.stdout or "[]")}
+        except ValueError:
+            return {}
+
+    def plan_apply(self, old: dict, new: dict) -> dict:
+        """Diff the new compose config against the deployed file and containers."""
+        plan = ComposeGenerator.diff(old, new)
+        services = new["services"]
+        containers = self._container_states([svc.get("container_name", name) for name, svc in services.items()])
+
+        plan["start"] = []
+        for name in list(plan["unchanged"]):
+            state = containers.get(services[name].get("container_name", name))
+            if state is None or not state["State"]["Running"]:
+                plan["unchanged"].remove(name)
+                plan["start"].append(name)
+            elif state["Config"]["Image"] != services[name]["image"]:
+                # Deployed by hand or from an older file; recreate to converge
+                plan["unchanged"].remove(name)
+                plan["changed"][name] = ["image"]
+        return plan
+
+    @staticmethod
+    def format_plan(plan: dict) -> str:
+        """Render an apply plan as human-readable lines."""
+        lines = [f"+ {name} (add)" for name in plan["added"]]
+        lines += [f"~ {name} (recreate: {', '.join(keys)})" for name, keys in plan["changed"].items()]
+        lines += [f"- {name} (remove)" for name in plan["removed"]]
+        lines += [f"> {name} (start)" for name in plan["start"]]
+        lines.append(f"= {len(plan['unchanged'])} service(s) unchanged")
+        return "\n".join(lines)
+
+    def apply(self, dry_run: bool = False) -> int:
+        """Regenerate from saved settings and recreate only what changed."""
+        self.config = UserConfig.load()
+        old = {}
+        if COMPOSE_FILE.exists():
+            with open(COMPOSE_FILE) as f:
+                old = yaml.safe_load(f) or {}
+        hosts = ComposeGenerator(self.config).generate_split()
+        new = hosts[Topology(self.config).local]
+
+        plan = self.plan_apply(old, new)
+        print(self.format_plan(plan))
+        if dry_run:
+            return 0
+
+        self.install_media_pool()
+        self.create_directories()
+        self.generate_compose(hosts)
+        self.config.save()
+        self.seed_media_server_config()
+        self.generate_homepage_config()
+        self.generate_gateway_config()
+        self.generate_qbittorrent_config()
+        self.generate_sabnzbd_config()
+        self.generate_nzbget_config()
+        self.install_update_timer()
+        self.install_library_indexer()
+        self.install_backup_timer()
+        self.install_database_maintenance()
+
+        compose = ["docker", "compose", "-f", str(COMPOSE_FILE)]
+        old_services = old.get("services", {})
+        for name in plan["removed"]:
+            container = old_services[name].get("container_name", name)
+            subprocess.run(["docker", "rm", "-f", container], capture_output=True)
+
+        # Unchanged images are never re-resolved against the registry
+        pulls = [new["services"][name]["image"] for name in plan["added"]]
+        pulls += [new["services"][name]["image"] for name, keys in plan["changed"].items() if "image" in keys]
+        if pulls:
+            self.puller.submit(pulls)
+            for percent, text in self.puller.watch(interval=2):
+                print(f"[{percent:3d}%] {text.splitlines()[0]}")
+            self.lock_images()
+
+        targets = plan["added"] + list(plan["changed"]) + plan["start"]
+        if not targets:
+            return 0
+        result = subprocess.run([*compose, "up", "-d", "--no-deps", *targets], cwd=str(ASTRO_DIR))
+        return result.returncode
+
     def run(self) -> int:
         """Run the setup wizard."""
         steps = [
             self.show_welcome,
             self.select_media_server,
+            self.detect_hardware,
             self.select_request_manager,
             self.select_download_method,
             self.select_downloader,
+            self.select_data_layout,
+            self.select_storage_tiers,
+            self.select_media_pool,
             self.select_gateway,
             self.select_dashboard,
+            self.select_resource_profile,
+            self.select_update_strategy,
             self.configure_timezone,
             self.show_summary,
         ]
 
-        for step in steps:
-            if not step():
-                self.ui.msgbox("Setup cancelled.")
-                return 1
+        with self.timer.span("wizard"):
+            for step in steps:
+                with self.timer.span(step.__name__):
+                    completed = step()
+                if not completed:
+                    self.puller.shutdown(cancel=True)
+                    self.ui.msgbox("Setup cancelled.")
+                    return 1
+                if step == self.show_welcome:
+                    self.prefetch_core_images()
 
         # Execute setup
         try:
-            self.create_directories()
-            self.generate_compose()
-            self.generate_homepage_config()
+            with self.timer.span("setup"):
+                self.install_media_pool()
+                self.create_directories()
+                self.generate_compose()
+                with self.timer.span("save_settings"):
+                    self.config.save()
+                self.seed_media_server_config()
+                self.generate_homepage_config()
+                self.generate_gateway_config()
+                self.generate_qbittorrent_config()
+                self.generate_sabnzbd_config()
+                self.generate_nzbget_config()
+                self.install_update_timer()
+                self.install_library_indexer()
+                self.install_backup_timer()
+                self.install_database_maintenance()
+                self.restore_config()
+                deployed = self.deploy_stack()
+                if deployed:
+                    self.wait_until_ready()
+            self.write_trace()
 
-            if self.deploy_stack():
+            if deployed:
                 self.show_completion()
                 return 0
             else:
                 self.ui.msgbox("Deployment encountered errors.\nCheck docker logs for details.")
                 return 1
         except Exception as e:
+            self.write_trace()
             self.ui.msgbox(f"Setup failed:\n{str(e)}")
             return 1
 
 
+def check_topology(answers: Optional[Path] = None) -> int:
+    """Print each host's services and shared volumes, plus any problems, as JSON."""
+    if answers and not answers.is_file():
+        # UserConfig.load would quietly check the installed config instead
+        print(json.dumps({"hosts": {}, "problems": [f"Could not read configuration: {answers} does not exist"]},
+                         indent=2))
+        return 2
+    config = UserConfig.load(answers) if answers else UserConfig.load()
+    topology = Topology(config)
+    problems = config.validate()
+    hosts = {}
+    if not problems:
+        hosts = ComposeGenerator(config).generate_split()
+        problems = topology.check(hosts)
+    print(json.dumps({
+        "hosts": {
+            host: {
+                "address": topology.hosts.get(host, "localhost"),
+                "services": list(part["services"]),
+                "volumes": {name: volume["driver_opts"]["device"] for name, volume in part.get("volumes", {}).items()},
+            }
+            for host, part in hosts.items()
+        },
+        "problems": problems,
+    }, indent=2))
+    return 1 if problems else 0
+
+
 def main():
     """Entry point."""
+    parser = argparse.ArgumentParser(description="AstroMediaServer setup wizard")
+    parser.add_argument("--bundle-images", metavar="DIR", type=Path,
+                        help="save every known image into an offline bundle at DIR and exit")
+    parser.add_argument("--migrate-data", action="store_true",
+                        help="move an existing install onto the unified /data layout")
+    parser.add_argument("--apply", action="store_true",
+                        help="regenerate from saved settings and recreate only changed services")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="with --apply, --update or --fix-permissions, report what would change without changing it")
+    parser.add_argument("--update", action="store_true",
+                        help="pull and roll out image updates one batch at a time")
+    parser.add_argument("--rollback", action="store_true",
+                        help="with --update, return every service to the previous image lock")
+    parser.add_argument("--maintain-databases", action="store_true",
+                        help="check, prune and compact the *arr and request manager databases")
+    parser.add_argument("--maintenance-window", action="store_true",
+                        help="with --update or --maintain-databases, stop once update_window closes")
+    parser.add_argument("--fix-permissions", action="store_true",
+                        help="give config, media and download files back to PUID/PGID where they drifted")
+    parser.add_argument("--index-library", action="store_true",
+                        help="refresh the media library index and publish per-library sizes")
+    parser.add_argument("--full", action="store_true",
+                        help="with --index-library, re-list every directory instead of only changed ones")
+    parser.add_argument("--backup", action="store_true",
+                        help="snapshot the config directory into the backup repository")
+    parser.add_argument("--restore", metavar="SERVICE", nargs="+",
+                        help="restore these services' configs from the latest backup and restart them")
+    parser.add_argument("--snapshot", metavar="NAME",
+                        help="with --restore, restore from this snapshot instead of the latest")
+    parser.add_argument("--check-topology", action="store_true",
+                        help="generate every host's compose file from --config or saved settings and "
+                             "report problems, without writing anything")
+    parser.add_argument("--config", metavar="FILE", type=Path,
+                        help="answers file for unattended setup (implies --non-interactive)")
+    parser.add_argument("--non-interactive", action="store_true",
+                        help="configure from --config and ASTRO_* variables without prompts, printing JSON")
+    args = parser.parse_args()
+
+    if args.bundle_images:
+        ImageBundle(args.bundle_images).build(dict.fromkeys(ComposeGenerator.IMAGES.values()))
+        sys.exit(0)
+
+    if args.check_topology:
+        sys.exit(check_topology(args.config))
+
     # Ensure running as root for system changes
     if os.geteuid() != 0:
         print("This script must be run as root")
         print("Try: sudo python3 astro-setup.py")
         sys.exit(1)
 
+    if args.config or args.non_interactive:
+        sys.exit(SetupWizard(ui=HeadlessUI()).run_headless(args.config))
+
     wizard = SetupWizard()
+    if args.migrate_data:
+        sys.exit(wizard.migrate_data_layout())
+    if args.apply:
+        sys.exit(wizard.apply(dry_run=args.dry_run))
+    if args.update:
+        sys.exit(wizard.update(maintenance_window=args.maintenance_window, dry_run=args.dry_run,
+                               rollback=args.rollback))
+    if args.maintain_databases:
+        sys.exit(wizard.maintain_databases(maintenance_window=args.maintenance_window))
+    if args.fix_permissions:
+        sys.exit(wizard.fix_permissions(dry_run=args.dry_run))
+    if args.index_library:
+        sys.exit(wizard.index_library(full=args.full))
+    if args.backup:
+        sys.exit(wizard.backup())
+    if args.restore:
+        sys.exit(wizard.restore(args.restore, snapshot=args.snapshot))
     sys.exit(wizard.run())
 
 
@@ -18,6 +18,11 @@ UBUNTU_ISO_URL="https://releases.ubuntu.com/noble/ubuntu-${UBUNTU_VERSION}-live-
 UBUNTU_ISO_NAME="ubuntu-${UBUNTU_VERSION}-live-server-amd64.iso"
 OUTPUT_ISO_NAME="astro-media-server-v0.1.iso"
 
+# Build options (set from command-line flags)
+KEEP_BUILD=false
+BUNDLE_IMAGES=false
+ANSWERS_FILE=""
+
 # Colors for output
 RED='\033[0;31m'
 GREEN='\033[0;32m'
@@ -124,6 +129,15 @@ inject_autoinstall() {
         echo "print('Astro setup placeholder')" >> "${extract_dir}/astro/astro-setup.py"
     fi
 
+    # Copy companion tools
+    for tool in "${PROJECT_DIR}"/scripts/astro-*.py; do
+        [[ "$(basename "$tool")" == "astro-setup.py" ]] && continue
+        cp "$tool" "${extract_dir}/astro/"
+    done
+
+    # Copy download client config templates
+    cp -r "${PROJECT_DIR}/config-templates" "${extract_dir}/astro/"
+
     # Copy systemd service
     if [ -f "${PROJECT_DIR}/services/astro-init.service" ]; then
         cp "${PROJECT_DIR}/services/astro-init.service" "${extract_dir}/astro/"
@@ -145,6 +159,12 @@ WantedBy=multi-user.target
 EOF
     fi
 
+    # Copy answers file for unattended first-boot setup
+    if [[ -n "$ANSWERS_FILE" ]]; then
+        log_info "Including answers file for unattended setup..."
+        cp "$ANSWERS_FILE" "${extract_dir}/astro/answers.yaml"
+    fi
+
     # Modify GRUB to enable autoinstall
     if [ -f "${extract_dir}/boot/grub/grub.cfg" ]; then
         log_info "Modifying GRUB configuration for autoinstall..."
@@ -160,6 +180,23 @@ EOF
     log_success "Autoinstall configuration injected"
 }
 
+# Save every stack image into an offline bundle on the ISO
+bundle_images() {
+    log_info "Bundling container images for offline install..."
+
+    if ! docker info &>/dev/null; then
+        log_error "Docker is required on the build host for --bundle-images"
+    fi
+
+    local bundle_dir="${BUILD_DIR}/iso-extract/astro/images"
+    rm -rf "$bundle_dir"
+
+    python3 "${PROJECT_DIR}/scripts/astro-setup.py" --bundle-images "$bundle_dir" \
+        || log_error "Failed to bundle container images"
+
+    log_success "Image bundle created ($(du -sh "$bundle_dir" | cut -f1))"
+}
+
 # Rebuild ISO
 rebuild_iso() {
     log_info "Rebuilding ISO..."
@@ -213,13 +250,32 @@ main() {
     echo "=============================================="
     echo ""
 
+    while [[ $# -gt 0 ]]; do
+        case "$1" in
+            --keep-build)    KEEP_BUILD=true ;;
+            --bundle-images) BUNDLE_IMAGES=true ;;
+            --answers)
+                [[ -f "${2:-}" ]] || log_error "--answers requires an existing file"
+                ANSWERS_FILE="$2"
+                shift
+                ;;
+            *) log_error "Unknown option: $1" ;;
+        esac
+        shift
+    done
+
     check_dependencies
     download_iso
     extract_iso
     inject_autoinstall
+
+    if [[ "$BUNDLE_IMAGES" == true ]]; then
+        bundle_images
+    fi
+
     rebuild_iso
 
-    if [ "${1:-}" != "--keep-build" ]; then
+    if [[ "$KEEP_BUILD" != true ]]; then
         cleanup
     fi
 
@@ -0,0 +1,51 @@
+"""Shared fixtures: the setup, exporter and log scripts loaded as modules."""
+
+import importlib.util
+import os
+from pathlib import Path
+
+import pytest
+
+SCRIPTS = Path(__file__).resolve().parent.parent / "scripts"
+
+
+def load_script(name: str):
+    """Import a scripts/astro-*.py file, which is not importable by name."""
+    spec = importlib.util.spec_from_file_location(name.replace("-", "_"), SCRIPTS / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def astro(tmp_path_factory):
+    """astro-setup.py with its install and systemd paths inside a scratch dir."""
+    root = tmp_path_factory.mktemp("astro")
+    (root / "systemd").mkdir()
+    # Path constants are read from the environment at import time
+    os.environ["ASTRO_ROOT"] = str(root / "opt")
+    os.environ["ASTRO_SYSTEMD_DIR"] = str(root / "systemd")
+    os.environ["DOCKER_HOST"] = f"unix://{root / 'docker.sock'}"
+    return load_script("astro-setup")
+
+
+@pytest.fixture(scope="session")
+def metrics():
+    """astro-metrics.py, the per-container cgroup exporter."""
+    return load_script("astro-metrics")
+
+
+@pytest.fixture(scope="session")
+def logs():
+    """astro-logs.py, the multi-container log tailer."""
+    return load_script("astro-logs")
+
+
+@pytest.fixture
+def generate(astro):
+    """Return a function building compose services for answers on given hardware."""
+    def build(answers: dict, cpus: int = 8, memory_mb: int = 16384, probe=None) -> dict:
+        config = astro.UserConfig.from_dict(answers)
+        resources = astro.HostResources(cpus=cpus, memory_mb=memory_mb)
+        return astro.ComposeGenerator(config, resources, probe or astro.HardwareProbe()).generate()["services"]
+    return build
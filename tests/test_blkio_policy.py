@@ -0,0 +1,33 @@
+"""Block-I/O weights and per-device throttles."""
+
+
+def disk_probe(astro):
+    """A probe placing the media library on sdb and everything else on sda."""
+    class Probe(astro.HardwareProbe):
+        def backing_disks(self, path):
+            return ["/dev/sdb"] if "media" in str(path) else ["/dev/sda"]
+    return Probe()
+
+
+def test_weights_only_by_default(astro, generate):
+    services = generate({}, probe=disk_probe(astro))
+    assert services["jellyfin"]["blkio_config"] == {"weight": 1000}
+    assert services["qbittorrent"]["blkio_config"] == {"weight": 100}
+    assert services["radarr"]["blkio_config"] == {"weight": 200}
+
+
+def test_downloader_and_import_throttles(astro, generate):
+    services = generate({
+        "download_read_bps": 1000,
+        "download_write_iops": 50,
+        "import_write_bps": 2000,
+    }, probe=disk_probe(astro))
+
+    both = [{"path": "/dev/sda", "rate": 1000}, {"path": "/dev/sdb", "rate": 1000}]
+    assert services["qbittorrent"]["blkio_config"]["device_read_bps"] == both
+    assert [e["rate"] for e in services["qbittorrent"]["blkio_config"]["device_write_iops"]] == [50, 50]
+    assert "device_write_bps" not in services["qbittorrent"]["blkio_config"]
+
+    for name in ["radarr", "sonarr", "lidarr", "prowlarr"]:
+        assert services[name]["blkio_config"]["device_write_bps"] == [{"path": "/dev/sdb", "rate": 2000}]
+    assert services["jellyfin"]["blkio_config"] == {"weight": 1000}
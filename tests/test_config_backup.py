@@ -0,0 +1,70 @@
+"""SQLite handling in the config snapshots."""
+
+import sqlite3
+
+
+def wal_database(path):
+    """Create a WAL database whose rows are still only in its -wal file."""
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=wal")
+    db.execute("PRAGMA wal_autocheckpoint=0")
+    db.execute("CREATE TABLE items (id INTEGER)")
+    db.executemany("INSERT INTO items VALUES (?)", [(i,) for i in range(50)])
+    db.commit()
+    return db
+
+
+def test_live_database_includes_wal_frames(astro, tmp_path):
+    config = tmp_path / "config" / "sonarr"
+    config.mkdir(parents=True)
+    writer = wal_database(config / "sonarr.db")
+    backup = astro.ConfigBackup(tmp_path / "repo")
+
+    report = backup.create(tmp_path / "config")
+    writer.close()
+    assert report["errors"] == []
+    assert "sonarr/sonarr.db-wal" not in backup.load(report["snapshot"])["files"]
+
+    backup.restore(tmp_path / "config", ["sonarr"])
+    restored = sqlite3.connect(config / "sonarr.db")
+    assert restored.execute("SELECT count(*) FROM items").fetchone() == (50,)
+
+
+def test_locked_database_is_reported(astro, tmp_path):
+    config = tmp_path / "config" / "radarr"
+    config.mkdir(parents=True)
+    writer = sqlite3.connect(config / "radarr.db", isolation_level=None)
+    writer.execute("CREATE TABLE items (id INTEGER)")
+    writer.execute("BEGIN EXCLUSIVE")
+    backup = astro.ConfigBackup(tmp_path / "repo")
+    backup.BUSY_TIMEOUT = 0.2
+
+    try:
+        report = backup.create(tmp_path / "config")
+    finally:
+        writer.rollback()
+        writer.close()
+    assert [error.split(":")[0] for error in report["errors"]] == ["radarr/radarr.db"]
+    assert "radarr/radarr.db" not in backup.load(report["snapshot"])["files"]
+
+
+def test_unopenable_database_keeps_sidecars(astro, tmp_path):
+    config = tmp_path / "config" / "plex"
+    config.mkdir(parents=True)
+    database = config / "library.db"
+    database.write_bytes(astro.ConfigBackup.SQLITE_MAGIC + b"\xff" * 200)
+    (config / "library.db-wal").write_bytes(b"wal frames")
+    (config / "library.db-shm").write_bytes(b"index")
+    backup = astro.ConfigBackup(tmp_path / "repo")
+
+    report = backup.create(tmp_path / "config")
+    assert report["errors"] == []
+    assert set(backup.load(report["snapshot"])["files"]["plex/library.db"]["sidecars"]) == {"-wal", "-shm"}
+
+    for path in config.iterdir():
+        path.unlink()
+    backup.restore(tmp_path / "config", ["plex"])
+    assert (config / "library.db-wal").read_bytes() == b"wal frames"
+    # The open attempt may rewrite the -shm index; only its presence matters
+    assert (config / "library.db-shm").exists()
+    assert database.read_bytes().startswith(astro.ConfigBackup.SQLITE_MAGIC)
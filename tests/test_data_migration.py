@@ -0,0 +1,36 @@
+"""Re-pointing qBittorrent torrents during --migrate-data."""
+
+import json
+
+
+def test_bencode_round_trip(astro):
+    value = {b"info-hash": b"\x00\xffab", b"pieces": [1, -2, b"x"], b"save_path": b"/downloads/complete/"}
+    encoded = astro.TorrentResume.encode(value)
+    assert astro.TorrentResume.decode(encoded) == (value, len(encoded))
+
+
+def test_rewrites_save_paths(astro, tmp_path):
+    resume = tmp_path / "BT_backup"
+    resume.mkdir()
+    moved = {b"save_path": b"/downloads/complete/", b"qBt-savePath": b"/downloads/complete",
+             b"qBt-downloadPath": b"/downloads/incomplete", b"total_uploaded": 42}
+    elsewhere = {b"save_path": b"/downloads-old/x", b"qBt-savePath": b"/media/seed"}
+    (resume / "a.fastresume").write_bytes(astro.TorrentResume.encode(moved))
+    (resume / "b.fastresume").write_bytes(astro.TorrentResume.encode(elsewhere))
+
+    assert astro.TorrentResume.rewrite(resume, "/downloads", "/data/torrents") == 1
+    a, _ = astro.TorrentResume.decode((resume / "a.fastresume").read_bytes())
+    assert a == {b"save_path": b"/data/torrents/complete/", b"qBt-savePath": b"/data/torrents/complete",
+                 b"qBt-downloadPath": b"/data/torrents/incomplete", b"total_uploaded": 42}
+    b, _ = astro.TorrentResume.decode((resume / "b.fastresume").read_bytes())
+    assert b == elsewhere
+
+
+def test_rewrites_categories(astro, tmp_path):
+    path = tmp_path / "categories.json"
+    path.write_text(json.dumps({"radarr": {"save_path": "/downloads/complete/radarr"}, "misc": {"save_path": ""}}))
+    astro.TorrentResume.rewrite_categories(path, "/downloads", "/data/torrents")
+    assert json.loads(path.read_text()) == {
+        "radarr": {"save_path": "/data/torrents/complete/radarr"},
+        "misc": {"save_path": ""},
+    }
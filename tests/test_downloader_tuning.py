@@ -0,0 +1,34 @@
+"""Download client settings sized from the container's own limits."""
+
+import pytest
+
+HOST = (8, 16384)
+
+
+@pytest.mark.parametrize("service, cpus, memory_mb", [
+    (None, 8, 16384),
+    ({}, 8, 16384),
+    ({"cpuset": "6-7"}, 2, 16384),
+    ({"cpuset": "0,2-3", "cpus": 4.0}, 3, 16384),
+    ({"cpus": 1.5, "mem_limit": "1638m"}, 2, 1638),
+    ({"mem_limit": "2g"}, 8, 2048),
+    ({"mem_limit": 1 << 30}, 8, 1024),
+])
+def test_container_limits(astro, service, cpus, memory_mb):
+    tuning = astro.DownloaderTuning.for_container(service, astro.HostResources(*HOST), rotational=False)
+    assert (tuning.cpus, tuning.memory_mb) == (cpus, memory_mb)
+
+
+def test_streaming_first_downloader_is_sized_for_its_cpuset(astro, generate):
+    services = generate({"resource_profile": "streaming-first"}, cpus=HOST[0], memory_mb=HOST[1])
+    container = astro.DownloaderTuning.for_container(services["qbittorrent"], astro.HostResources(*HOST), False)
+    host = astro.DownloaderTuning(astro.HostResources(*HOST), False)
+
+    pinned = container.qbittorrent("/downloads/complete", "/downloads/incomplete")["BitTorrent"]
+    unpinned = host.qbittorrent("/downloads/complete", "/downloads/incomplete")["BitTorrent"]
+    assert container.cpus == 2
+    assert int(pinned["Session\\AsyncIOThreadsCount"]) < int(unpinned["Session\\AsyncIOThreadsCount"])
+    assert int(pinned["Session\\HashingThreadsCount"]) <= container.cpus
+    # Cache fits well inside the 10% memory limit the profile gives downloaders
+    assert int(pinned["Session\\DiskCacheSize"]) * 4 < int(services["qbittorrent"]["mem_limit"][:-1])
+    assert int(pinned["Session\\DiskCacheSize"]) < int(unpinned["Session\\DiskCacheSize"])
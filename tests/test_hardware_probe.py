@@ -0,0 +1,82 @@
+"""HardwareProbe GPU detection against fake sysfs and /dev trees."""
+
+import os
+
+import pytest
+
+
+def fake_gpu(root, vendor_id=None):
+    """Build sys/ and dev/ trees with one render node, or none if vendor_id is None."""
+    sys_root, dev_root = root / "sys", root / "dev"
+    (dev_root / "dri").mkdir(parents=True)
+    (sys_root / "class" / "drm").mkdir(parents=True)
+    if vendor_id is not None:
+        (dev_root / "dri" / "card0").touch()
+        (dev_root / "dri" / "renderD128").touch()
+        device = sys_root / "class" / "drm" / "renderD128" / "device"
+        device.mkdir(parents=True)
+        (device / "vendor").write_text(f"{vendor_id}\n")
+    return sys_root, dev_root
+
+
+@pytest.mark.parametrize("vendor_id, vendor, accel", [
+    ("0x8086", "intel", "qsv"),
+    ("0x1002", "amd", "vaapi"),
+])
+def test_detects_supported_gpu(astro, tmp_path, vendor_id, vendor, accel):
+    probe = astro.HardwareProbe(*fake_gpu(tmp_path, vendor_id))
+    devices = probe.render_devices()
+    assert [(d.path, d.vendor, d.gid) for d in devices] == [("/dev/dri/renderD128", vendor, os.getgid())]
+
+    config = astro.UserConfig()
+    assert probe.apply_transcoding(config) == accel
+    assert config.hw_accel == accel
+    assert config.hw_devices == ["/dev/dri/renderD128"]
+    assert config.hw_group_ids == [str(os.getgid())]
+
+
+def test_nvidia_only_is_not_used(astro, tmp_path):
+    probe = astro.HardwareProbe(*fake_gpu(tmp_path, "0x10de"))
+    assert probe.transcode_support() == ("none", [])
+
+
+def test_no_gpu(astro, tmp_path):
+    probe = astro.HardwareProbe(*fake_gpu(tmp_path))
+    config = astro.UserConfig()
+    assert probe.apply_transcoding(config) == "none"
+    assert config.hw_devices == []
+    assert config.hw_group_ids == []
+
+
+@pytest.mark.parametrize("server", ["plex", "jellyfin", "emby"])
+@pytest.mark.parametrize("vendor_id, accel", [("0x8086", "qsv"), ("0x1002", "vaapi")])
+def test_media_server_gets_render_devices(astro, generate, tmp_path, server, vendor_id, accel):
+    probe = astro.HardwareProbe(*fake_gpu(tmp_path, vendor_id))
+    config = astro.UserConfig(media_server=server)
+    probe.apply_transcoding(config)
+
+    service = generate(astro.asdict(config), probe=probe)[server]
+    env = service["environment"]
+    assert service["devices"] == ["/dev/dri/renderD128:/dev/dri/renderD128"]
+    assert service["group_add"] == [str(os.getgid())]
+    if server == "plex":
+        # Plex bundles its own drivers
+        assert "LIBVA_DRIVER_NAME" not in env
+    else:
+        assert env["LIBVA_DRIVER_NAME"] == astro.ComposeGenerator.VAAPI_DRIVERS[accel]
+    if server == "jellyfin" and accel == "qsv":
+        assert env["DOCKER_MODS"] == "linuxserver/mods:jellyfin-opencl-intel"
+    else:
+        assert "DOCKER_MODS" not in env
+
+
+@pytest.mark.parametrize("server", ["plex", "jellyfin", "emby"])
+def test_no_gpu_adds_nothing(astro, generate, tmp_path, server):
+    probe = astro.HardwareProbe(*fake_gpu(tmp_path))
+    config = astro.UserConfig(media_server=server)
+    probe.apply_transcoding(config)
+
+    service = generate(astro.asdict(config), probe=probe)[server]
+    assert "devices" not in service
+    assert "group_add" not in service
+    assert "LIBVA_DRIVER_NAME" not in service["environment"]
@@ -0,0 +1,44 @@
+"""Answers-file errors in headless mode, reported as a JSON document."""
+
+import json
+
+import pytest
+
+
+def run(astro, answers, capsys) -> tuple[int, dict]:
+    code = astro.SetupWizard(ui=astro.HeadlessUI()).run_headless(answers)
+    return code, json.loads(capsys.readouterr().out)
+
+
+@pytest.mark.parametrize("content", ["- plex\n- jellyfin\n", "jellyfin\n"])
+def test_answers_must_be_a_mapping(astro, tmp_path, capsys, content):
+    answers = tmp_path / "answers.yaml"
+    answers.write_text(content)
+    code, result = run(astro, answers, capsys)
+    assert code == 2
+    assert result["status"] == "error"
+    assert "must contain a mapping" in result["errors"][0]
+
+
+def test_explicit_accel_without_devices_is_rejected(astro, tmp_path, capsys, monkeypatch):
+    (tmp_path / "dev" / "dri").mkdir(parents=True)
+    probe = astro.HardwareProbe(tmp_path / "sys", tmp_path / "dev", tmp_path / "proc")
+    monkeypatch.setattr(astro, "HardwareProbe", lambda: probe)
+    answers = tmp_path / "answers.yaml"
+    answers.write_text("hw_accel: qsv\n")
+    code, result = run(astro, answers, capsys)
+    assert code == 2
+    assert result["errors"] == ["hw_accel: no qsv render device found; set hw_devices or use none"]
+
+
+def test_explicit_accel_finds_its_devices(astro, tmp_path):
+    for node, vendor in [("renderD128", "0x1002"), ("renderD129", "0x8086")]:
+        (tmp_path / "dev" / "dri").mkdir(parents=True, exist_ok=True)
+        (tmp_path / "dev" / "dri" / node).touch()
+        (tmp_path / "sys" / "class" / "drm" / node / "device").mkdir(parents=True)
+        (tmp_path / "sys" / "class" / "drm" / node / "device" / "vendor").write_text(vendor)
+    probe = astro.HardwareProbe(tmp_path / "sys", tmp_path / "dev")
+    config = astro.UserConfig()
+    # Auto-detection would prefer Intel; an explicit vaapi keeps the AMD node
+    assert probe.apply_transcoding(config, "vaapi") == "vaapi"
+    assert config.hw_devices == ["/dev/dri/renderD128"]
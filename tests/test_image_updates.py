@@ -0,0 +1,52 @@
+"""--update --dry-run and --rollback for both update strategies."""
+
+import json
+
+import pytest
+import yaml
+
+SONARR = "lscr.io/linuxserver/sonarr:latest"
+
+
+@pytest.fixture
+def installed(astro, monkeypatch):
+    """Write settings and a one-service compose file; return a function running --update."""
+    astro.ASTRO_DIR.mkdir(parents=True, exist_ok=True)
+    astro.COMPOSE_FILE.write_text(yaml.safe_dump({"services": {"sonarr": {"image": SONARR}}}))
+    monkeypatch.setattr(astro.ImageLock, "resolve", lambda self, tags: ({SONARR: "sha256:new"}, []))
+    monkeypatch.setattr(astro.ImageLock, "local_digest", lambda self, tag: "sha256:old")
+
+    def recreate(self):
+        raise AssertionError("the update went ahead")
+    monkeypatch.setattr(astro.UpdateCoordinator, "run", recreate)
+
+    def update(strategy, **kwargs):
+        astro.SETTINGS_FILE.write_text(yaml.safe_dump({"update_strategy": strategy}))
+        return astro.SetupWizard(ui=astro.HeadlessUI()).update(**kwargs)
+
+    yield update
+    for path in (astro.SETTINGS_FILE, astro.COMPOSE_FILE, astro.IMAGE_LOCK, astro.ImageLock().previous_path):
+        path.unlink(missing_ok=True)
+
+
+@pytest.mark.parametrize("strategy", ["rolling", "watchtower"])
+def test_dry_run_changes_nothing(astro, installed, capsys, strategy):
+    assert installed(strategy, dry_run=True) == 0
+    report = json.loads(capsys.readouterr().out)
+    old = None if strategy == "rolling" else "sha256:old"
+    assert report == {"changed": {SONARR: {"from": old, "to": "sha256:new"}}, "unresolved": []}
+    assert not astro.IMAGE_LOCK.exists()
+
+
+def test_rollback_dry_run_keeps_the_lock(astro, installed, capsys):
+    lock = astro.ImageLock()
+    lock._write(lock.path, {SONARR: "sha256:new"})
+    lock._write(lock.previous_path, {SONARR: "sha256:old"})
+    assert installed("rolling", dry_run=True, rollback=True) == 0
+    assert json.loads(capsys.readouterr().out)["changed"] == {SONARR: {"from": "sha256:new", "to": "sha256:old"}}
+    assert astro.ImageLock().images == {SONARR: "sha256:new"}
+
+
+def test_rollback_needs_pinned_images(installed, capsys):
+    assert installed("watchtower", rollback=True) == 1
+    assert "watchtower" in json.loads(capsys.readouterr().out)["error"]
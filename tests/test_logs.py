@@ -0,0 +1,13 @@
+"""astro-logs.py argument handling."""
+
+import sys
+
+import pytest
+
+
+def test_invalid_grep_is_a_usage_error(logs, monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["astro-logs.py", "--grep", "("])
+    with pytest.raises(SystemExit) as exit:
+        logs.main()
+    assert exit.value.code == 2
+    assert "invalid regex '('" in capsys.readouterr().err
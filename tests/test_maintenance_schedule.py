@@ -0,0 +1,27 @@
+"""Keeping updates and database maintenance from starving each other."""
+
+import fcntl
+
+import pytest
+
+
+def test_lock_gives_up_while_held(astro, tmp_path, monkeypatch):
+    monkeypatch.setattr(astro, "MAINTENANCE_LOCK_POLL", 0.01)
+    path = tmp_path / ".maintenance.lock"
+    with open(path, "w") as holder:
+        fcntl.flock(holder, fcntl.LOCK_EX)
+        with pytest.raises(TimeoutError):
+            with astro.maintenance_lock(path, wait=0.05):
+                pass
+    with astro.maintenance_lock(path, wait=0):
+        pass
+
+
+def test_update_queues_behind_maintenance(astro):
+    command = ["astro-setup.py"]
+    updates = astro.UpdateCoordinator.units("23:59-05:00", command)
+    maintenance = astro.DatabaseMaintenance.units("23:59-05:00", command)
+
+    assert "OnCalendar=*-*-* 00:00:00\n" in updates[astro.UpdateCoordinator.TIMER]
+    assert "OnCalendar=Sun *-*-* 23:59:00\n" in maintenance[astro.DatabaseMaintenance.TIMER]
+    assert f"After=docker.service {astro.DatabaseMaintenance.SERVICE}\n" in updates[astro.UpdateCoordinator.SERVICE]
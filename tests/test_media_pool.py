@@ -0,0 +1,128 @@
+"""mergerfs pool units, placement policies and pooled library paths."""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+
+def test_pool_implies_library_tier(astro, generate):
+    config = astro.UserConfig.from_dict({"pool_branches": ["/mnt/d1", "/mnt/d2"]})
+    assert config.storage_tiers == {"library": str(astro.POOL_MOUNT)}
+    assert config.validate() == []
+
+    services = generate({"pool_branches": ["/mnt/d1", "/mnt/d2"]})
+    assert f"{astro.POOL_MOUNT}/media/movies:/movies" in services["jellyfin"]["volumes"]
+
+
+def test_explicit_library_tier_is_kept(astro):
+    config = astro.UserConfig.from_dict({"pool_branches": ["/mnt/d1", "/mnt/d2"],
+                                         "storage_tiers": {"library": "/srv/pool"}})
+    assert config.storage_tiers == {"library": "/srv/pool"}
+
+
+@pytest.mark.parametrize("policy, create", [("most-free", "mfs"), ("existing-path", "epmfs"), ("round-robin", "rand")])
+def test_units(astro, tmp_path, policy, create):
+    branches = [str(tmp_path / "d1"), str(tmp_path / "d2")]
+    units = astro.MediaPool(branches, policy).units(["media/movies", "torrents"])
+    mount = units["mnt-astro\\x2dpool.mount"]
+    assert f"What={branches[0]}:{branches[1]}\n" in mount
+    assert f"Where={astro.POOL_MOUNT}\n" in mount
+    assert f"category.create={create}," in mount
+    assert f"RequiresMountsFor={branches[0]} {branches[1]}\n" in mount
+
+    service = units[astro.MediaPool.SERVICE]
+    assert ("ExecStart=/bin/mkdir -p "
+            f"{branches[0]}/media/movies {branches[0]}/torrents {branches[1]}/media/movies {branches[1]}/torrents\n"
+            ) in service
+    assert "RequiredBy=docker.service" in service
+
+
+def test_empty_skeleton_still_starts(astro, tmp_path):
+    service = astro.MediaPool([str(tmp_path / "d1"), str(tmp_path / "d2")]).units([])[astro.MediaPool.SERVICE]
+    assert "ExecStart=/bin/true\n" in service
+
+
+def test_install_seeds_library_skeleton(astro, monkeypatch):
+    installed = {}
+    monkeypatch.setattr(astro.MediaPool, "install", lambda pool, skeleton: installed.update(
+        branches=pool.branches, mountpoint=pool.mountpoint, skeleton=skeleton))
+    wizard = astro.SetupWizard(ui=astro.HeadlessUI())
+    wizard.config = astro.UserConfig(pool_branches=["/mnt/d1", "/mnt/d2"])
+    wizard.install_media_pool()
+
+    assert wizard.config.storage_tiers["library"] == str(astro.POOL_MOUNT)
+    assert installed["mountpoint"] == astro.POOL_MOUNT
+    assert {"media/movies", "media/tv", "torrents/complete", "usenet/incomplete"} <= set(installed["skeleton"])
+
+
+def test_pool_candidates_roomiest_first(astro):
+    def volume(mountpoint, free):
+        return astro.StorageVolume(mountpoint, ["/dev/x"], True, 4 << 40, free)
+    volumes = [volume("/", 9 << 40), volume("/mnt/a", 1 << 40), volume("/mnt/b", 3 << 40), volume("/mnt/ssd", 2 << 40)]
+    candidates = astro.HardwareProbe.pool_candidates(volumes, exclude=["/mnt/ssd"])
+    assert [v.mountpoint for v in candidates] == ["/mnt/b", "/mnt/a"]
+
+
+# Placement against real filesystems on loopback files. Needs root, losetup
+# and mergerfs, so it is skipped on most development machines.
+loopback = pytest.mark.skipif(
+    os.geteuid() != 0 or not all(shutil.which(tool) for tool in ["losetup", "mkfs.ext4", "mergerfs"]),
+    reason="needs root, losetup, mkfs.ext4 and mergerfs",
+)
+
+
+@pytest.fixture
+def loop_pool(astro, tmp_path):
+    """Return a function mounting a pool over two loopback disks of 64 and 128 MB."""
+    mounts = []
+
+    def run(*args):
+        subprocess.run(args, check=True, capture_output=True)
+
+    def build(policy: str):
+        branches = []
+        for name, size in [("small", 64), ("large", 128)]:
+            image, branch = tmp_path / f"{name}.img", tmp_path / name
+            run("truncate", "-s", f"{size}M", str(image))
+            run("mkfs.ext4", "-q", str(image))
+            branch.mkdir()
+            run("mount", "-o", "loop", str(image), str(branch))
+            mounts.append(branch)
+            branches.append(branch)
+        pool = astro.MediaPool([str(b) for b in branches], policy, tmp_path / "pool")
+        pool.mountpoint.mkdir()
+        # The production free-space floor is larger than these disks
+        options = pool.mount_options().replace("minfreespace=20G", "minfreespace=1M")
+        run("mergerfs", "-o", options, ":".join(pool.branches), str(pool.mountpoint))
+        mounts.append(pool.mountpoint)
+        return pool.mountpoint, branches
+
+    yield build
+    for mount in reversed(mounts):
+        subprocess.run(["umount", str(mount)], capture_output=True)
+
+
+@loopback
+def test_most_free_places_on_roomiest_disk(loop_pool):
+    pool, (small, large) = loop_pool("most-free")
+    (pool / "movie.mkv").write_bytes(b"x" * 4096)
+    assert (large / "movie.mkv").exists()
+    assert not (small / "movie.mkv").exists()
+
+
+@loopback
+def test_existing_path_keeps_folders_together(loop_pool):
+    pool, (small, large) = loop_pool("existing-path")
+    (small / "tv" / "Show").mkdir(parents=True)
+    (pool / "tv" / "Show" / "s01e01.mkv").write_bytes(b"x" * 4096)
+    assert (small / "tv" / "Show" / "s01e01.mkv").exists()
+
+
+@loopback
+def test_round_robin_spreads_files(loop_pool):
+    pool, branches = loop_pool("round-robin")
+    for n in range(40):
+        (pool / f"file{n}").write_bytes(b"x")
+    assert all(any(branch.glob("file*")) for branch in branches)
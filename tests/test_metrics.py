@@ -0,0 +1,173 @@
+"""astro-metrics.py against a fake cgroup v2 and /proc tree."""
+
+import os
+
+import pytest
+
+HOST_NET = "net:[4026531840]"
+NET_DEV = """Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo:    5000      50    0    0    0     0          0         0     5000      50    0    0    0     0       0          0
+  eth0:    1200      10    0    0    0     0          0         0      800       8    0    0    0     0       0          0
+  eth1:     300       3    0    0    0     0          0         0      200       2    0    0    0     0       0          0
+"""
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """Return (cgroup root, proc root, add) where add(id, pid, ...) creates a running container."""
+    cgroup_root, proc_root = tmp_path / "cgroup", tmp_path / "proc"
+    (proc_root / "1" / "ns").mkdir(parents=True)
+    os.symlink(HOST_NET, proc_root / "1" / "ns" / "net")
+
+    def add(container_id, pid, memory_max="max", pids="12", host_network=False, layout="system.slice/docker-{id}.scope"):
+        cgroup = cgroup_root / layout.format(id=container_id)
+        cgroup.mkdir(parents=True)
+        files = {
+            "cpu.stat": "usage_usec 2500000\nuser_usec 2000000\nthrottled_usec 500000\n",
+            "memory.stat": "anon 1048576\nfile 4194304\nkernel 8192\n",
+            "memory.current": "5242880\n",
+            "memory.max": f"{memory_max}\n",
+            "memory.events": "low 0\nhigh 0\nmax 3\noom 1\noom_kill 1\n",
+            "io.stat": "8:0 rbytes=4096 wbytes=8192 rios=1 wios=2 dbytes=0 dios=0\n"
+                       "259:0 rbytes=1000 wbytes=24 rios=3 wios=4 dbytes=0 dios=0\n",
+            "cgroup.procs": f"{pid}\n{pid + 1}\n",
+        }
+        if pids is not None:
+            files["pids.current"] = f"{pids}\n"
+        for name, text in files.items():
+            (cgroup / name).write_text(text)
+        (proc_root / str(pid) / "ns").mkdir(parents=True)
+        os.symlink(HOST_NET if host_network else f"net:[{pid}]", proc_root / str(pid) / "ns" / "net")
+        (proc_root / str(pid) / "net").mkdir()
+        (proc_root / str(pid) / "net" / "dev").write_text(NET_DEV)
+        return cgroup
+
+    return cgroup_root, proc_root, add
+
+
+def test_sample(metrics, tree):
+    cgroup_root, proc_root, add = tree
+    add("abc", 100, memory_max="1073741824")
+    reader = metrics.CgroupReader(cgroup_root, proc_root)
+    values = reader.sample(reader.locate("abc"))
+    assert values == {
+        "cpu_usage_seconds": 2.5,
+        "cpu_throttled_seconds": 0.5,
+        "memory_bytes": 5242880,
+        "memory_anon_bytes": 1048576,
+        "memory_file_bytes": 4194304,
+        "memory_limit_bytes": 1073741824,
+        "oom_kills": 1,
+        "io_read_bytes": 5096,
+        "io_write_bytes": 8216,
+        "io_read_ops": 4,
+        "io_write_ops": 6,
+        "pids": 12,
+        # Loopback traffic is not counted
+        "network_receive_bytes": 1500,
+        "network_transmit_bytes": 1000,
+    }
+
+
+def test_unlimited_memory_and_missing_pids(metrics, tree):
+    cgroup_root, proc_root, add = tree
+    add("abc", 100, memory_max="max", pids=None, layout="docker/{id}")
+    reader = metrics.CgroupReader(cgroup_root, proc_root)
+    values = reader.sample(reader.locate("abc"))
+    assert values["memory_limit_bytes"] == 0
+    assert "pids" not in values
+
+
+def test_missing_container(metrics, tree):
+    cgroup_root, proc_root, add = tree
+    cgroup = add("abc", 100)
+    reader = metrics.CgroupReader(cgroup_root, proc_root)
+    assert reader.locate("def") is None
+    (cgroup / "memory.current").unlink()
+    with pytest.raises(OSError):
+        reader.sample(cgroup)
+
+
+def test_host_network_is_skipped(metrics, tree):
+    cgroup_root, proc_root, add = tree
+    add("plex", 100, host_network=True)
+    add("sonarr", 200)
+    add("jellyfin", 300)
+    reader = metrics.CgroupReader(cgroup_root, proc_root)
+    assert "network_receive_bytes" not in reader.sample(reader.locate("plex"))
+
+    # Docker's NetworkMode decides when the namespace link is unreadable
+    discover = lambda: {"sonarr": ("sonarr", True), "jellyfin": ("jellyfin", False)}
+    store = metrics.MetricsStore()
+    metrics.Sampler(reader, discover, store).sample_once()
+    _, containers = store.samples[-1]
+    assert containers["sonarr"]["network_receive_bytes"] == 1500
+    assert "network_receive_bytes" not in containers["jellyfin"]
+
+
+def test_pids_outside_our_namespace(metrics, tree):
+    cgroup_root, proc_root, add = tree
+    cgroup = add("abc", 100)
+    reader = metrics.CgroupReader(cgroup_root, proc_root)
+    # Without the host's PID namespace every other container's process reads as 0
+    (cgroup / "cgroup.procs").write_text("0\n0\n")
+    assert "network_receive_bytes" not in reader.sample(cgroup)
+    (cgroup / "cgroup.procs").write_text("0\n100\n")
+    assert reader.sample(cgroup)["network_receive_bytes"] == 1500
+
+
+def test_exporter_shares_the_host_pid_namespace(generate):
+    assert generate({"metrics": True})["astro-metrics"]["pid"] == "host"
+
+
+def sample(cpu, read, received=None):
+    values = {"cpu_usage_seconds": cpu, "memory_bytes": 100, "memory_limit_bytes": 0, "io_read_bytes": read,
+              "io_write_bytes": 0}
+    if received is not None:
+        values["network_receive_bytes"] = received
+    return values
+
+
+def test_rates(metrics):
+    store = metrics.MetricsStore()
+    assert store.summary() == {}
+    store.add(100.0, {"sonarr": sample(1.0, 1000, 500), "plex": sample(3.0, 0)})
+    store.add(102.0, {"sonarr": sample(2.0, 5000, 300), "plex": sample(4.0, 4000), "radarr": sample(0.0, 0)})
+    assert store.summary() == {
+        "sonarr": {"time": 102.0, "cpu_percent": 50.0, "memory_bytes": 100, "memory_limit_bytes": 0,
+                   "read_bytes_per_s": 2000, "write_bytes_per_s": 0,
+                   # Counters that went backwards (container restarted) read as zero
+                   "rx_bytes_per_s": 0},
+        "plex": {"time": 102.0, "cpu_percent": 50.0, "memory_bytes": 100, "memory_limit_bytes": 0,
+                 "read_bytes_per_s": 2000, "write_bytes_per_s": 0},
+    }
+
+
+def test_ring_eviction(metrics):
+    store = metrics.MetricsStore(size=3)
+    for second in range(5):
+        store.add(float(second), {"sonarr": sample(float(second), 0)})
+    assert len(store.samples) == 3
+    assert [point["time"] for point in store.history("sonarr")] == [3.0, 4.0]
+    assert store.history("radarr") == []
+
+
+def test_prometheus(metrics):
+    store = metrics.MetricsStore()
+    assert store.prometheus() == ""
+    store.add(1.0, {"sonarr": {"cpu_usage_seconds": 2.5, "memory_bytes": 100, "pids": 7},
+                    "plex": {"cpu_usage_seconds": 1.0, "memory_bytes": 200}})
+    assert store.prometheus() == (
+        "# HELP astro_container_cpu_usage_seconds_total CPU time consumed.\n"
+        "# TYPE astro_container_cpu_usage_seconds_total counter\n"
+        'astro_container_cpu_usage_seconds_total{container="plex"} 1.0\n'
+        'astro_container_cpu_usage_seconds_total{container="sonarr"} 2.5\n'
+        "# HELP astro_container_memory_bytes Memory in use, including page cache.\n"
+        "# TYPE astro_container_memory_bytes gauge\n"
+        'astro_container_memory_bytes{container="plex"} 200\n'
+        'astro_container_memory_bytes{container="sonarr"} 100\n'
+        "# HELP astro_container_pids Processes and threads.\n"
+        "# TYPE astro_container_pids gauge\n"
+        'astro_container_pids{container="sonarr"} 7\n'
+    )
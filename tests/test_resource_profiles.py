@@ -0,0 +1,84 @@
+"""Resource profile limits across simulated hardware sizes."""
+
+import pytest
+
+HARDWARE = [(2, 2048), (4, 4096), (8, 16384), (16, 65536)]
+PROFILES = ["streaming-first", "balanced", "download-first"]
+
+ANSWERS = {
+    "media_server": "jellyfin",
+    "request_manager": "overseerr",
+    "enable_usenet": True,
+    "update_strategy": "watchtower",
+}
+
+
+def megabytes(value: str) -> int:
+    assert value.endswith("m")
+    return int(value[:-1])
+
+
+@pytest.mark.parametrize("profile", PROFILES)
+@pytest.mark.parametrize("cpus, memory_mb", HARDWARE)
+def test_limits_follow_profile(astro, generate, profile, cpus, memory_mb):
+    services = generate({**ANSWERS, "resource_profile": profile}, cpus=cpus, memory_mb=memory_mb)
+    table = astro.ComposeGenerator.RESOURCE_PROFILES[profile]
+
+    for name, service in services.items():
+        classes = astro.ComposeGenerator.SERVICE_CLASSES
+        cls = next(c for c, members in classes.items() if name in members)
+        shares, cpu_fraction, mem_limit, mem_reservation = table[cls]
+
+        assert service["cpu_shares"] == shares
+        if cpu_fraction is None:
+            assert "cpus" not in service
+        else:
+            assert service["cpus"] == max(0.5, round(cpus * cpu_fraction, 2))
+            assert service["cpus"] <= cpus
+        assert megabytes(service["mem_limit"]) == max(astro.MIN_MEM_LIMIT_MB, int(memory_mb * mem_limit))
+        if mem_reservation:
+            assert megabytes(service["mem_reservation"]) == int(memory_mb * mem_reservation)
+            assert megabytes(service["mem_reservation"]) <= megabytes(service["mem_limit"])
+        else:
+            assert "mem_reservation" not in service
+
+
+@pytest.mark.parametrize("profile", PROFILES)
+@pytest.mark.parametrize("cpus, memory_mb", HARDWARE)
+def test_downloader_cpuset(generate, profile, cpus, memory_mb):
+    services = generate({**ANSWERS, "resource_profile": profile}, cpus=cpus, memory_mb=memory_mb)
+    for name in ["qbittorrent", "sabnzbd"]:
+        if profile == "streaming-first" and cpus >= 8:
+            # The top quarter of the cores, leaving the rest to transcodes
+            assert services[name]["cpuset"] == f"{cpus - cpus // 4}-{cpus - 1}"
+        else:
+            assert "cpuset" not in services[name]
+    assert all("cpuset" not in services[name] for name in ["jellyfin", "radarr", "overseerr"])
+
+
+@pytest.mark.parametrize("profile", PROFILES)
+def test_class_ordering(astro, profile):
+    table = astro.ComposeGenerator.RESOURCE_PROFILES[profile]
+    shares = {cls: values[0] for cls, values in table.items()}
+    # The media server is never outweighed, and utilities never outweigh anything
+    assert shares["media"] == max(shares.values())
+    assert shares["utility"] == min(shares.values())
+    if profile == "streaming-first":
+        ordered = [shares[cls] for cls in astro.ComposeGenerator.SERVICE_CLASSES]
+        assert ordered == sorted(ordered, reverse=True)
+    if profile == "download-first":
+        assert shares["downloader"] >= shares["arr"]
+
+
+@pytest.mark.parametrize("cpus, memory_mb", HARDWARE)
+def test_media_memory_covers_transcode_tmpfs(generate, cpus, memory_mb):
+    base = generate({**ANSWERS, "resource_profile": "balanced"}, cpus=cpus, memory_mb=memory_mb)
+    tmpfs = generate({**ANSWERS, "resource_profile": "balanced", "transcode_tmpfs_mb": 1024},
+                     cpus=cpus, memory_mb=memory_mb)
+    assert megabytes(tmpfs["jellyfin"]["mem_limit"]) == megabytes(base["jellyfin"]["mem_limit"]) + 1024
+
+
+def test_no_profile_sets_no_limits(generate):
+    services = generate({**ANSWERS, "resource_profile": "none"})
+    for service in services.values():
+        assert not {"cpu_shares", "cpus", "mem_limit", "mem_reservation", "cpuset"} & set(service)
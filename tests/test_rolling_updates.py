@@ -0,0 +1,146 @@
+"""Session polling and media server deferral against a local stub server."""
+
+import http.server
+import json
+import threading
+
+import pytest
+
+
+class StubMediaServer(http.server.BaseHTTPRequestHandler):
+    """Answers session queries from a queue of (status, body) responses."""
+
+    responses: list = []
+    requests: list = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        type(self).requests.append((self.path, self.headers.get("X-Emby-Token") or self.headers.get("X-Plex-Token")))
+        status, body = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def stub():
+    """Return (url, handler class) for a stub server on an ephemeral port."""
+    handler = type("Stub", (StubMediaServer,), {"responses": [], "requests": []})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", handler
+    server.shutdown()
+
+
+def playing(count: int) -> list:
+    """A Jellyfin /Sessions body with `count` active streams and one idle client."""
+    return [{"NowPlayingItem": {"Name": f"Movie {n}"}} for n in range(count)] + [{"DeviceName": "idle"}]
+
+
+def test_jellyfin_counts_playing_sessions(astro, stub):
+    url, handler = stub
+    handler.responses = [(200, playing(2))]
+    monitor = astro.SessionMonitor("jellyfin", url, "secret")
+    assert monitor.active_sessions() == 2
+    assert monitor.error == ""
+    assert handler.requests == [("/Sessions?activeWithinSeconds=960", "secret")]
+
+
+def test_plex_counts_sessions(astro, stub):
+    url, handler = stub
+    handler.responses = [(200, {"MediaContainer": {"size": 1}})]
+    assert astro.SessionMonitor("plex", url, "token").active_sessions() == 1
+
+
+def test_missing_key_fails_without_a_request(astro, stub):
+    url, handler = stub
+    monitor = astro.SessionMonitor("jellyfin", url)
+    assert monitor.active_sessions() is None
+    assert "no media_server_api_key" in monitor.error
+    assert handler.requests == []
+
+
+def test_rejected_key_is_reported(astro, stub):
+    url, handler = stub
+    handler.responses = [(401, {})]
+    monitor = astro.SessionMonitor("emby", url, "stale")
+    assert monitor.active_sessions() is None
+    assert monitor.error == "Emby rejected the API key (HTTP 401)"
+
+
+def test_unreachable_server_is_unknown_but_retryable(astro):
+    monitor = astro.SessionMonitor("jellyfin", "http://127.0.0.1:9", "secret")
+    assert monitor.active_sessions() is None
+    assert monitor.error == ""
+
+
+COMPOSE = {"services": {
+    "jellyfin": {"image": "lscr.io/linuxserver/jellyfin:latest", "ports": ["8096:8096"]},
+    "radarr": {"image": "lscr.io/linuxserver/radarr:latest", "ports": ["7878:7878"]},
+}}
+
+
+@pytest.fixture
+def coordinator(astro, monkeypatch):
+    """Return a factory for coordinators that record updates instead of running docker."""
+    sleeps = []
+    monkeypatch.setattr(astro.time, "sleep", sleeps.append)
+    # Image pruning after updates
+    monkeypatch.setattr(astro.subprocess, "run", lambda *args, **kwargs: None)
+
+    def build(monitor, window_checks: int = 1000):
+        coord = astro.UpdateCoordinator(COMPOSE, monitor=monitor)
+        checks = iter(range(window_checks))
+        coord.in_window = lambda now=None: next(checks, None) is not None
+        coord._update = lambda batch, report: report["updated"].extend(batch)
+        coord.sleeps = sleeps
+        return coord
+    return build
+
+
+def test_idle_media_server_is_updated(astro, stub, coordinator):
+    url, handler = stub
+    handler.responses = [(200, playing(0))]
+    report = coordinator(astro.SessionMonitor("jellyfin", url, "secret")).run()
+    assert report["updated"] == ["jellyfin", "radarr"]
+    assert report["deferred"] == []
+
+
+def test_waits_for_streams_to_end(astro, stub, coordinator):
+    url, handler = stub
+    handler.responses = [(200, playing(1)), (200, playing(1)), (200, playing(0))]
+    coord = coordinator(astro.SessionMonitor("jellyfin", url, "secret"))
+    report = coord.run()
+    assert report["updated"] == ["radarr", "jellyfin"]
+    assert coord.sleeps == [astro.SESSION_POLL_INTERVAL]
+
+
+def test_defers_when_window_closes_mid_stream(astro, stub, coordinator):
+    url, handler = stub
+    handler.responses = [(200, playing(1))]
+    coord = coordinator(astro.SessionMonitor("jellyfin", url, "secret"), window_checks=4)
+    report = coord.run()
+    assert report["updated"] == ["radarr"]
+    assert report["deferred"] == ["jellyfin"]
+    assert report["deferred_reasons"]["jellyfin"] == "streams were playing until the window closed"
+
+
+@pytest.mark.parametrize("token, response, reason", [
+    ("", None, "no media_server_api_key"),
+    ("stale", (401, {}), "rejected the API key"),
+])
+def test_defers_at_once_without_a_usable_key(astro, stub, coordinator, token, response, reason):
+    url, handler = stub
+    handler.responses = [response] if response else []
+    coord = coordinator(astro.SessionMonitor("jellyfin", url, token))
+    report = coord.run()
+    assert report["updated"] == ["radarr"]
+    assert report["deferred"] == ["jellyfin"]
+    assert reason in report["deferred_reasons"]["jellyfin"]
+    # No polling through the window
+    assert coord.sleeps == []
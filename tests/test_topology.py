@@ -0,0 +1,59 @@
+"""Cross-host service names in a split stack."""
+
+import json
+
+SPLIT = {
+    "enable_torrents": True,
+    "enable_usenet": True,
+    "downloader": "sabnzbd",
+    "hosts": {"media": "192.168.1.10", "dl": "192.168.1.20"},
+    "topology": {"downloader": "dl"},
+    "data_share": "nfs://192.168.1.10/opt/astro",
+}
+
+
+def split(astro, answers):
+    config = astro.UserConfig.from_dict(answers)
+    generator = astro.ComposeGenerator(config, astro.HostResources(cpus=8, memory_mb=16384), astro.HardwareProbe())
+    return astro.Topology(config), generator.generate_split()
+
+
+def test_remote_sabnzbd_listens_on_its_published_port(astro):
+    topology, hosts = split(astro, SPLIT)
+    sabnzbd = hosts["dl"]["services"]["sabnzbd"]
+    assert sabnzbd["ports"] == ["8085:8085"]
+    assert sabnzbd["healthcheck"]["test"][-1] == "http://localhost:8085/"
+    assert "sabnzbd:192.168.1.20" in hosts["media"]["services"]["sonarr"]["extra_hosts"]
+    assert topology.check(hosts) == []
+
+
+def test_single_host_keeps_sabnzbd_on_8080(generate):
+    sabnzbd = generate({key: SPLIT[key] for key in ("enable_torrents", "enable_usenet", "downloader")})["sabnzbd"]
+    assert sabnzbd["ports"] == ["8085:8080"]
+    assert sabnzbd["healthcheck"]["test"][-1] == "http://localhost:8080/"
+
+
+def test_check_flags_remapped_ports(astro):
+    topology, hosts = split(astro, {**SPLIT, "dashboard": "heimdall"})
+    hosts["dl"]["services"]["sabnzbd"]["ports"] = ["8085:8080"]
+    # Published for browsers only; nothing calls the dashboard by name
+    assert hosts["media"]["services"]["heimdall"]["ports"] == ["3000:80"]
+    assert topology.check(hosts) == [
+        "dl: sabnzbd publishes port 8080 as 8085; other hosts reaching sabnzbd:8080 would hit port 8080 of dl"]
+
+
+def test_tmpfs_transcode_on_a_share_mounting_host(astro):
+    # The media server moves to dl, which reaches the library over NFS
+    topology, hosts = split(astro, {**SPLIT, "topology": {"downloader": "dl", "media": "dl"},
+                                    "transcode_tmpfs_mb": 2048})
+    assert topology.mounts_share("dl")
+    volumes = hosts["dl"]["services"]["jellyfin"]["volumes"]
+    assert {"type": "tmpfs", "target": "/transcode", "tmpfs": {"size": 2048 * 1024 * 1024}} in volumes
+    assert any(str(volume).startswith("astro-media") for volume in volumes)
+    assert topology.check(hosts) == []
+
+
+def test_check_topology_rejects_a_missing_answers_file(astro, tmp_path, capsys):
+    assert astro.check_topology(tmp_path / "answers.yml") == 2
+    report = json.loads(capsys.readouterr().out)
+    assert report["problems"] == [f"Could not read configuration: {tmp_path / 'answers.yml'} does not exist"]